@@ -1,13 +1,35 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string
+import atexit
+import base64
+import hashlib
+import html as html_lib
+import io
+import json
+import queue
+import signal
 import sqlite3
+import sys
+import threading
 import time
+import zlib
+from collections import Counter, OrderedDict, deque, namedtuple
 from datetime import datetime
+from urllib.parse import urlencode
 import os
 import numpy as np
 import pandas as pd
 import joblib
+from scipy.special import expit
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-DB_PATH = "login.db"
+import compaction
+import metrics
+import migrations
+import online_learning
+import partitions
+import profiler
+
+DB_PATH = os.environ.get("AI_GUARD_DB_PATH", "login.db")
 MODEL_PATH = "model.joblib"
 
 # simple demo admin "password" – use env var in real deployment
@@ -15,158 +37,1017 @@ ADMIN_KEY = os.environ.get("AI_GUARD_ADMIN_KEY", "changeme")
 
 app = Flask(__name__)
 
+# number of reverse proxies (e.g. serve.py's router) whose X-Forwarded-For
+# is trusted for the client address; 0 = use the socket peer
+TRUSTED_PROXIES = int(os.environ.get("AI_GUARD_TRUSTED_PROXIES", "0"))
+if TRUSTED_PROXIES > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
 # -------- DB helpers --------
 
+# Applied to every connection when it is opened. WAL + synchronous=NORMAL
+# means commits no longer fsync; cache_size < 0 is in KiB.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("AI_GUARD_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("AI_GUARD_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": int(os.environ.get("AI_GUARD_SQLITE_CACHE_SIZE", "-16384")),
+    "mmap_size": int(os.environ.get("AI_GUARD_SQLITE_MMAP_SIZE", str(64 * 1024 * 1024))),
+    "busy_timeout": int(os.environ.get("AI_GUARD_SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY",
+}
+# size of the per-connection prepared statement cache
+SQLITE_CACHED_STATEMENTS = int(os.environ.get("AI_GUARD_SQLITE_CACHED_STATEMENTS", "256"))
+
+
+class _ConnectionLease:
+    """Returns the connection to its manager when the owning thread exits."""
+
+    def __init__(self, manager, conn):
+        self.manager = manager
+        self.conn = conn
+
+    def __del__(self):
+        self.manager.release(self.conn)
+
+
+class ConnectionManager:
+    """
+    Hands every thread one long-lived, pre-configured SQLite connection.
+
+    The dev server starts a thread per request, so connections are leased
+    from a shared idle pool and given back when the thread exits instead of
+    being closed; their prepared statement caches survive across requests.
+    """
+
+    def __init__(self, path, pragmas=None, cached_statements=SQLITE_CACHED_STATEMENTS, max_idle=32):
+        self.path = path
+        self.pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
+        self.cached_statements = cached_statements
+        self.max_idle = max_idle
+        self.opened = 0
+        self.leased = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get(self):
+        lease = getattr(self._local, "lease", None)
+        if lease is not None:
+            return lease.conn
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self.leased += 1
+        if conn is None:
+            conn = self._open()
+        self._local.lease = _ConnectionLease(self, conn)
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        """Close the idle connections and the calling thread's own."""
+        # dropping the lease hands its connection back to the idle pool
+        self._local.lease = None
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,  # leased to one thread at a time
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        with self._lock:
+            self.opened += 1
+        return conn
+
+
+_db = None
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """
+    Return the calling thread's connection to DB_PATH. Callers must not
+    close it.
+    """
+    global _db
+    db = _db
+    if db is None or db.path != DB_PATH:
+        if db is not None:
+            db.close_all()
+        db = _db = ConnectionManager(DB_PATH)
+    return db.get()
+
+def close_db_connections():
+    """Close the calling thread's and the idle connections to DB_PATH."""
+    global _db
+    db, _db = _db, None
+    if db is not None:
+        db.close_all()
+
+_partitions = None
+
+def get_partitions():
+    """
+    The PartitionSet of DB_PATH, or None when login attempts are not
+    partitioned (AI_GUARD_PARTITION=none, see partitions.py).
+    """
+    global _partitions
+    if partitions.PARTITION_MODE == "none":
+        return None
+    parts = _partitions
+    if parts is None or parts.db_path != DB_PATH or parts.mode != partitions.PARTITION_MODE:
+        parts = _partitions = partitions.PartitionSet(DB_PATH, pragmas=SQLITE_PRAGMAS)
+    return parts
+
+def attempt_tables(conn, since=None, newest_first=False):
+    """
+    The login_attempts tables to read for attempts at or after `since`: just
+    the main one, or the main one plus the overlapping partitions. Read each
+    table completely before moving on to the next.
+    """
+    parts = get_partitions()
+    if parts is None:
+        return ["login_attempts"]
+    return parts.tables(conn, since=since, newest_first=newest_first)
 
 def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
+    """Create or upgrade the schema (see migrations.py)."""
+    migrations.migrate(get_db_connection())
 
-    # login attempts table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS login_attempts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp INTEGER,
-            ip TEXT,
-            username TEXT,
-            success INTEGER,
-            user_agent TEXT,
-            app TEXT
-        )
-    """)
-
-    # decisions per IP (global per IP, not per app)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS ip_decisions (
-            ip TEXT PRIMARY KEY,
-            decision TEXT,
-            last_update INTEGER
-        )
-    """)
 
-    conn.commit()
-    conn.close()
+BLOCKED_PAGE_SIZE = 100
+BLOCKED_MAX_PAGE_SIZE = 1000
+BLOCKED_SORTS = ("last_update", "ip")
 
 
-def get_blocked_ips():
+def encode_blocked_cursor(row, sort):
+    """Opaque keyset cursor pointing just after `row`."""
+    key = [row["last_update"], row["ip"]] if sort == "last_update" else [row["ip"]]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_blocked_cursor(cursor, sort):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(key, list) or len(key) != (2 if sort == "last_update" else 1):
+        raise ValueError("invalid cursor")
+    return key
+
+def get_blocked_ips(app_name=None, sort="last_update", order="desc", limit=BLOCKED_PAGE_SIZE, cursor=None):
     """
-    Return a list of {ip, app, last_update, last_seen} for all IPs
-    that are currently in 'block' state, per app/website.
+    Return ([{ip, app, last_update, last_seen}, ...], next_cursor) for one
+    page of IPs currently in 'block' state, one row per app/website the IP
+    accessed. `limit` counts IPs, `cursor` is the next_cursor of the
+    previous page (None when there are no more pages).
+
+    A single query: the page of blocked IPs is picked by keyset on the
+    ip_decisions indexes, then joined with their attempts per app.
     """
+    if sort not in BLOCKED_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(BLOCKED_SORTS)}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+    limit = max(1, min(int(limit), BLOCKED_MAX_PAGE_SIZE))
+
+    op = "<" if order == "desc" else ">"
+    direction = order.upper()
+    if sort == "last_update":
+        key_cols = "(last_update, ip)"
+        order_by = f"last_update {direction}, ip {direction}"
+        outer_order_by = f"p.last_update {direction}, p.ip {direction}"
+    else:
+        key_cols = "ip"
+        order_by = f"ip {direction}"
+        outer_order_by = f"p.ip {direction}"
+
+    key = decode_blocked_cursor(cursor, sort) if cursor else None
+    if get_partitions() is not None:
+        return _get_blocked_ips_partitioned(app_name, sort, key_cols, op, order_by, limit, key)
+
+    where = ["decision = 'block'"]
+    params = []
+    if key:
+        where.append(f"{key_cols} {op} ({', '.join('?' * len(key))})")
+        params.extend(key)
+    if app_name:
+        where.append("EXISTS (SELECT 1 FROM login_attempts a WHERE a.ip = d.ip AND a.app = ?)")
+        params.append(app_name)
+    params.append(limit)
+
+    join_app = ""
+    if app_name:
+        join_app = "AND a.app = ?"
+        params.append(app_name)
+
     conn = get_db_connection()
     c = conn.cursor()
-
-    # all IPs that are currently blocked
-    c.execute("""
-        SELECT ip, decision, last_update
-        FROM ip_decisions
-        WHERE decision = 'block'
-        ORDER BY last_update DESC
-    """)
-    blocked_rows = c.fetchall()
+    c.execute(f"""
+        WITH page AS (
+            SELECT ip, last_update
+            FROM ip_decisions d
+            WHERE {' AND '.join(where)}
+            ORDER BY {order_by}
+            LIMIT ?
+        )
+        SELECT p.ip, p.last_update, COALESCE(a.app, 'default') AS app, MAX(a.timestamp) AS last_seen
+        FROM page p
+        LEFT JOIN login_attempts a ON a.ip = p.ip {join_app}
+        GROUP BY p.ip, COALESCE(a.app, 'default')
+        ORDER BY {outer_order_by}, app
+    """, params)
 
     results = []
+    ips_seen = 0
+    for row in c.fetchall():
+        if not results or results[-1]["ip"] != row["ip"]:
+            ips_seen += 1
+        results.append({
+            "ip": row["ip"],
+            "app": row["app"],
+            "last_update": row["last_update"],
+            "last_seen": row["last_seen"],
+        })
 
-    for row in blocked_rows:
-        ip = row["ip"]
-        last_update = row["last_update"]
-
-        # find all apps this IP has interacted with
-        c_apps = conn.cursor()
-        c_apps.execute("SELECT DISTINCT app FROM login_attempts WHERE ip = ?", (ip,))
-        apps_rows = c_apps.fetchall()
-        apps = [ar["app"] if ar["app"] is not None else "default" for ar in apps_rows] or ["default"]
-
-        # for each app, compute last_seen (last login attempt for that app)
-        for app_name in apps:
-            c_last = conn.cursor()
-            c_last.execute(
-                "SELECT MAX(timestamp) AS last_ts FROM login_attempts WHERE ip = ? AND app = ?",
-                (ip, app_name),
-            )
-            last_row = c_last.fetchone()
-            last_seen = last_row["last_ts"] if last_row and last_row["last_ts"] else None
+    next_cursor = encode_blocked_cursor(results[-1], sort) if ips_seen == limit else None
+    return results, next_cursor
 
+def _get_blocked_ips_partitioned(app_name, sort, key_cols, op, order_by, limit, key):
+    """
+    get_blocked_ips() when login attempts are spread over partition files:
+    pages of blocked IPs come from ip_decisions by keyset as before, their
+    last attempt per app is merged from every partition, and with an app
+    filter pages are read until `limit` IPs that used the app are found.
+    """
+    conn = get_db_connection()
+    page = []
+    last_seen = {}
+    while len(page) < limit:
+        where = ["decision = 'block'"]
+        params = []
+        if key:
+            where.append(f"{key_cols} {op} ({', '.join('?' * len(key))})")
+            params.extend(key)
+        candidates = conn.execute(f"""
+            SELECT ip, last_update FROM ip_decisions
+            WHERE {' AND '.join(where)}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, params + [limit]).fetchall()
+        if not candidates:
+            break
+
+        seen = last_seen_per_app([r["ip"] for r in candidates], app_name)
+        for r in candidates:
+            if app_name and r["ip"] not in seen:
+                continue
+            page.append(r)
+            last_seen[r["ip"]] = seen.get(r["ip"], {})
+            if len(page) == limit:
+                break
+
+        last = candidates[-1]
+        key = [last["last_update"], last["ip"]] if sort == "last_update" else [last["ip"]]
+        if len(candidates) < limit:
+            break
+
+    results = []
+    for r in page:
+        # an IP without attempts still gets a row, like the LEFT JOIN
+        apps = last_seen[r["ip"]] or {"default": None}
+        for app_key in sorted(apps):
             results.append({
-                "ip": ip,
-                "app": app_name,
-                "last_update": last_update,
-                "last_seen": last_seen,
+                "ip": r["ip"],
+                "app": app_key,
+                "last_update": r["last_update"],
+                "last_seen": apps[app_key],
             })
 
-    conn.close()
-    return results
+    next_cursor = encode_blocked_cursor(results[-1], sort) if len(page) == limit else None
+    return results, next_cursor
+
+def last_seen_per_app(ips, app_name=None):
+    """{ip: {app: last attempt timestamp}} for `ips`, across all partitions."""
+    conn = get_db_connection()
+    placeholders = ", ".join("?" * len(ips))
+    app_filter = "AND app = ?" if app_name else ""
+    params = list(ips) + ([app_name] if app_name else [])
+
+    seen = {}
+    for table in attempt_tables(conn):
+        rows = conn.execute(f"""
+            SELECT ip, COALESCE(app, 'default') AS app, MAX(timestamp) AS last_seen
+            FROM {table}
+            WHERE ip IN ({placeholders}) {app_filter}
+            GROUP BY ip, app
+        """, params).fetchall()
+        for r in rows:
+            apps = seen.setdefault(r["ip"], {})
+            apps[r["app"]] = max(apps.get(r["app"]) or 0, r["last_seen"])
+    return seen
 
 # -------- ML model --------
 
+def read_model_file(path):
+    """(model, short sha256) from a single read of `path`, so both describe the same bytes."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return joblib.load(io.BytesIO(data)), hashlib.sha256(data).hexdigest()[:12]
+
 def load_model():
+    """(model, checksum) of MODEL_PATH, or (None, None)."""
     if os.path.exists(MODEL_PATH):
         print(f"[+] Loading model from {MODEL_PATH}")
-        return joblib.load(MODEL_PATH)
+        return read_model_file(MODEL_PATH)
     else:
         print("[!] model.joblib not found, running in 'allow-all' mode")
+        return None, None
+
+FEATURE_NAMES = ["total_attempts", "failed_attempts", "success_rate", "unique_usernames", "min_delta"]
+
+
+class LinearScorer:
+    """
+    A StandardScaler + binary LogisticRegression (or log-loss SGDClassifier,
+    see online_learning.py) pipeline folded into one weight vector, so scoring is a dot product instead of a DataFrame
+    round trip through sklearn's input validation:
+
+        p(attack) = expit(x . w + b)
+    """
+
+    def __init__(self, weights, bias):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+
+    @classmethod
+    def from_pipeline(cls, model):
+        """Return a LinearScorer for `model`, or None if it is not a supported pipeline."""
+        steps = getattr(model, "steps", None)
+        if not steps or len(steps) != 2:
+            return None
+        scaler, clf = steps[0][1], steps[1][1]
+        if type(scaler).__name__ != "StandardScaler":
+            return None
+        if type(clf).__name__ == "SGDClassifier":
+            if clf.loss != "log_loss":
+                return None
+        elif type(clf).__name__ != "LogisticRegression":
+            return None
+        if clf.coef_.shape != (1, len(FEATURE_NAMES)) or list(clf.classes_) != [0, 1]:
+            return None
+
+        coef = clf.coef_[0].astype(np.float64)
+        intercept = float(clf.intercept_[0])
+        mean = scaler.mean_ if scaler.with_mean else np.zeros_like(coef)
+        scale = scaler.scale_ if scaler.with_std else np.ones_like(coef)
+
+        weights = coef / scale
+        bias = intercept - float(np.dot(mean, weights))
+        return cls(weights, bias)
+
+    def predict_proba_one(self, x):
+        return float(expit(np.dot(x, self.weights) + self.bias))
+
+    def predict_proba(self, X):
+        return expit(np.asarray(X, dtype=np.float64) @ self.weights + self.bias)
+
+
+class GenericScorer:
+    """Fallback for estimators LinearScorer can't compile: goes through predict_proba."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict_proba_one(self, x):
+        X = pd.DataFrame([x], columns=FEATURE_NAMES)
+        return float(self.model.predict_proba(X)[0][1])
+
+    def predict_proba(self, X):
+        X = pd.DataFrame(X, columns=FEATURE_NAMES)
+        return self.model.predict_proba(X)[:, 1]
+
+
+# feature rows used to check a compiled scorer against the original model
+PARITY_PROBE = np.array([
+    [0, 0, 1.0, 1, 600],
+    [1, 1, 0.0, 1, 600],
+    [5, 1, 0.8, 2, 12],
+    [40, 39, 0.025, 6, 0],
+    [200, 200, 0.0, 50, 1],
+], dtype=np.float64)
+
+def compile_model(model):
+    """
+    Build the fastest scorer that reproduces model.predict_proba(...)[:, 1].
+    """
+    if model is None:
         return None
 
-model = load_model()
+    scorer = LinearScorer.from_pipeline(model)
+    if scorer is not None:
+        expected = GenericScorer(model).predict_proba(PARITY_PROBE)
+        if np.allclose(scorer.predict_proba(PARITY_PROBE), expected, rtol=1e-9, atol=1e-12):
+            print("[+] Model compiled to a NumPy linear scorer")
+            return scorer
+        print("[!] Compiled scorer disagrees with the model, using the generic path")
+    else:
+        print(f"[!] {type(model).__name__} can't be compiled, using the generic path")
+    return GenericScorer(model)
 
-FEATURE_NAMES = ["total_attempts", "failed_attempts", "success_rate", "unique_usernames", "min_delta"]
+# A model and everything derived from it. Never mutated: activate_model()
+# replaces the whole tuple, so a request that reads `active_model` once
+# scores with one consistent version, whatever is installed meanwhile.
+ModelVersion = namedtuple("ModelVersion", ["model", "scorer", "version", "source", "checksum", "installed_at"])
+
+_model_lock = threading.Lock()
+_model_serial = 0
+
+def build_model_version(model, source, checksum=None):
+    """Compile `model` into a ModelVersion labelled "<source>-<n>[-<checksum>]", without activating it."""
+    global _model_serial
+    scorer = compile_model(model)
+    with _model_lock:
+        _model_serial += 1
+        label = f"{source}-{_model_serial}" + (f"-{checksum}" if checksum else "")
+    return ModelVersion(model, scorer, label, source, checksum, None)
+
+def activate_model(version):
+    """Make `version` the active model; the one it replaces becomes `previous_model`."""
+    global active_model, previous_model
+    version = version._replace(installed_at=time.time())
+    with _model_lock:
+        previous_model = active_model
+        active_model = version
+    return version
+
+def install_model(model, source, checksum=None):
+    """Compile `model` and make it the active version. Returns the new ModelVersion."""
+    return activate_model(build_model_version(model, source, checksum))
+
+active_model = None
+previous_model = None
+_initial_model, _initial_checksum = load_model()
+install_model(_initial_model, "file", _initial_checksum)
+
+# -------- In-memory sliding-window feature store --------
+
+FEATURE_WINDOW_MINUTES = 10
+
+# When serve.py runs several worker processes, each owns the IPs that hash
+# to its shard: the router sends all of an IP's events to the same worker,
+# so its sliding window lives in exactly one feature store.
+SHARD = int(os.environ.get("AI_GUARD_SHARD", "0"))
+SHARDS = int(os.environ.get("AI_GUARD_SHARDS", "1"))
+
+
+def shard_for(ip, n_shards=None):
+    """Shard of an IP (crc32); serve.py, replay.py and attack_simulator.py all route with this."""
+    return zlib.crc32(ip.encode()) % (SHARDS if n_shards is None else n_shards)
+
+def owns_ip(ip):
+    return SHARDS <= 1 or shard_for(ip) == SHARD
+
+
+class IPWindow:
+    """
+    Recent attempts of a single IP plus running counters, so the features
+    can be read without rescanning the window.
+
+    `deltas` is a monotonic deque of (seq, inter-arrival delta) whose front is
+    always the minimum delta between two events still inside the window.
+    """
+    __slots__ = ("events", "failed", "usernames", "deltas", "next_seq")
+
+    def __init__(self):
+        self.events = deque()  # (seq, ts, username, success, app)
+        self.failed = 0
+        self.usernames = Counter()
+        self.deltas = deque()
+        self.next_seq = 0
+
+    def push(self, ts, username, success, app_name):
+        if self.events and ts < self.events[-1][1]:
+            # out-of-order timestamp (explicit ts) -> re-insert in time order
+            events = [(e[1], e[2], e[3], e[4]) for e in self.events]
+            events.append((ts, username, success, app_name))
+            events.sort(key=lambda e: e[0])
+            self.reset(events)
+            return
+
+        seq = self.next_seq
+        self.next_seq += 1
+        if self.events:
+            delta = ts - self.events[-1][1]
+            while self.deltas and self.deltas[-1][1] >= delta:
+                self.deltas.pop()
+            self.deltas.append((seq, delta))
+
+        self.events.append((seq, ts, username, success, app_name))
+        self.usernames[username] += 1
+        if not success:
+            self.failed += 1
+
+    def reset(self, events):
+        """Replace the window content with `events` [(ts, username, success, app)], sorted by ts."""
+        self.events.clear()
+        self.deltas.clear()
+        self.usernames.clear()
+        self.failed = 0
+        for ts, username, success, app_name in events:
+            self.push(ts, username, success, app_name)
+
+    def expire(self, window_start):
+        events = self.events
+        while events and events[0][1] < window_start:
+            _, _, username, success, _ = events.popleft()
+            remaining = self.usernames[username] - 1
+            if remaining:
+                self.usernames[username] = remaining
+            else:
+                del self.usernames[username]
+            if not success:
+                self.failed -= 1
+
+        # deltas are attached to the later event of each pair; a delta whose
+        # event is now the oldest one refers to an expired predecessor
+        if events:
+            first_seq = events[0][0]
+            while self.deltas and self.deltas[0][0] <= first_seq:
+                self.deltas.popleft()
+        else:
+            self.deltas.clear()
+
+    def features(self, window_seconds):
+        total_attempts = len(self.events)
+        failed_attempts = self.failed
+        success_rate = (total_attempts - failed_attempts) / total_attempts
+        unique_usernames = len(self.usernames)
+        min_delta = self.deltas[0][1] if self.deltas else window_seconds
+        return np.array([total_attempts, failed_attempts, success_rate, unique_usernames, min_delta])
+
+
+class FeatureStore:
+    """
+    Per-IP sliding windows over the last `window_minutes` minutes of login
+    attempts. Kept up to date by log_attempt(), so computing the features of
+    an IP is O(1) amortized instead of a SQL scan of its history.
+
+    SQLite stays the durable log: call rebuild_from_db() on startup.
+    """
+
+    SWEEP_INTERVAL = 60  # seconds between purges of idle IPs
+
+    def __init__(self, window_minutes=FEATURE_WINDOW_MINUTES):
+        self.window_minutes = window_minutes
+        self.window_seconds = window_minutes * 60
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0
+
+    def __len__(self):
+        return len(self._windows)
+
+    def record(self, ip, ts, username, success, app_name=None):
+        with self._lock:
+            window = self._windows.get(ip)
+            if window is None:
+                window = self._windows[ip] = IPWindow()
+            window.push(ts, username, bool(success), app_name)
+            window.expire(ts - self.window_seconds)
+            if ts - self._last_sweep >= self.SWEEP_INTERVAL:
+                self._sweep(ts - self.window_seconds)
+                self._last_sweep = ts
+
+    def features(self, ip, now=None):
+        if now is None:
+            now = int(time.time())
+        with self._lock:
+            window = self._windows.get(ip)
+            if window is not None:
+                window.expire(now - self.window_seconds)
+                if window.events:
+                    return window.features(self.window_seconds)
+                del self._windows[ip]
+
+        # No history -> represent innocuous behaviour
+        return np.array([0, 0, 1.0, 1, self.window_seconds])
+
+    def forget(self, ip, app_name=None):
+        """Drop the history of an IP (or only its attempts on `app_name`)."""
+        with self._lock:
+            window = self._windows.get(ip)
+            if window is None:
+                return
+            if app_name:
+                kept = [(e[1], e[2], e[3], e[4]) for e in window.events if e[4] != app_name]
+                window.reset(kept)
+            else:
+                window.events.clear()
+            if not window.events:
+                del self._windows[ip]
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+    def rebuild_from_db(self, conn, now=None, owns=None):
+        """
+        Reload the windows from the login_attempts table, only for the IPs
+        `owns(ip)` accepts if given. Returns the number of attempts loaded.
+        """
+        if now is None:
+            now = int(time.time())
+        window_start = now - self.window_seconds
+
+        per_ip = {}
+        count = 0
+        tables = 0
+        for table in attempt_tables(conn, since=window_start):
+            c = conn.execute(
+                f"SELECT timestamp, ip, username, success, app FROM {table} "
+                "WHERE timestamp >= ? ORDER BY timestamp ASC, id ASC",
+                (window_start,),
+            )
+            for r in c:
+                if owns is not None and not owns(r["ip"]):
+                    continue
+                per_ip.setdefault(r["ip"], []).append(
+                    (r["timestamp"], r["username"], bool(r["success"]), r["app"])
+                )
+                count += 1
+            tables += 1
+        if tables > 1:
+            # partitions and pre-partitioning rows may overlap in time
+            for events in per_ip.values():
+                events.sort(key=lambda e: e[0])
+
+        with self._lock:
+            self._windows.clear()
+            for ip, events in per_ip.items():
+                window = IPWindow()
+                window.reset(events)
+                self._windows[ip] = window
+            self._last_sweep = now
+        return count
+
+    def _sweep(self, window_start):
+        idle = []
+        for ip, window in self._windows.items():
+            window.expire(window_start)
+            if not window.events:
+                idle.append(ip)
+        for ip in idle:
+            del self._windows[ip]
+
+
+feature_store = FeatureStore()
+
+def warm_feature_store():
+    conn = get_db_connection()
+    if SHARDS > 1:
+        loaded = feature_store.rebuild_from_db(conn, owns=owns_ip)
+        print(f"[+] Feature store rebuilt from DB for shard {SHARD}/{SHARDS}: "
+              f"{loaded} attempts, {len(feature_store)} IPs")
+    else:
+        loaded = feature_store.rebuild_from_db(conn)
+        print(f"[+] Feature store rebuilt from DB: {loaded} attempts, {len(feature_store)} IPs")
 
 def log_attempt(ip, username, success, user_agent, app_name=None, ts=None):
     if ts is None:
         ts = int(time.time())
+    persist_attempts([(ts, ip, username, success, user_agent, app_name)])
+    feature_store.record(ip, ts, username, success, app_name)
+
+def log_attempts_batch(attempts):
+    """
+    Log many attempts in a single transaction (one per partition when
+    login attempts are partitioned).
+    `attempts` is a list of (ts, ip, username, success, user_agent, app_name).
+    Only writes the DB; callers feed the feature store themselves.
+    """
+    rows = [(ts, ip, username, int(success), user_agent, app_name)
+            for ts, ip, username, success, user_agent, app_name in attempts]
     conn = get_db_connection()
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO login_attempts (timestamp, ip, username, success, user_agent, app) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
-        (ts, ip, username, int(success), user_agent, app_name),
-    )
-    conn.commit()
-    conn.close()
-
-def set_ip_decision(ip, decision):
+
+    parts = get_partitions()
+    if parts is None:
+        insert_attempts(conn, "login_attempts", rows)
+        return
+
+    by_bucket = {}
+    for row in rows:
+        by_bucket.setdefault(parts.bucket(row[0]), []).append(row)
+    for start, bucket_rows in sorted(by_bucket.items()):
+        # attached outside the transaction, one partition at a time
+        insert_attempts(conn, parts.writable_table(conn, start), bucket_rows)
+
+def insert_attempts(conn, table, rows):
+    with conn:
+        conn.executemany(
+            f"INSERT INTO {table} (timestamp, ip, username, success, user_agent, app) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+def persist_attempts(attempts):
+    """
+    Durably log attempts: through the write-behind queue when it is running,
+    otherwise synchronously.
+    """
+    if attempt_writer is not None:
+        attempt_writer.submit(attempts)
+    else:
+        log_attempts_batch(attempts)
+
+# -------- Write-behind log writer --------
+
+WRITE_BEHIND = os.environ.get("AI_GUARD_WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get("AI_GUARD_WRITE_BEHIND_QUEUE_SIZE", "10000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("AI_GUARD_WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_MS = int(os.environ.get("AI_GUARD_WRITE_BEHIND_FLUSH_MS", "50"))
+# what submit() does when the queue is full: "block" | "drop" | "sync"
+WRITE_BEHIND_OVERFLOW = os.environ.get("AI_GUARD_WRITE_BEHIND_OVERFLOW", "block")
+
+
+class AttemptWriter:
+    """
+    Background writer that group-commits login attempts.
+
+    Requests push rows onto a bounded queue and return immediately; one
+    thread drains it and writes up to `batch_size` rows per transaction, at
+    least every `flush_interval_ms`. When the queue is full, `overflow`
+    decides: "block" waits for room, "drop" discards the row (counted),
+    "sync" writes it inline.
+    """
+
+    def __init__(self, queue_size=WRITE_BEHIND_QUEUE_SIZE, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval_ms=WRITE_BEHIND_FLUSH_MS, overflow=WRITE_BEHIND_OVERFLOW):
+        if overflow not in ("block", "drop", "sync"):
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.overflow = overflow
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.sync_writes = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="attempt-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, attempts):
+        for row in attempts:
+            try:
+                self._queue.put_nowait(row)
+                continue
+            except queue.Full:
+                pass
+
+            if self.overflow == "block":
+                self._queue.put(row)
+            elif self.overflow == "drop":
+                self.dropped += 1
+            else:
+                log_attempts_batch([row])
+                self.sync_writes += 1
+
+    def flush(self):
+        """Block until everything submitted so far is committed."""
+        self._queue.join()
+
+    def stop(self):
+        """Flush pending rows and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        q = self._queue
+        while not (self._stopping.is_set() and q.empty()):
+            try:
+                batch = [q.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                log_attempts_batch(batch)
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"[WRITER ERROR] lost {len(batch)} attempts: {e}")
+            finally:
+                for _ in batch:
+                    q.task_done()
+
+
+attempt_writer = None
+
+def start_attempt_writer():
+    """Switch log_attempt() to write-behind mode; pending rows are flushed at exit."""
+    global attempt_writer
+    if attempt_writer is not None:
+        return attempt_writer
+    writer = AttemptWriter()
+    writer.start()
+    attempt_writer = writer
+    atexit.register(stop_attempt_writer)
+    print(f"[+] Write-behind logging enabled (batch={writer.batch_size}, "
+          f"flush={WRITE_BEHIND_FLUSH_MS}ms, overflow={writer.overflow})")
+    return writer
+
+def stop_attempt_writer():
+    global attempt_writer
+    writer, attempt_writer = attempt_writer, None
+    if writer is not None:
+        writer.stop()
+        print(f"[+] Write-behind logging stopped ({writer.written} attempts written)")
+
+# -------- Decision cache --------
+
+DECISION_CACHE_SIZE = int(os.environ.get("AI_GUARD_DECISION_CACHE_SIZE", "10000"))
+DECISION_CACHE_TTL = float(os.environ.get("AI_GUARD_DECISION_CACHE_TTL", "30"))
+
+
+class DecisionCache:
+    """
+    Bounded LRU cache of ip -> (decision, score) with a TTL, in front of the
+    ip_decisions table. The TTL bounds staleness when another process
+    changes the table behind our back.
+    """
+
+    def __init__(self, maxsize=DECISION_CACHE_SIZE, ttl=DECISION_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, ip):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(ip)
+            if entry is not None:
+                state, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(ip)
+                    self.hits += 1
+                    return state
+                del self._data[ip]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, ip, state):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[ip] = (state, expires_at)
+            self._data.move_to_end(ip)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, ip):
+        with self._lock:
+            self._data.pop(ip, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+decision_cache = DecisionCache()
+
+def set_ip_decision(ip, decision, score=None):
+    """Record the decision (and the score it came from) for an IP."""
     conn = get_db_connection()
-    c = conn.cursor()
-    now_ts = int(time.time())
-    c.execute(
-        "INSERT INTO ip_decisions (ip, decision, last_update) VALUES (?, ?, ?) "
-        "ON CONFLICT(ip) DO UPDATE SET decision=excluded.decision, last_update=excluded.last_update",
-        (ip, decision, now_ts),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        c = conn.cursor()
+        now_ts = int(time.time())
+        c.execute(
+            "INSERT INTO ip_decisions (ip, decision, last_update, score) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(ip) DO UPDATE SET decision=excluded.decision, last_update=excluded.last_update, "
+            "score=excluded.score",
+            (ip, decision, now_ts, score),
+        )
+    decision_cache.put(ip, (decision, score))
+
+def set_ip_decisions_batch(decisions):
+    """Upsert a {ip: (decision, score)} mapping in a single transaction."""
+    conn = get_db_connection()
+    with conn:
+        c = conn.cursor()
+        now_ts = int(time.time())
+        c.executemany(
+            "INSERT INTO ip_decisions (ip, decision, last_update, score) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(ip) DO UPDATE SET decision=excluded.decision, last_update=excluded.last_update, "
+            "score=excluded.score",
+            [(ip, decision, now_ts, score) for ip, (decision, score) in decisions.items()],
+        )
+    for ip, state in decisions.items():
+        decision_cache.put(ip, state)
+
+def get_ip_state(ip):
+    """
+    Current (decision, score) of an IP: what the last scoring recorded, or
+    ("allow", None) when it has never been scored.
+    """
+    state = decision_cache.get(ip)
+    if state is not None:
+        return state
 
-def get_ip_decision(ip):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT decision FROM ip_decisions WHERE ip = ?", (ip,))
+    c.execute("SELECT decision, score FROM ip_decisions WHERE ip = ?", (ip,))
     row = c.fetchone()
-    conn.close()
-    if row:
-        return row["decision"]
-    return "allow"
+    state = (row["decision"], row["score"]) if row else ("allow", None)
+    decision_cache.put(ip, state)
+    return state
 
-def compute_features_for_ip(ip, window_minutes=10):
+def get_ip_decision(ip):
+    return get_ip_state(ip)[0]
+
+def compute_features_for_ip(ip, window_minutes=FEATURE_WINDOW_MINUTES):
     """
     Aggregate login attempts for this IP in the last `window_minutes` minutes
     and compute the same features used during training.
+
+    Served from the in-memory feature store; other window sizes fall back
+    to scanning the DB.
+    """
+    if window_minutes == feature_store.window_minutes:
+        return feature_store.features(ip)
+    return compute_features_for_ip_sql(ip, window_minutes)
+
+def compute_features_for_ip_sql(ip, window_minutes=FEATURE_WINDOW_MINUTES):
+    """
+    Reference implementation of compute_features_for_ip() reading the
+    login_attempts table directly.
     """
     conn = get_db_connection()
     c = conn.cursor()
     now = int(time.time())
     window_start = now - window_minutes * 60
 
-    c.execute(
-        "SELECT timestamp, username, success FROM login_attempts "
-        "WHERE ip = ? AND timestamp >= ? ORDER BY timestamp ASC",
-        (ip, window_start),
-    )
-    rows = c.fetchall()
-    conn.close()
+    rows = []
+    for table in attempt_tables(conn, since=window_start):
+        c.execute(
+            f"SELECT timestamp, username, success FROM {table} "
+            "WHERE ip = ? AND timestamp >= ? ORDER BY timestamp ASC",
+            (ip, window_start),
+        )
+        rows.extend(c.fetchall())
+    rows.sort(key=lambda r: r["timestamp"])
 
     if not rows:
         # No history -> represent innocuous behaviour
@@ -189,28 +1070,318 @@ def compute_features_for_ip(ip, window_minutes=10):
 
     return np.array([total_attempts, failed_attempts, success_rate, unique_usernames, min_delta])
 
+def last_features_for_ip(ip):
+    """
+    Features of `ip` right after its most recent logged attempt, i.e. what
+    it was last scored on, or None if it has no attempts left. Used to turn
+    admin decisions into training labels (see online_learning.py).
+    """
+    conn = get_db_connection()
+    last = None
+    for table in attempt_tables(conn):
+        ts = conn.execute(f"SELECT MAX(timestamp) FROM {table} WHERE ip = ?", (ip,)).fetchone()[0]
+        if ts is not None and (last is None or ts > last):
+            last = ts
+    if last is None:
+        return None
+
+    window_start = last - feature_store.window_seconds
+    events = []
+    for table in attempt_tables(conn, since=window_start):
+        c = conn.execute(
+            f"SELECT timestamp, username, success, app FROM {table} "
+            "WHERE ip = ? AND timestamp >= ? ORDER BY timestamp ASC, id ASC",
+            (ip, window_start),
+        )
+        events.extend((r["timestamp"], r["username"], bool(r["success"]), r["app"]) for r in c)
+    events.sort(key=lambda e: e[0])
+
+    window = IPWindow()
+    window.reset(events)
+    return window.features(feature_store.window_seconds)
+
+def classify_score(prob_attack):
+    # thresholds – tune for your demo
+    if prob_attack > 0.9:
+        return "block"
+    elif prob_attack > 0.6:
+        return "challenge"
+    return "allow"
+
 def predict_decision(ip):
     """
     Use the trained model (if available) to decide allow/challenge/block
     + return score (probability it's an attacker).
     """
-    if model is None:
+    if active_model.scorer is None:
         # no model – allow all
         return "allow", 0.0
 
-    X_raw = compute_features_for_ip(ip)
-    X = pd.DataFrame([X_raw], columns=FEATURE_NAMES)
-    prob_attack = model.predict_proba(X)[0][1]
+    return score_features(compute_features_for_ip(ip))
 
-    # thresholds – tune for your demo
-    if prob_attack > 0.9:
-        decision = "block"
-    elif prob_attack > 0.6:
-        decision = "challenge"
-    else:
-        decision = "allow"
+def score_features(X_raw, current=None):
+    """(decision, score) for one feature row, with `current` or the active model version."""
+    scorer = (current or active_model).scorer
+    if scorer is None:
+        return "allow", 0.0
+    prob_attack = scorer.predict_proba_one(X_raw)
+    return classify_score(prob_attack), prob_attack
+
+def predict_decisions_batch(X_raw, current=None):
+    """
+    Score a matrix of feature rows (one row per event) with a single
+    predict_proba call. Returns a list of (decision, score).
+    """
+    scorer = (current or active_model).scorer
+    if scorer is None or len(X_raw) == 0:
+        return [("allow", 0.0)] * len(X_raw)
+
+    probs = scorer.predict_proba(X_raw)
+    return [(classify_score(p), float(p)) for p in probs]
+
+# -------- Live event feed --------
+
+SSE_BUFFER_SIZE = int(os.environ.get("AI_GUARD_SSE_BUFFER_SIZE", "256"))
+SSE_HEARTBEAT_SECONDS = 15
+
+
+class Subscriber:
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, buffer_size):
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+
+class EventBroadcaster:
+    """
+    In-process fan-out of dashboard events to SSE subscribers.
+
+    Every subscriber has its own bounded buffer. publish() never blocks: a
+    subscriber whose buffer is full is dropped (its stream then asks the
+    browser to resync) instead of slowing down the decision path.
+    """
+
+    def __init__(self, buffer_size=SSE_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.published = 0
+        self.dropped = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        sub = Subscriber(self.buffer_size)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, event, data):
+        if not self._subscribers:
+            return
+        message = (event, json.dumps(data))
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait(message)
+            except queue.Full:
+                sub.dropped = True
+                self.unsubscribe(sub)
+                self.dropped += 1
+        self.published += 1
+
+
+broadcaster = EventBroadcaster()
+
+def format_ts(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+def publish_attempt(ts, ip, username, success, app_name, decision, score):
+    if not len(broadcaster):
+        return
+    broadcaster.publish("attempt", {
+        "time_str": format_ts(ts),
+        "ip": ip,
+        "username": username,
+        "success": bool(success),
+        "app": app_name,
+        "decision": decision,
+        "score": score,
+    })
+
+# -------- Metrics --------
+
+METRICS = os.environ.get("AI_GUARD_METRICS", "1") == "1"
+
+registry = metrics.Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "ai_guard_stage_seconds",
+    "Time spent in each stage of /api/log_and_decide.",
+    ("stage",),
+)
+REQUEST_SECONDS = registry.histogram(
+    "ai_guard_request_seconds",
+    "Handler time of the guard API endpoints, excluding HTTP parsing.",
+    ("endpoint",),
+)
+DECISIONS = registry.counter(
+    "ai_guard_decisions",
+    "Decisions returned for logged attempts.",
+    ("decision", "app"),
+)
+# the app label comes from clients: at most this many distinct values
+METRICS_MAX_APPS = int(os.environ.get("AI_GUARD_METRICS_MAX_APPS", "100"))
+app_label = metrics.LabelValues(METRICS_MAX_APPS)
+MODEL_RELOADS = registry.counter(
+    "ai_guard_model_reloads",
+    "Model file reloads and rollbacks by outcome.",
+    ("result",),
+)
+
+# label tuples built once, not per request
+STAGE_DB_INSERT = ("db_insert",)
+STAGE_FEATURES = ("features",)
+STAGE_INFERENCE = ("inference",)
+STAGE_UPSERT = ("decision_upsert",)
+
+
+def _pool_stat(name):
+    return lambda: getattr(_db, name) if _db is not None else None
+
+def _writer_stat(name):
+    return lambda: getattr(attempt_writer, name) if attempt_writer is not None else None
+
+def _compaction_stat(name):
+    return lambda: compaction_job.stats()[name] if compaction_job is not None else None
+
+registry.callback("ai_guard_db_connections_opened", "SQLite connections opened by the pool.",
+                  _pool_stat("opened"), type="counter")
+registry.callback("ai_guard_db_connection_leases", "Connections leased to request threads.",
+                  _pool_stat("leased"), type="counter")
+registry.callback("ai_guard_db_connections_idle", "Connections waiting in the pool.",
+                  lambda: len(_db._idle) if _db is not None else None)
+for _name in ("hits", "misses", "evictions", "expirations"):
+    registry.callback(f"ai_guard_decision_cache_{_name}", f"Decision cache {_name}.",
+                      lambda _name=_name: getattr(decision_cache, _name), type="counter")
+registry.callback("ai_guard_decision_cache_size", "IPs in the decision cache.",
+                  lambda: len(decision_cache))
+registry.callback("ai_guard_feature_store_ips", "IPs with attempts in the feature window.",
+                  lambda: len(feature_store))
+registry.callback("ai_guard_write_behind_queue", "Attempts waiting in the write-behind queue.",
+                  lambda: attempt_writer.qsize() if attempt_writer is not None else None)
+registry.callback("ai_guard_write_behind_written", "Attempts committed by the write-behind writer.",
+                  _writer_stat("written"), type="counter")
+registry.callback("ai_guard_write_behind_dropped", "Attempts dropped on a full write-behind queue.",
+                  _writer_stat("dropped"), type="counter")
+registry.callback("ai_guard_write_behind_failed", "Attempts lost to write errors.",
+                  _writer_stat("failed"), type="counter")
+registry.callback("ai_guard_sse_subscribers", "Connected dashboard streams.", lambda: len(broadcaster))
+registry.callback("ai_guard_sse_dropped", "Events dropped for slow dashboard streams.",
+                  lambda: broadcaster.dropped, type="counter")
+registry.callback("ai_guard_compacted_attempts", "Raw attempts folded into roll-ups.",
+                  _compaction_stat("compacted"), type="counter")
+registry.callback("ai_guard_model_info", "The active model version (always 1).",
+                  lambda: {(active_model.version, active_model.source): 1}, labelnames=("version", "source"))
+registry.callback("ai_guard_model_installed_timestamp_seconds", "When the active model version was installed.",
+                  lambda: active_model.installed_at)
+registry.callback("ai_guard_online_feedback", "Admin labels received by the online learner.",
+                  lambda: online_learner.received if online_learner is not None else None, type="counter")
+registry.callback("ai_guard_online_updates", "Model versions published by the online learner.",
+                  lambda: online_learner.updates if online_learner is not None else None, type="counter")
+
+
+def record_stage_metrics(t0, t1, t2, t3, t4, decision, app_name):
+    """Instrumentation of one /api/log_and_decide call (timed by benchmark_suite.py)."""
+    STAGE_SECONDS.observe_many((
+        (STAGE_DB_INSERT, t1 - t0),
+        (STAGE_FEATURES, t2 - t1),
+        (STAGE_INFERENCE, t3 - t2),
+        (STAGE_UPSERT, t4 - t3),
+    ))
+    REQUEST_SECONDS.observe(time.perf_counter() - t0, ("log_and_decide",))
+    DECISIONS.inc((decision, app_label(app_name)))
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint (text format 0.0.4)."""
+    return Response(registry.render(), content_type=metrics.CONTENT_TYPE)
+
+# -------- Profiling --------
+
+request_profiler = profiler.Profiler()
+
+@app.before_request
+def profile_begin():
+    if request_profiler.active:
+        request_profiler.begin_request()
+
+@app.after_request
+def profile_end(response):
+    if not (request_profiler.active or request_profiler.traced):
+        return response
+    traced = request_profiler.end_request()
+    if traced is not None:
+        spans, total = traced
+        response.headers["Server-Timing"] = profiler.server_timing(spans, total)
+        parts = " ".join(f"{name}={seconds * 1000:.3f}ms" for name, seconds in spans)
+        print(f"[TRACE] {request.method} {request.path} {response.status_code} "
+              f"total={total * 1000:.3f}ms {parts}".rstrip())
+    return response
+
+@app.teardown_request
+def profile_cleanup(exc):
+    # after_request is skipped when a view raises: close the span here, or
+    # the thread would stay traced for its next, untraced requests
+    if request_profiler.traced:
+        request_profiler.end_request()
+
+@app.route("/admin/profile", methods=["GET", "POST"])
+def admin_profile():
+    """
+    GET: profiler status. POST ?seconds=30&interval_ms=5: sample the request
+    threads and trace every request for that long (max 300 s).
+    """
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        return jsonify({"error": "forbidden"}), 403
 
-    return decision, float(prob_attack)
+    if request.method == "POST":
+        try:
+            seconds = float(request.values.get("seconds", "30"))
+            interval_ms = float(request.values.get("interval_ms", "5"))
+        except ValueError:
+            return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+        request_profiler.start(seconds, interval_ms / 1000.0)
+        print(f"[ADMIN] Profiling for {min(seconds, profiler.MAX_DURATION_SECONDS):g}s "
+              f"every {interval_ms:g}ms")
+    return jsonify(request_profiler.status())
+
+@app.route("/admin/profile/stop", methods=["POST"])
+def admin_profile_stop():
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        return jsonify({"error": "forbidden"}), 403
+    request_profiler.stop()
+    return jsonify(request_profiler.status())
+
+@app.route("/admin/profile/collapsed")
+def admin_profile_collapsed():
+    """The last profile as collapsed stacks, for flamegraph.pl or speedscope."""
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        return "Forbidden (invalid key)", 403
+    resp = Response(request_profiler.collapsed(), mimetype="text/plain")
+    resp.headers["Content-Disposition"] = "attachment; filename=ai_guard.collapsed"
+    return resp
 
 # -------- API for websites --------
 
@@ -236,15 +1407,127 @@ def api_log_and_decide():
     app_name = data.get("app", "default")
 
     # 1) log the attempt
-    log_attempt(ip, username, success, user_agent, app_name=app_name)
+    t0 = time.perf_counter()
+    ts = int(time.time())
+    log_attempt(ip, username, success, user_agent, app_name=app_name, ts=ts)
+    t1 = time.perf_counter()
 
     # 2) get AI-based decision
-    decision, score = predict_decision(ip)
-    set_ip_decision(ip, decision)
+    X_raw = compute_features_for_ip(ip)
+    t2 = time.perf_counter()
+    current = active_model
+    decision, score = score_features(X_raw, current)
+    t3 = time.perf_counter()
+    set_ip_decision(ip, decision, score)
+    t4 = time.perf_counter()
+
+    publish_attempt(ts, ip, username, success, app_name, decision, score)
+
+    if METRICS:
+        record_stage_metrics(t0, t1, t2, t3, t4, decision, app_name)
+    if request_profiler.active:
+        request_profiler.add_span("db_insert", t1 - t0)
+        request_profiler.add_span("features", t2 - t1)
+        request_profiler.add_span("inference", t3 - t2)
+        request_profiler.add_span("decision_upsert", t4 - t3)
+
+    return jsonify({
+        "decision": decision,
+        "score": score,
+        "model_version": current.version
+    })
+
+@app.route("/api/decide", methods=["GET", "POST"])
+def api_decide():
+    """
+    Read-only pre-check for websites: the current decision of an IP and the
+    score it was based on, without logging an attempt or running the model.
+      GET /api/decide?ip=1.2.3.4    or    POST {"ip": "1.2.3.4"}
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    ip = request.args.get("ip") or data.get("ip") or request.remote_addr or "unknown"
 
+    t0 = time.perf_counter()
+    decision, score = get_ip_state(ip)
+    if METRICS:
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, ("decide",))
     return jsonify({
         "decision": decision,
-        "score": score
+        "score": score or 0.0
+    })
+
+MAX_BATCH_SIZE = int(os.environ.get("AI_GUARD_MAX_BATCH_SIZE", "1000"))
+
+@app.route("/api/log_and_decide_batch", methods=["POST"])
+def api_log_and_decide_batch():
+    """
+    Batch version of /api/log_and_decide for proxies that aggregate events.
+    JSON body:
+      {
+        "attempts": [
+          {"ip": "1.2.3.4", "username": "alice", "success": false, "user_agent": "...", "app": "my-site-1"},
+          ...
+        ]
+      }
+    Returns {"results": [{"decision": ..., "score": ...}, ...]} in the same
+    order as `attempts`. Each decision is computed as if the events had been
+    sent one by one.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    items = data.get("attempts") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not all(isinstance(it, dict) for it in items):
+        return jsonify({"error": "expected a list of attempts"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"batch too large (max {MAX_BATCH_SIZE})"}), 400
+
+    t0 = time.perf_counter()
+    now = int(time.time())
+    default_ip = request.remote_addr or "unknown"
+    default_ua = request.headers.get("User-Agent", "unknown")
+    attempts = [
+        (
+            now,
+            it.get("ip") or default_ip,
+            it.get("username", ""),
+            bool(it.get("success", False)),
+            it.get("user_agent", default_ua),
+            it.get("app", "default"),
+        )
+        for it in items
+    ]
+
+    # 1) log all attempts in one transaction
+    persist_attempts(attempts)
+
+    # 2) one feature row per event, as seen right after that event
+    X_raw = []
+    for ts, ip, username, success, _, app_name in attempts:
+        feature_store.record(ip, ts, username, success, app_name)
+        X_raw.append(feature_store.features(ip, now=ts))
+
+    # 3) one inference call for the whole batch
+    current = active_model
+    results = predict_decisions_batch(X_raw, current)
+
+    # 4) last decision per IP wins, like sequential calls would
+    final_decisions = {}
+    for (_, ip, _, _, _, _), result in zip(attempts, results):
+        final_decisions[ip] = result
+    if final_decisions:
+        set_ip_decisions_batch(final_decisions)
+
+    if len(broadcaster):
+        for (ts, ip, username, success, _, app_name), (decision, score) in zip(attempts, results):
+            publish_attempt(ts, ip, username, success, app_name, decision, score)
+
+    if METRICS:
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, ("log_and_decide_batch",))
+        for (_, _, _, _, _, app_name), (decision, _) in zip(attempts, results):
+            DECISIONS.inc((decision, app_label(app_name)))
+
+    return jsonify({
+        "results": [{"decision": d, "score": sc} for d, sc in results],
+        "model_version": current.version
     })
 
 # -------- Admin Dashboard --------
@@ -314,62 +1597,118 @@ ADMIN_TEMPLATE = """
     }
   });
 
+  const MAX_ROWS = 50;
+  const scoresByIp = new Map();
+  const tbody = document.querySelector('#attemptsTable tbody');
+  let lastEtag = null;
+
+  function redrawChart() {
+    const labels = Array.from(scoresByIp.keys()).sort();
+    scoreChart.data.labels = labels;
+    scoreChart.data.datasets[0].data = labels.map(ip => scoresByIp.get(ip));
+    scoreChart.update();
+  }
+
+  function renderRow(row) {
+    const tr = document.createElement('tr');
+    tr.dataset.ip = row.ip;
+
+    const tdTime = document.createElement('td');
+    tdTime.textContent = row.time_str;
+    tr.appendChild(tdTime);
+
+    const tdIp = document.createElement('td');
+    tdIp.textContent = row.ip;
+    tr.appendChild(tdIp);
+
+    const tdUser = document.createElement('td');
+    tdUser.textContent = row.username;
+    tr.appendChild(tdUser);
+
+    const tdSuccess = document.createElement('td');
+    tdSuccess.textContent = row.success ? '✔' : '✖';
+    tr.appendChild(tdSuccess);
+
+    const tdApp = document.createElement('td');
+    tdApp.textContent = row.app;
+    tr.appendChild(tdApp);
+
+    const tdDecision = document.createElement('td');
+    const span = document.createElement('span');
+    span.classList.add('badge', row.decision);
+    span.textContent = row.decision;
+    tdDecision.appendChild(span);
+    tr.appendChild(tdDecision);
+
+    return tr;
+  }
+
+  function setDecision(ip, decision) {
+    tbody.querySelectorAll('tr').forEach(tr => {
+      if (tr.dataset.ip !== ip) return;
+      const span = tr.querySelector('.badge');
+      span.className = 'badge ' + decision;
+      span.textContent = decision;
+    });
+  }
+
+  // Full snapshot: first load and after a resync
   async function fetchAdminData() {
-    const res = await fetch('/api/admin/scores?key=' + encodeURIComponent(adminKey));
+    const headers = lastEtag ? { 'If-None-Match': lastEtag } : {};
+    const res = await fetch('/api/admin/scores?key=' + encodeURIComponent(adminKey), { headers, cache: 'no-store' });
+    if (res.status === 304) {
+      // nothing changed since the last poll
+      return;
+    }
     if (!res.ok) {
       console.error("Failed to fetch admin data");
       return;
     }
+    lastEtag = res.headers.get('ETag');
     const data = await res.json();
 
     // Update chart
-    const labels = data.ip_scores.map(item => item.ip);
-    const scores = data.ip_scores.map(item => item.score);
-
-    scoreChart.data.labels = labels;
-    scoreChart.data.datasets[0].data = scores;
-    scoreChart.update();
+    scoresByIp.clear();
+    data.ip_scores.forEach(item => scoresByIp.set(item.ip, item.score));
+    redrawChart();
 
     // Update table
-    const tbody = document.querySelector('#attemptsTable tbody');
     tbody.innerHTML = '';
-    data.recent_attempts.forEach(row => {
-      const tr = document.createElement('tr');
-
-      const tdTime = document.createElement('td');
-      tdTime.textContent = row.time_str;
-      tr.appendChild(tdTime);
-
-      const tdIp = document.createElement('td');
-      tdIp.textContent = row.ip;
-      tr.appendChild(tdIp);
-
-      const tdUser = document.createElement('td');
-      tdUser.textContent = row.username;
-      tr.appendChild(tdUser);
-
-      const tdSuccess = document.createElement('td');
-      tdSuccess.textContent = row.success ? '✔' : '✖';
-      tr.appendChild(tdSuccess);
-
-      const tdApp = document.createElement('td');
-      tdApp.textContent = row.app;
-      tr.appendChild(tdApp);
+    data.recent_attempts.forEach(row => tbody.appendChild(renderRow(row)));
+  }
 
-      const tdDecision = document.createElement('td');
-      const span = document.createElement('span');
-      span.classList.add('badge', row.decision);
-      span.textContent = row.decision;
-      tdDecision.appendChild(span);
-      tr.appendChild(tdDecision);
+  // Incremental updates pushed by the server
+  function onAttempt(row) {
+    tbody.insertBefore(renderRow(row), tbody.firstChild);
+    while (tbody.rows.length > MAX_ROWS) {
+      tbody.deleteRow(-1);
+    }
+    setDecision(row.ip, row.decision);
+    scoresByIp.set(row.ip, row.score);
+    redrawChart();
+  }
 
-      tbody.appendChild(tr);
-    });
+  function onDecision(item) {
+    setDecision(item.ip, item.decision);
+    if (scoresByIp.has(item.ip)) {
+      scoresByIp.set(item.ip, item.score);
+      redrawChart();
+    }
   }
 
-  // Fetch every 5 seconds
   fetchAdminData();
-  setInterval(fetchAdminData, 5000);
+
+  if (window.EventSource) {
+    const source = new EventSource('/api/admin/stream?key=' + encodeURIComponent(adminKey));
+    source.addEventListener('attempt', e => onAttempt(JSON.parse(e.data)));
+    source.addEventListener('decision', e => onDecision(JSON.parse(e.data)));
+    // fell behind or reconnected: events may have been missed
+    source.addEventListener('resync', () => fetchAdminData());
+    source.addEventListener('open', () => fetchAdminData());
+  } else {
+    // Fetch every 5 seconds
+    setInterval(fetchAdminData, 5000);
+  }
 </script>
 
 </body>
@@ -385,6 +1724,11 @@ def admin():
 
 @app.route("/api/admin/scores")
 def api_admin_scores():
+    """
+    Recent attempts and the latest score/decision per IP, as recorded by
+    /api/log_and_decide. Reads a snapshot in one query, never re-scores, and
+    answers unchanged polls with 304 via ETag/If-None-Match.
+    """
     key = request.args.get("key", "")
     if key != ADMIN_KEY:
         return jsonify({"error": "forbidden"}), 403
@@ -392,49 +1736,122 @@ def api_admin_scores():
     conn = get_db_connection()
     c = conn.cursor()
 
-    # 1) get recent attempts
-    c.execute("""
-        SELECT id, timestamp, ip, username, success, app
-        FROM login_attempts
-        ORDER BY timestamp DESC
-        LIMIT 50
-    """)
-    rows = c.fetchall()
-
-    # 2) build list of IPs seen recently
-    ips = sorted({r["ip"] for r in rows})
-
-    ip_scores = []
-    for ip in ips:
-        decision, score = predict_decision(ip)
-        ip_scores.append({
-            "ip": ip,
-            "decision": decision,
-            "score": score
-        })
+    if get_partitions() is None:
+        # recent attempts + current decision/score of their IP
+        c.execute("""
+            SELECT a.id, a.timestamp, a.ip, a.username, a.success, a.app, d.decision, d.score
+            FROM (
+                SELECT id, timestamp, ip, username, success, app
+                FROM login_attempts
+                ORDER BY timestamp DESC
+                LIMIT 50
+            ) a
+            LEFT JOIN ip_decisions d ON d.ip = a.ip
+            ORDER BY a.timestamp DESC, a.id DESC
+        """)
+        rows = c.fetchall()
+    else:
+        rows = recent_attempts_partitioned(conn, 50)
 
-    # 3) attach decision for each row (current decision)
+    scores = {}
     recent_attempts = []
     for r in rows:
         ip = r["ip"]
-        dec = get_ip_decision(ip)
-        ts = r["timestamp"]
-        time_str = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+        decision = r["decision"] or "allow"
+        scores[ip] = {
+            "ip": ip,
+            "decision": decision,
+            "score": r["score"] or 0.0,
+        }
         recent_attempts.append({
-            "time_str": time_str,
+            "time_str": format_ts(r["timestamp"]),
             "ip": ip,
             "username": r["username"],
             "success": bool(r["success"]),
             "app": r["app"],
-            "decision": dec
+            "decision": decision
         })
 
-    conn.close()
-
-    return jsonify({
-        "ip_scores": ip_scores,
+    resp = jsonify({
+        "ip_scores": [scores[ip] for ip in sorted(scores)],
         "recent_attempts": recent_attempts
     })
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+def recent_attempts_partitioned(conn, limit):
+    """
+    The newest `limit` attempts across partitions, joined with their IP's
+    decision and score. Partitions are read newest first and only until
+    older ones can no longer contribute.
+    """
+    parts = get_partitions()
+    newest_first = lambda r: (r["timestamp"], r["id"])
+    sql = ("SELECT id, timestamp, ip, username, success, app FROM {table} "
+           "ORDER BY timestamp DESC LIMIT ?")
+
+    # rows written before partitioning was enabled
+    attempts = [dict(r) for r in conn.execute(sql.format(table=partitions.MAIN_TABLE), (limit,))]
+    for start in reversed(parts.existing()):
+        attempts.sort(key=newest_first, reverse=True)
+        del attempts[limit:]
+        if len(attempts) == limit and attempts[-1]["timestamp"] >= start + parts.seconds:
+            break
+        schema = parts.attach(conn, start)
+        if schema is not None:
+            table = f"{schema}.login_attempts"
+            attempts.extend(dict(r) for r in conn.execute(sql.format(table=table), (limit,)))
+    attempts.sort(key=newest_first, reverse=True)
+    del attempts[limit:]
+
+    ips = sorted({r["ip"] for r in attempts})
+    decisions = {}
+    if ips:
+        decisions = {
+            r["ip"]: r for r in conn.execute(
+                f"SELECT ip, decision, score FROM ip_decisions WHERE ip IN ({', '.join('?' * len(ips))})",
+                ips,
+            )
+        }
+    for r in attempts:
+        d = decisions.get(r["ip"])
+        r["decision"] = d["decision"] if d else None
+        r["score"] = d["score"] if d else None
+    return attempts
+
+@app.route("/api/admin/stream")
+def api_admin_stream():
+    """
+    Server-Sent Events feed for the dashboard:
+      event: attempt   – a new login attempt with its decision and score
+      event: decision  – a decision changed outside of an attempt (unblock)
+      event: resync    – this subscriber fell behind; reload /api/admin/scores
+    """
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        return jsonify({"error": "forbidden"}), 403
+
+    sub = broadcaster.subscribe()
+
+    def stream():
+        try:
+            yield "retry: 2000\n\n"
+            while not sub.dropped:
+                try:
+                    event, payload = sub.queue.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {payload}\n\n"
+            yield "event: resync\ndata: {}\n\n"
+        finally:
+            broadcaster.unsubscribe(sub)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 # -------- Blocked IPs admin view + unblock --------
 
@@ -444,13 +1861,32 @@ def admin_blocked():
     if key != ADMIN_KEY:
         return "Forbidden (invalid key)", 403
 
-    blocked = get_blocked_ips()
+    try:
+        args = blocked_query_args()
+        blocked, next_cursor = get_blocked_ips(**args)
+    except ValueError as e:
+        return f"Bad request: {html_lib.escape(str(e))}", 400
 
     def fmt_ts(ts):
         if not ts:
             return "–"
         return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
 
+    def options(values, selected):
+        return "".join(
+            f'<option value="{v}"{" selected" if v == selected else ""}>{v}</option>' for v in values
+        )
+
+    filters_form = f"""
+      <form method="get" action="/admin/blocked" class="filters">
+        <input type="hidden" name="key" value="{ADMIN_KEY}">
+        App: <input type="text" name="app" value="{html_lib.escape(args["app_name"] or "")}">
+        Sort: <select name="sort">{options(BLOCKED_SORTS, args["sort"])}</select>
+        <select name="order">{options(("desc", "asc"), args["order"])}</select>
+        <button type="submit">Apply</button>
+      </form>
+    """
+
     html = """
     <!doctype html>
     <html>
@@ -506,6 +1942,14 @@ def admin_blocked():
         a:hover {
           text-decoration: underline;
         }
+        .filters { margin-top: 12px; font-size: 0.85rem; }
+        .filters input[type=text], .filters select {
+          background: #020617;
+          color: #e5e7eb;
+          border: 1px solid #1f2937;
+          padding: 3px 6px;
+        }
+        .filters button { background: #0ea5e9; }
       </style>
     </head>
     <body>
@@ -517,6 +1961,7 @@ def admin_blocked():
       <p class="meta">
         <a href="/admin?key=""" + ADMIN_KEY + """">← Back to main admin dashboard</a>
       </p>
+    """ + filters_form + """
       <table>
         <tr>
           <th>App / Website</th>
@@ -532,6 +1977,13 @@ def admin_blocked():
         app_name = row["app"]
         last_update = fmt_ts(row["last_update"])
         last_seen = fmt_ts(row["last_seen"])
+        confirm_form = ""
+        if online_learner is not None:
+            confirm_form = f"""
+            <form method="post" action="/admin/confirm_block?key={ADMIN_KEY}">
+              <input type="hidden" name="ip" value="{ip}">
+              <button type="submit">Confirm block</button>
+            </form>"""
 
         html += f"""
         <tr>
@@ -544,18 +1996,68 @@ def admin_blocked():
               <input type="hidden" name="ip" value="{ip}">
               <input type="hidden" name="app" value="{app_name}">
               <button type="submit">Unblock</button>
-            </form>
+            </form>{confirm_form}
           </td>
         </tr>
         """
 
     html += """
       </table>
+    """
+    if next_cursor:
+        next_url = "/admin/blocked?" + urlencode({
+            "key": ADMIN_KEY,
+            "app": args["app_name"] or "",
+            "sort": args["sort"],
+            "order": args["order"],
+            "limit": args["limit"],
+            "cursor": next_cursor,
+        })
+        html += f"""
+      <p class="meta"><a href="{html_lib.escape(next_url)}">Next page →</a></p>
+    """
+    html += """
     </body>
     </html>
     """
     return html
 
+def blocked_query_args():
+    """Listing options shared by the HTML and JSON blocked-IP views."""
+    try:
+        limit = int(request.args.get("limit", BLOCKED_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return {
+        "app_name": request.args.get("app") or None,
+        "sort": request.args.get("sort", "last_update"),
+        "order": request.args.get("order", "desc"),
+        "limit": limit,
+        "cursor": request.args.get("cursor") or None,
+    }
+
+@app.route("/api/admin/blocked")
+def api_admin_blocked():
+    """
+    JSON version of /admin/blocked.
+    Query args: key, app (filter), sort (last_update | ip), order (asc | desc),
+    limit (IPs per page), cursor (next_cursor from the previous page).
+    """
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        return jsonify({"error": "forbidden"}), 403
+
+    try:
+        blocked, next_cursor = get_blocked_ips(**blocked_query_args())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "blocked": blocked,
+        "next_cursor": next_cursor,
+    })
+
+
 @app.route("/admin/unblock", methods=["POST"])
 def admin_unblock():
     key = request.args.get("key", "")
@@ -568,29 +2070,327 @@ def admin_unblock():
     if not ip:
         return "Missing ip", 400
 
-    conn = get_db_connection()
-    c = conn.cursor()
+    # pending write-behind rows must land before the history is deleted
+    if attempt_writer is not None:
+        attempt_writer.flush()
 
-    # unblock globally for this IP
-    c.execute("DELETE FROM ip_decisions WHERE ip = ?", (ip,))
+    # the admin says this IP's behaviour is benign
+    record_feedback(ip, 0)
+
+    conn = get_db_connection()
+    with conn:
+        # unblock globally for this IP
+        conn.execute("DELETE FROM ip_decisions WHERE ip = ?", (ip,))
 
     # OPTIONAL: also clear login history for this IP+app,
     # so behaviour restarts clean for that website
-    if app_name:
-        c.execute("DELETE FROM login_attempts WHERE ip = ? AND app = ?", (ip, app_name))
-    else:
-        c.execute("DELETE FROM login_attempts WHERE ip = ?", (ip,))
+    for table in attempt_tables(conn):
+        with conn:
+            if app_name:
+                conn.execute(f"DELETE FROM {table} WHERE ip = ? AND app = ?", (ip, app_name))
+            else:
+                conn.execute(f"DELETE FROM {table} WHERE ip = ?", (ip,))
 
-    conn.commit()
-    conn.close()
+    feature_store.forget(ip, app_name)
+    decision_cache.invalidate(ip)
+    broadcaster.publish("decision", {"ip": ip, "decision": "allow", "score": 0.0})
 
     print(f"[ADMIN] Unblocked IP {ip} (app={app_name})")
 
     # redirect back to blocked list
     return f"<script>window.location.href='/admin/blocked?key={ADMIN_KEY}';</script>"
 
+
+@app.route("/admin/confirm_block", methods=["POST"])
+def admin_confirm_block():
+    """Confirm that an IP is an attacker: keep it blocked and use it as a training label."""
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        return "Forbidden (invalid key)", 403
+
+    ip = request.form.get("ip")
+    if not ip:
+        return "Missing ip", 400
+
+    if attempt_writer is not None:
+        attempt_writer.flush()
+    queued = record_feedback(ip, 1)
+
+    _, score = get_ip_state(ip)
+    set_ip_decision(ip, "block", score)
+    broadcaster.publish("decision", {"ip": ip, "decision": "block", "score": score or 0.0})
+
+    print(f"[ADMIN] Confirmed block of IP {ip} (feedback {'queued' if queued else 'not used'})")
+    return f"<script>window.location.href='/admin/blocked?key={ADMIN_KEY}';</script>"
+
+# -------- Retention / compaction --------
+
+COMPACTION = os.environ.get("AI_GUARD_COMPACTION", "0") == "1"
+
+compaction_job = None
+
+def start_compaction():
+    """
+    Fold raw attempts older than AI_GUARD_RAW_RETENTION_SECONDS into per-minute
+    roll-ups in a background thread; expired partitions are rolled up whole
+    and unlinked. The raw retention may not be shorter
+    than the feature window, or restarts would rebuild windows from nothing.
+    """
+    global compaction_job
+    if compaction_job is not None:
+        return compaction_job
+    job = compaction.CompactionJob(get_db_connection, partitions=get_partitions(),
+                                   min_raw_retention=FEATURE_WINDOW_MINUTES * 60)
+    job.start()
+    compaction_job = job
+    print(f"[+] Compaction enabled (raw retention={job.raw_retention}s, "
+          f"roll-up retention={job.rollup_retention}s)")
+    return job
+
+# -------- Online learning --------
+
+ONLINE_LEARNING = os.environ.get("AI_GUARD_ONLINE_LEARNING", "0") == "1"
+
+online_learner = None
+
+def _publish_online_model(model, samples):
+    version = install_model(model, "online")
+    print(f"[+] Online model {version.version} installed ({samples} feedback samples so far)")
+
+def start_online_learning():
+    """
+    Train on admin feedback (unblock = benign, confirm block = attack) in a
+    background thread, starting from the active model; every update is
+    installed as a new model version.
+    """
+    global online_learner
+    if online_learner is not None:
+        return online_learner
+    learner = online_learning.OnlineLearner(FEATURE_NAMES, _publish_online_model,
+                                            base_model=active_model.model)
+    learner.start()
+    online_learner = learner
+    print(f"[+] Online learning enabled ({'warm start from ' + active_model.version if learner.warm else 'cold start'}, "
+          f"batch={learner.batch_size}, interval={learner.interval}s)")
+    return learner
+
+def record_feedback(ip, label):
+    """Queue the features `ip` was last scored on with `label` (1 = attack)."""
+    if online_learner is None:
+        return False
+    features = last_features_for_ip(ip)
+    if features is None:
+        return False
+    return online_learner.add_feedback(features, label)
+
+# -------- Model reload --------
+
+# poll MODEL_PATH every N seconds and reload it when it changes (0 = off)
+MODEL_RELOAD_SECONDS = float(os.environ.get("AI_GUARD_MODEL_RELOAD_SECONDS", "0"))
+MODEL_WARMUP_ROUNDS = int(os.environ.get("AI_GUARD_MODEL_WARMUP_ROUNDS", "200"))
+
+_reload_lock = threading.Lock()
+
+def validate_model(model):
+    """Raise ValueError unless `model` scores the guard's feature rows as a binary classifier."""
+    if model is None or not hasattr(model, "predict_proba"):
+        raise ValueError(f"{type(model).__name__} has no predict_proba")
+    names = getattr(model, "feature_names_in_", None)
+    if names is not None and list(names) != FEATURE_NAMES:
+        raise ValueError(f"model expects features {list(names)}, the guard computes {FEATURE_NAMES}")
+    n_features = getattr(model, "n_features_in_", None)
+    if n_features is not None and n_features != len(FEATURE_NAMES):
+        raise ValueError(f"model expects {n_features} features, the guard computes {len(FEATURE_NAMES)}")
+    classes = getattr(model, "classes_", None)
+    if classes is not None and list(classes) != [0, 1]:
+        raise ValueError(f"model classes are {list(classes)}, expected [0, 1]")
+
+def warm_up_model(version, rounds=MODEL_WARMUP_ROUNDS):
+    """Exercise both scoring paths before the version takes traffic; raise ValueError on bad output."""
+    probs = np.asarray(version.scorer.predict_proba(PARITY_PROBE), dtype=np.float64)
+    if probs.shape != (len(PARITY_PROBE),) or not np.all((probs >= 0) & (probs <= 1)):
+        raise ValueError(f"warm-up produced invalid probabilities: {probs!r}")
+    for i in range(rounds):
+        version.scorer.predict_proba_one(PARITY_PROBE[i % len(PARITY_PROBE)])
+
+def model_info(version):
+    if version is None:
+        return None
+    return {
+        "version": version.version,
+        "source": version.source,
+        "checksum": version.checksum,
+        "installed_at": version.installed_at,
+        "scorer": type(version.scorer).__name__ if version.scorer is not None else None,
+    }
+
+def reload_model(path=None):
+    """
+    Load, validate and warm up the model file, then make it the active
+    version; the replaced one is kept for rollback_model(). Runs on the
+    caller's thread, never on the request path of scoring. On any error the
+    current model stays active and the error is raised.
+    """
+    path = path or MODEL_PATH
+    with _reload_lock:
+        try:
+            model, checksum = read_model_file(path)
+            if checksum == active_model.checksum:
+                MODEL_RELOADS.inc(("unchanged",))
+                return active_model
+            validate_model(model)
+            version = build_model_version(model, "file", checksum)
+            warm_up_model(version)
+        except Exception as e:
+            MODEL_RELOADS.inc(("failed",))
+            print(f"[!] Model reload from {path} failed, keeping {active_model.version}: {e}")
+            raise
+        # rebase first: from here on the learner can't publish over the new file
+        if online_learner is not None:
+            online_learner.rebase(model)
+        version = activate_model(version)
+        MODEL_RELOADS.inc(("loaded",))
+    print(f"[+] Model {version.version} active (previous: {previous_model.version})")
+    return version
+
+def rollback_model():
+    """Swap the active and previous model versions. Raises ValueError if there is no previous one."""
+    global active_model, previous_model
+    version = previous_model
+    if version is None:
+        raise ValueError("no previous model version to roll back to")
+    if online_learner is not None:
+        online_learner.rebase(version.model)
+    with _model_lock:
+        if previous_model is not version:
+            raise ValueError("the model changed during the rollback, try again")
+        active_model, previous_model = version._replace(installed_at=time.time()), active_model
+    version = active_model
+    MODEL_RELOADS.inc(("rollback",))
+    print(f"[ADMIN] Rolled back to model {version.version} (was {previous_model.version})")
+    return version
+
+
+class ModelWatcher:
+    """
+    Polls the model file's mtime and size and reloads it once two polls in
+    a row agree, so a file that is still being written is not loaded
+    (writing it elsewhere and renaming it over MODEL_PATH avoids that wait).
+    """
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self._loaded = self._stat()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _run(self):
+        pending = None
+        while not self._stopping.wait(self.interval):
+            current = self._stat()
+            if current is None or current == self._loaded:
+                pending = None
+                continue
+            if current != pending:
+                # changed since the last poll: let it settle first
+                pending = current
+                continue
+            try:
+                reload_model(self.path)
+            except Exception:
+                pass  # logged by reload_model; retried only if the file changes again
+            self._loaded = current
+            pending = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+
+model_watcher = None
+
+def start_model_watcher(interval=None):
+    global model_watcher
+    if model_watcher is None:
+        model_watcher = ModelWatcher(MODEL_PATH, interval or MODEL_RELOAD_SECONDS)
+        model_watcher.start()
+        print(f"[+] Watching {MODEL_PATH} for new model versions every {model_watcher.interval:g}s")
+    return model_watcher
+
+@app.route("/api/admin/model")
+def api_admin_model():
+    """The active and previous model versions, plus reload/online-learning state."""
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        return jsonify({"error": "forbidden"}), 403
+    return jsonify({
+        "active": model_info(active_model),
+        "previous": model_info(previous_model),
+        "watch_interval_s": model_watcher.interval if model_watcher is not None else None,
+        "online_learning": online_learner.stats() if online_learner is not None else None,
+    })
+
+@app.route("/admin/model/reload", methods=["POST"])
+def admin_model_reload():
+    """Load MODEL_PATH now (validate, warm up, swap)."""
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        return jsonify({"error": "forbidden"}), 403
+    try:
+        version = reload_model()
+    except Exception as e:
+        return jsonify({"error": str(e), "active": model_info(active_model)}), 422
+    print(f"[ADMIN] Model reload requested, active: {version.version}")
+    return jsonify({"active": model_info(version), "previous": model_info(previous_model)})
+
+@app.route("/admin/model/rollback", methods=["POST"])
+def admin_model_rollback():
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        return jsonify({"error": "forbidden"}), 403
+    try:
+        version = rollback_model()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"active": model_info(version), "previous": model_info(previous_model)})
+
 # -------- main --------
 
-if __name__ == "__main__":
+def start_services():
+    """Prepare the database and start the background jobs enabled in the environment."""
     init_db()
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    warm_feature_store()
+    if WRITE_BEHIND:
+        start_attempt_writer()
+        # SIGTERM -> SystemExit, so atexit flushes the queue
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if COMPACTION:
+        start_compaction()
+    if ONLINE_LEARNING:
+        start_online_learning()
+    if MODEL_RELOAD_SECONDS > 0:
+        start_model_watcher()
+
+
+if __name__ == "__main__":
+    # single process; see serve.py for IP-sharded workers
+    debug = True
+    # the debug reloader runs this file twice, as a file watcher and as the
+    # server (WERKZEUG_RUN_MAIN=true): only the server starts the background jobs
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_services()
+    app.run(host="0.0.0.0", port=5001, debug=debug)
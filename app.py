@@ -1,6 +1,11 @@
-from flask import Flask, request, render_template_string
+from flask import Flask, jsonify, request, render_template_string
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
+from requests.adapters import HTTPAdapter
 
 app = Flask(__name__)
 
@@ -9,6 +14,30 @@ AI_GUARD_URL = os.environ.get(
     "AI_GUARD_URL",
     "http://127.0.0.1:5001/api/log_and_decide"
 )
+# Read-only decision lookup (no attempt logged), same service
+AI_GUARD_DECIDE_URL = os.environ.get(
+    "AI_GUARD_DECIDE_URL",
+    AI_GUARD_URL.rsplit("/", 1)[0] + "/decide"
+)
+
+# Connection pool to the guard: keep-alive connections shared by all
+# request threads (AI_GUARD_KEEPALIVE=0 closes them after every call)
+GUARD_POOL_SIZE = int(os.environ.get("AI_GUARD_POOL_SIZE", "20"))
+GUARD_KEEPALIVE = os.environ.get("AI_GUARD_KEEPALIVE", "1") == "1"
+
+# How long the last decision per IP is trusted locally (0 disables)
+GUARD_CACHE_TTL = float(os.environ.get("AI_GUARD_CACHE_TTL", "5"))
+GUARD_CACHE_SIZE = int(os.environ.get("AI_GUARD_CACHE_SIZE", "10000"))
+
+# Hard upper bound on the time one guard call may add to a login
+GUARD_BUDGET_MS = float(os.environ.get("AI_GUARD_BUDGET_MS", "300"))
+# Send a second read-only lookup if the first hasn't answered by then (0 disables)
+GUARD_HEDGE_AFTER_MS = float(os.environ.get("AI_GUARD_HEDGE_AFTER_MS", "50"))
+# Stop calling the guard after this many consecutive failures, probe again later
+GUARD_BREAKER_FAILURES = int(os.environ.get("AI_GUARD_BREAKER_FAILURES", "5"))
+GUARD_BREAKER_RESET_S = float(os.environ.get("AI_GUARD_BREAKER_RESET_S", "10"))
+# Guard calls allowed in flight at once; beyond that logins fail open at once
+GUARD_MAX_IN_FLIGHT = int(os.environ.get("AI_GUARD_MAX_IN_FLIGHT", str(2 * GUARD_POOL_SIZE)))
 
 # Demo user database
 VALID_USERS = {
@@ -441,6 +470,192 @@ BLOCK_PAGE = """
 # Helper: call external AI Guard
 # ------------------------------------------------------------
 
+def make_guard_session(pool_size=GUARD_POOL_SIZE, keepalive=GUARD_KEEPALIVE):
+    session = requests.Session()
+    # the guard is an internal service: skip the per-request proxy/netrc lookups
+    session.trust_env = False
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not keepalive:
+        session.headers["Connection"] = "close"
+    return session
+
+guard_session = make_guard_session()
+
+# ip -> (decision, score, expires_at), least recently updated first
+_recent_decisions = OrderedDict()
+_recent_decisions_lock = threading.Lock()
+
+def remember_decision(ip, decision, score):
+    if GUARD_CACHE_TTL <= 0:
+        return
+    with _recent_decisions_lock:
+        _recent_decisions[ip] = (decision, score, time.monotonic() + GUARD_CACHE_TTL)
+        _recent_decisions.move_to_end(ip)
+        while len(_recent_decisions) > GUARD_CACHE_SIZE:
+            _recent_decisions.popitem(last=False)
+
+def recent_decision(ip):
+    """Last (decision, score) the guard returned for this IP, if still fresh."""
+    with _recent_decisions_lock:
+        entry = _recent_decisions.get(ip)
+        if entry is None:
+            return None
+        decision, score, expires_at = entry
+        if expires_at <= time.monotonic():
+            del _recent_decisions[ip]
+            return None
+        return decision, score
+
+class GuardUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed    -> calls go through; `failure_threshold` consecutive failures open it
+    open      -> calls fail fast for `reset_timeout` seconds
+    half_open -> a single probe call is let through; success closes, failure reopens
+    """
+
+    def __init__(self, failure_threshold=GUARD_BREAKER_FAILURES, reset_timeout=GUARD_BREAKER_RESET_S):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    count("breaker_opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+
+breaker = CircuitBreaker()
+
+guard_stats = {
+    "calls": 0,
+    "successes": 0,
+    "failures": 0,
+    "timeouts": 0,
+    "short_circuited": 0,
+    "hedged": 0,
+    "hedge_wins": 0,
+    "breaker_opened": 0,
+}
+_guard_stats_lock = threading.Lock()
+
+def count(name):
+    with _guard_stats_lock:
+        guard_stats[name] += 1
+
+# runs guard calls so the caller can stop waiting at the budget deadline;
+# one thread per slot, so a call never sits in the executor's queue
+_guard_executor = ThreadPoolExecutor(max_workers=GUARD_MAX_IN_FLIGHT, thread_name_prefix="guard-client")
+_guard_slots = threading.BoundedSemaphore(GUARD_MAX_IN_FLIGHT)
+
+def _send(method, url, timeout, **kwargs):
+    resp = guard_session.request(method, url, timeout=timeout, **kwargs)
+    resp.raise_for_status()
+    return resp.json()
+
+def _submit(method, url, timeout, **kwargs):
+    """Start a guard call in the executor; the caller holds a _guard_slots slot, released when it ends."""
+    try:
+        future = _guard_executor.submit(_send, method, url, timeout, **kwargs)
+    except BaseException:
+        _guard_slots.release()
+        raise
+    future.add_done_callback(lambda _: _guard_slots.release())
+    return future
+
+def guard_request(method, url, hedge=False, **kwargs):
+    """
+    One call to the guard that never takes longer than GUARD_BUDGET_MS.
+    `hedge=True` (idempotent calls only) sends a duplicate request when the
+    first is slower than GUARD_HEDGE_AFTER_MS and keeps the first answer.
+    Raises GuardUnavailable on timeout, error, open circuit or when
+    GUARD_MAX_IN_FLIGHT calls are already running.
+    """
+    if not _guard_slots.acquire(blocking=False):
+        # the guard is already slow: don't queue more work for it
+        count("short_circuited")
+        raise GuardUnavailable("too many guard calls in flight")
+    if not breaker.allow_request():
+        _guard_slots.release()
+        count("short_circuited")
+        raise GuardUnavailable("circuit open")
+    count("calls")
+
+    budget = GUARD_BUDGET_MS / 1000.0
+    deadline = time.monotonic() + budget
+    futures = [_submit(method, url, budget, **kwargs)]
+
+    if hedge and GUARD_HEDGE_AFTER_MS > 0:
+        done, _ = wait(futures, timeout=min(GUARD_HEDGE_AFTER_MS / 1000.0, budget))
+        remaining = deadline - time.monotonic()
+        # no hedge without a free slot
+        if not done and remaining > 0 and _guard_slots.acquire(blocking=False):
+            count("hedged")
+            futures.append(_submit(method, url, remaining, **kwargs))
+
+    error = None
+    pending = set(futures)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                data = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if future is not futures[0]:
+                count("hedge_wins")
+            for other in pending:
+                other.cancel()
+            count("successes")
+            breaker.record_success()
+            return data
+
+    if pending:
+        # drop calls that have not started; running ones end at their timeout
+        for future in pending:
+            future.cancel()
+        count("timeouts")
+        error = GuardUnavailable(f"no answer within {GUARD_BUDGET_MS:.0f}ms")
+    count("failures")
+    breaker.record_failure()
+    raise GuardUnavailable(str(error))
+
 def call_ai_guard(ip, username, success, user_agent):
     """
     Call the external AI Guard service and get:
@@ -455,12 +670,32 @@ def call_ai_guard(ip, username, success, user_agent):
     }
 
     try:
-        resp = requests.post(AI_GUARD_URL, json=payload, timeout=1.0)
-        resp.raise_for_status()
-        data = resp.json()
+        # logs an attempt -> never hedged
+        data = guard_request("POST", AI_GUARD_URL, json=payload)
         decision = data.get("decision", "allow")
         score = float(data.get("score", 0.0))
         print(f"[AI GUARD] ip={ip} user={username} success={success} decision={decision} score={score:.2f}")
+        remember_decision(ip, decision, score)
+        return decision, score
+    except Exception as e:
+        print(f"[AI GUARD ERROR] {e}")
+        # Fail open: last known decision for this IP, else allow
+        return recent_decision(ip) or ("allow", 0.0)
+
+def check_ai_guard(ip):
+    """
+    Ask the AI Guard for the current decision of an IP without logging an
+    attempt (page views, pre-checks). Returns (decision, score).
+    """
+    cached = recent_decision(ip)
+    if cached is not None:
+        return cached
+
+    try:
+        data = guard_request("GET", AI_GUARD_DECIDE_URL, hedge=True, params={"ip": ip})
+        decision = data.get("decision", "allow")
+        score = float(data.get("score", 0.0))
+        remember_decision(ip, decision, score)
         return decision, score
     except Exception as e:
         print(f"[AI GUARD ERROR] {e}")
@@ -477,8 +712,9 @@ def login():
     user_agent = request.headers.get("User-Agent", "unknown")
 
     # --- NEW: Always ask AI Guard BEFORE doing anything ---
-    # Use "success=False" for GET requests (neutral / unknown)
-    initial_decision, initial_score = call_ai_guard(ip, "", False, user_agent)
+    # Read-only: a page view is not a login attempt, so nothing is logged
+    # or scored (answered locally if we saw this IP a moment ago)
+    initial_decision, initial_score = check_ai_guard(ip)
     print(f"[WEB] initial_decision={initial_decision} score={initial_score:.2f}")
 
     # If already blocked -> BLOCK immediately (GET or POST)
@@ -556,6 +792,16 @@ def login():
     )
 
 
+@app.route("/metrics/guard_client")
+def guard_client_metrics():
+    """Counters of the AI Guard client and the state of its circuit breaker."""
+    with _guard_stats_lock:
+        stats = dict(guard_stats)
+    stats["breaker_state"] = breaker.state
+    stats["breaker_failures"] = breaker.failures
+    return jsonify(stats)
+
+
 # ------------------------------------------------------------
 # Main
 # ------------------------------------------------------------
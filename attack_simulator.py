@@ -1,5 +1,40 @@
-import requests
+"""
+Brute-force demo and load generator for AI Guard.
+
+Without arguments it replays the original demo: 50 wrong passwords for
+"alice" against the web app. The `load` command measures capacity instead:
+
+    # closed loop: 32 workers, each sending its next request as soon as the
+    # previous one is answered
+    python attack_simulator.py load --start-servers --workers 32 --requests 20000
+
+    # open loop: 500 requests/s whatever the response times, so queueing
+    # shows up in the latencies instead of lowering the offered load
+    python attack_simulator.py load --start-servers --rate 500 --duration 30 --report load.json
+
+    # serve.py with 4 IP-sharded workers: each attempt goes straight to the
+    # worker owning its IP, or through serve.py's router with --via-router
+    python attack_simulator.py load --start-servers --shards 4 --workers 64 --duration 30
+    python attack_simulator.py load --start-servers --shards 4 --via-router --workers 64 --duration 30
+
+Requests go to the guard's /api/log_and_decide (many source IPs through the
+`ip` field) or, with --target app, to the web app's /login. Traffic mixes
+benign users with brute-force and credential-stuffing attackers.
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
 import time
+from urllib.parse import urlsplit
+
+import requests
 
 TARGET_URL = "http://security.login.app.project:5000/login"
 
@@ -20,5 +55,375 @@ def brute_force():
         # Very fast brute-force: tiny sleep or none
         time.sleep(0.1)
 
+# -------- Traffic --------
+
+class TrafficMix:
+    """
+    Generates login attempts: benign IPs log in as their own user and
+    mostly succeed; attacker IPs either hammer one account with wrong
+    passwords (brute force) or try a different username every time
+    (credential stuffing).
+    """
+
+    def __init__(self, benign_ips, attacker_ips, attack_ratio, apps, seed):
+        self.benign_ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(benign_ips)]
+        self.attacker_ips = [f"172.16.{i // 256 % 256}.{i % 256}" for i in range(attacker_ips)]
+        self.attack_ratio = attack_ratio if attacker_ips else 0.0
+        self.apps = apps
+        self.seed = seed
+
+    def rng(self, worker):
+        return random.Random(self.seed * 1000003 + worker)
+
+    def attempt(self, rng):
+        """Return (kind, attempt dict) for the next request."""
+        app_name = rng.choice(self.apps)
+        if rng.random() < self.attack_ratio:
+            n = rng.randrange(len(self.attacker_ips))
+            ip = self.attacker_ips[n]
+            if n % 2 == 0:
+                username = "alice"                       # brute force
+            else:
+                username = f"user{rng.randrange(100000)}"  # credential stuffing
+            return "attack", {
+                "ip": ip, "username": username, "password": f"guess{rng.randrange(10**6)}",
+                "success": False, "app": app_name, "user_agent": "python-requests/attack",
+            }
+
+        n = rng.randrange(len(self.benign_ips))
+        success = rng.random() < 0.95
+        return "benign", {
+            "ip": self.benign_ips[n], "username": f"member{n}",
+            "password": "password123" if success else "typo",
+            "success": success, "app": app_name, "user_agent": "Mozilla/5.0 (load test)",
+        }
+
+
+def send_to_guard(session, base_url, attempt):
+    resp = session.post(f"{base_url}/api/log_and_decide", json={
+        k: attempt[k] for k in ("ip", "username", "success", "app", "user_agent")
+    }, timeout=10)
+    return resp.status_code, resp.json().get("decision") if resp.ok else None
+
+
+def send_to_shard(base_urls):
+    """send_to_guard, but to the serve.py worker that owns the attempt's IP."""
+    # only load tests against a sharded guard need ai_guard (and its model)
+    from ai_guard import shard_for
+
+    def send(session, base_url, attempt):
+        return send_to_guard(session, base_urls[shard_for(attempt["ip"], len(base_urls))], attempt)
+    return send
+
+
+def send_to_app(session, base_url, attempt):
+    # the web app sees every request as coming from this machine
+    resp = session.post(f"{base_url}/login", data={
+        "username": attempt["username"], "password": attempt["password"],
+    }, timeout=10)
+    if resp.status_code == 403:
+        decision = "block"
+    elif "Additional verification" in resp.text:
+        decision = "challenge"
+    else:
+        decision = "allow"
+    return resp.status_code, decision
+
+# -------- Load loops --------
+
+def make_session():
+    session = requests.Session()
+    session.trust_env = False
+    return session
+
+
+def run_closed_loop(send, base_url, mix, workers, deadline, max_requests):
+    """N workers, each with one request in flight at a time."""
+    counter = itertools.count()
+    results = [[] for _ in range(workers)]
+
+    def worker(w):
+        session = make_session()
+        rng = mix.rng(w)
+        out = results[w]
+        while time.monotonic() < deadline and next(counter) < max_requests:
+            kind, attempt = mix.attempt(rng)
+            start = time.perf_counter()
+            try:
+                status, decision = send(session, base_url, attempt)
+            except requests.RequestException:
+                status, decision = None, None
+            elapsed = time.perf_counter() - start
+            out.append((time.monotonic(), elapsed, elapsed, kind, status, decision))
+
+    run_threads(worker, workers)
+    return [r for rs in results for r in rs]
+
+
+def run_open_loop(send, base_url, mix, workers, deadline, max_requests, rate):
+    """
+    Requests are due at fixed intervals of 1/rate whatever the response
+    times. Latency is counted from when a request was due, so time spent
+    waiting for a free worker is included (no coordinated omission);
+    `service` is the HTTP round trip alone.
+    """
+    due = queue.Queue()
+    results = [[] for _ in range(workers)]
+    rng = mix.rng(-1)
+
+    def worker(w):
+        session = make_session()
+        out = results[w]
+        while True:
+            item = due.get()
+            if item is None:
+                return
+            due_at, kind, attempt = item
+            delay = due_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            start = time.perf_counter()
+            try:
+                status, decision = send(session, base_url, attempt)
+            except requests.RequestException:
+                status, decision = None, None
+            end = time.perf_counter()
+            out.append((time.monotonic(), end - due_at, end - start, kind, status, decision))
+
+    threads = [threading.Thread(target=worker, args=(w,), daemon=True) for w in range(workers)]
+    for t in threads:
+        t.start()
+
+    interval = 1.0 / rate
+    t0 = time.perf_counter() + 0.05
+    for i in range(max_requests):
+        due_at = t0 + i * interval
+        if time.monotonic() + (due_at - time.perf_counter()) >= deadline:
+            break
+        # hand out work slightly ahead so workers sleep until it is due
+        ahead = due_at - time.perf_counter() - 0.01
+        if ahead > 0:
+            time.sleep(ahead)
+        kind, attempt = mix.attempt(rng)
+        due.put((due_at, kind, attempt))
+
+    for _ in threads:
+        due.put(None)
+    for t in threads:
+        t.join()
+    return [r for rs in results for r in rs]
+
+
+def run_threads(target, n):
+    threads = [threading.Thread(target=target, args=(i,), daemon=True) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+# -------- Report --------
+
+PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {}
+    latencies = sorted(latencies)
+    summary = {name: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+               for name, q in PERCENTILES}
+    summary["mean"] = sum(latencies) / len(latencies) * 1000
+    summary["max"] = latencies[-1] * 1000
+    return summary
+
+
+def histogram(latencies):
+    """[[upper bound ms, count], ...] over power-of-two buckets from 0.25 ms."""
+    buckets = {}
+    for latency in latencies:
+        upper = 0.25
+        while latency * 1000 > upper:
+            upper *= 2
+        buckets[upper] = buckets.get(upper, 0) + 1
+    return [[upper, buckets[upper]] for upper in sorted(buckets)]
+
+
+def count(values):
+    counts = {}
+    for v in values:
+        counts[str(v)] = counts.get(str(v), 0) + 1
+    return counts
+
+
+def build_report(args, results, started, warmup_until):
+    measured = [r for r in results if r[0] >= warmup_until]
+    ok = [r for r in measured if r[4] is not None and r[4] < 500]
+    duration = max(r[0] for r in measured) - max(warmup_until, started) if measured else 0.0
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "func"},
+        "mode": "open" if args.rate else "closed",
+        "requests": len(measured),
+        "errors": len(measured) - len(ok),
+        "duration_s": duration,
+        "throughput_rps": len(ok) / duration if duration > 0 else 0.0,
+        "latency_ms": latency_summary([r[1] for r in ok]),
+        "histogram_ms": histogram([r[1] for r in ok]),
+        "status": count(r[4] for r in measured),
+        "by_kind": {},
+    }
+    if args.rate:
+        report["service_ms"] = latency_summary([r[2] for r in ok])
+    for kind in ("benign", "attack"):
+        rows = [r for r in ok if r[3] == kind]
+        report["by_kind"][kind] = {
+            "requests": len(rows),
+            "latency_ms": latency_summary([r[1] for r in rows]),
+            "decisions": count(r[5] for r in rows),
+        }
+    return report
+
+
+def print_report(report):
+    lat = report["latency_ms"]
+    print(f"[+] {report['mode']}-loop: {report['requests']} requests in {report['duration_s']:.1f}s, "
+          f"{report['errors']} errors, {report['throughput_rps']:.1f} req/s")
+    if lat:
+        print("    latency " + "  ".join(f"{k}={lat[k]:.2f}ms" for k in ("p50", "p95", "p99", "p999", "max")))
+    if "service_ms" in report and report["service_ms"]:
+        svc = report["service_ms"]
+        print("    service " + "  ".join(f"{k}={svc[k]:.2f}ms" for k in ("p50", "p95", "p99", "p999", "max")))
+
+    total = sum(c for _, c in report["histogram_ms"]) or 1
+    for upper, c in report["histogram_ms"]:
+        bar = "#" * max(1, round(50 * c / total))
+        print(f"    <= {upper:>8.2f}ms {c:>8} {bar}")
+    for kind, stats in report["by_kind"].items():
+        print(f"    {kind:<7} {stats['requests']:>8} requests, decisions {stats['decisions']}")
+
+# -------- Local servers --------
+
+def start_process(code, env):
+    return subprocess.Popen(
+        [sys.executable, "-c", code],
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_until_up(url, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=0.5)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start_servers(args):
+    """Start ai_guard or serve.py (and app for --target app) on a temporary database."""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="ai_guard_load_"), "load.db")
+    guard_url = f"http://127.0.0.1:{args.guard_port}"
+    if args.shards > 1:
+        procs = [start_process(
+            f"import serve; serve.main(['--workers', '{args.shards}', '--host', '127.0.0.1', "
+            f"'--port', '{args.guard_port}'])",
+            {"AI_GUARD_DB_PATH": db_path},
+        )]
+    else:
+        procs = [start_process(
+            "import ai_guard; ai_guard.init_db(); ai_guard.warm_feature_store(); "
+            f"ai_guard.app.run(port={args.guard_port}, threaded=True)",
+            {"AI_GUARD_DB_PATH": db_path},
+        )]
+    # serve.py starts its router once every worker is listening
+    wait_until_up(f"{guard_url}/admin")
+    if args.target == "app":
+        procs.append(start_process(
+            f"import app; app.app.run(port={args.app_port}, threaded=True)",
+            {"AI_GUARD_URL": f"{guard_url}/api/log_and_decide"},
+        ))
+        wait_until_up(f"http://127.0.0.1:{args.app_port}/login")
+    print(f"[+] Servers started on a temporary database: {db_path}")
+    return procs
+
+
+def load(args):
+    if args.target == "guard":
+        base_url = args.url or f"http://127.0.0.1:{args.guard_port}"
+        send = send_to_guard
+        if args.shards > 1 and not args.via_router:
+            # serve.py's workers listen on the ports after the router's
+            url = urlsplit(base_url)
+            send = send_to_shard([f"{url.scheme}://{url.hostname}:{url.port + 1 + shard}"
+                                  for shard in range(args.shards)])
+    else:
+        base_url = args.url or f"http://127.0.0.1:{args.app_port}"
+        send = send_to_app
+
+    procs = start_servers(args) if args.start_servers else []
+    try:
+        mix = TrafficMix(args.ips, args.attackers, args.attack_ratio, args.apps.split(","), args.seed)
+        started = time.monotonic()
+        deadline = started + args.warmup + args.duration if args.duration else float("inf")
+        max_requests = args.requests or sys.maxsize
+        if args.rate:
+            results = run_open_loop(send, base_url, mix, args.workers, deadline, max_requests, args.rate)
+        else:
+            results = run_closed_loop(send, base_url, mix, args.workers, deadline, max_requests)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+    report = build_report(args, results, started, started + args.warmup)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[+] Report written to {args.report}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command")
+
+    lp = commands.add_parser("load", help="concurrent load test with latency percentiles")
+    lp.add_argument("--target", choices=("guard", "app"), default="guard")
+    lp.add_argument("--url", help="base URL of an already running server")
+    lp.add_argument("--start-servers", action="store_true", help="start ai_guard/app locally on a temp DB")
+    lp.add_argument("--guard-port", type=int, default=5201)
+    lp.add_argument("--app-port", type=int, default=5200)
+    lp.add_argument("--shards", type=int, default=1,
+                    help="guard runs as serve.py with this many IP-sharded workers (started with --start-servers)")
+    lp.add_argument("--via-router", action="store_true",
+                    help="with --shards, send every attempt to serve.py's router instead of the worker owning its IP")
+    lp.add_argument("--workers", type=int, default=16, help="concurrent workers (closed loop) or max in flight (open loop)")
+    lp.add_argument("--rate", type=float, default=0.0, help="open loop at this many requests/s")
+    lp.add_argument("--duration", type=float, default=0.0, help="seconds to run after the warm-up")
+    lp.add_argument("--requests", type=int, default=0, help="stop after this many requests")
+    lp.add_argument("--warmup", type=float, default=0.0, help="seconds excluded from the report")
+    lp.add_argument("--ips", type=int, default=5000, help="benign source IPs")
+    lp.add_argument("--attackers", type=int, default=50, help="attacking source IPs")
+    lp.add_argument("--attack-ratio", type=float, default=0.2)
+    lp.add_argument("--apps", default="default", help="comma separated app names")
+    lp.add_argument("--seed", type=int, default=1)
+    lp.add_argument("--report", help="write the JSON report here")
+    lp.set_defaults(func=load)
+
+    args = parser.parse_args()
+    if args.command is None:
+        brute_force()
+        return
+    if not args.duration and not args.requests:
+        parser.error("load needs --duration or --requests")
+    if args.via_router and (args.target != "guard" or args.shards < 2):
+        parser.error("--via-router needs --target guard and --shards of 2 or more")
+    args.func(args)
+
+
 if __name__ == "__main__":
-    brute_force()
+    main()
@@ -0,0 +1,93 @@
+"""
+Per-request latency of /api/log_and_decide with the old connection handling
+(a new sqlite3 connection per helper, default pragmas) versus the pooled,
+WAL-tuned connections of ai_guard.ConnectionManager.
+
+    python benchmark_db.py --requests 2000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import ai_guard
+
+
+# connections opened by connect_per_call() during the current request
+_opened = []
+
+def connect_per_call():
+    # what get_db_connection() used to do before connections were pooled
+    conn = sqlite3.connect(ai_guard.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    _opened.append(conn)
+    return conn
+
+
+def close_opened():
+    # the old helpers closed their connection before returning; the callers
+    # of get_db_connection() no longer do, so close them after each request
+    while _opened:
+        _opened.pop().close()
+
+
+def run(mode, n_requests, n_ips):
+    tmp_dir = tempfile.mkdtemp(prefix="ai_guard_bench_")
+    ai_guard.DB_PATH = os.path.join(tmp_dir, "bench.db")
+    ai_guard.feature_store.clear()
+
+    pooled_get = ai_guard.get_db_connection
+    if mode == "legacy":
+        ai_guard.get_db_connection = connect_per_call
+
+    try:
+        ai_guard.init_db()
+        client = ai_guard.app.test_client()
+        latencies = []
+        for i in range(n_requests):
+            payload = {
+                "ip": f"10.1.{(i % n_ips) // 256}.{i % 256}",
+                "username": f"user{i % 7}",
+                "success": i % 5 == 0,
+                "app": "bench",
+            }
+            start = time.perf_counter()
+            try:
+                resp = client.post("/api/log_and_decide", json=payload)
+            finally:
+                close_opened()
+            latencies.append(time.perf_counter() - start)
+            assert resp.status_code == 200, resp.data
+    finally:
+        close_opened()
+        ai_guard.get_db_connection = pooled_get
+
+    latencies.sort()
+    return {
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--ips", type=int, default=50)
+    args = parser.parse_args()
+
+    results = {mode: run(mode, args.requests, args.ips) for mode in ("legacy", "pooled")}
+
+    print(f"{'mode':<8} {'mean':>9} {'p50':>9} {'p95':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<8} {r['mean_ms']:>7.3f}ms {r['p50_ms']:>7.3f}ms {r['p95_ms']:>7.3f}ms")
+
+    saved = results["legacy"]["mean_ms"] - results["pooled"]["mean_ms"]
+    print(f"\nSaved per request: {saved:.3f} ms "
+          f"({results['legacy']['mean_ms'] / results['pooled']['mean_ms']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Microbenchmark of model inference: the generic sklearn path (one-row
+DataFrame + Pipeline.predict_proba) versus the compiled NumPy scorer.
+
+    python benchmark_inference.py --rows 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+import ai_guard
+
+
+def bench(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def random_features(n, seed=0):
+    rng = np.random.default_rng(seed)
+    total = rng.integers(1, 200, n)
+    failed = rng.integers(0, total + 1)
+    return np.column_stack([
+        total,
+        failed,
+        (total - failed) / total,
+        rng.integers(1, 20, n),
+        rng.uniform(0, 600, n),
+    ]).astype(np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000, help="batch size for the batched variant")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    if ai_guard.active_model.model is None:
+        raise SystemExit("model.joblib not found - run train_model.py first")
+
+    generic = ai_guard.GenericScorer(ai_guard.active_model.model)
+    compiled = ai_guard.active_model.scorer
+    X = random_features(args.rows)
+    x = X[0]
+
+    diff = np.max(np.abs(generic.predict_proba(X) - compiled.predict_proba(X)))
+    print(f"scorer: {type(compiled).__name__}, max |generic - compiled| over {args.rows} rows: {diff:.3e}")
+
+    one_generic = bench(lambda: generic.predict_proba_one(x), args.repeat)
+    one_compiled = bench(lambda: compiled.predict_proba_one(x), args.repeat)
+    batch_repeat = max(1, args.repeat // 10)
+    many_generic = bench(lambda: generic.predict_proba(X), batch_repeat)
+    many_compiled = bench(lambda: compiled.predict_proba(X), batch_repeat)
+
+    print(f"{'':<22} {'generic':>12} {'compiled':>12} {'speedup':>8}")
+    print(f"{'single row':<22} {one_generic * 1e6:>10.1f}us {one_compiled * 1e6:>10.1f}us "
+          f"{one_generic / one_compiled:>7.1f}x")
+    print(f"{f'batch of {args.rows}':<22} {many_generic * 1e6:>10.1f}us {many_compiled * 1e6:>10.1f}us "
+          f"{many_generic / many_compiled:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
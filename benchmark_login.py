@@ -0,0 +1,168 @@
+"""
+Latency of the web app's calls to the guard, with both services running
+locally on a temporary database:
+
+  1. the guard calls of a POST /login (the read-only pre-check and the
+     logging call): a fresh connection each time versus the pooled
+     keep-alive session of app.py
+  2. GET /login from an IP the guard has blocked: a round trip to the guard
+     on every page view versus the local decision cache
+
+    python benchmark_login.py --requests 300
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+GUARD_PORT = 5101
+APP_PORT = 5100
+GUARD_URL = f"http://127.0.0.1:{GUARD_PORT}/api/log_and_decide"
+DECIDE_URL = f"http://127.0.0.1:{GUARD_PORT}/api/decide"
+LOGIN_URL = f"http://127.0.0.1:{APP_PORT}/login"
+
+
+def start(code, env):
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code],
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return proc
+
+
+def wait_until_up(url, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=0.5)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start_guard(db_path):
+    proc = start(
+        f"import ai_guard; ai_guard.init_db(); ai_guard.app.run(port={GUARD_PORT}, threaded=True)",
+        {"AI_GUARD_DB_PATH": db_path},
+    )
+    wait_until_up(f"http://127.0.0.1:{GUARD_PORT}/admin")
+    return proc
+
+
+def start_app(keepalive, cache_ttl):
+    proc = start(
+        f"import app; app.app.run(port={APP_PORT}, threaded=True)",
+        {
+            "AI_GUARD_URL": GUARD_URL,
+            "AI_GUARD_KEEPALIVE": "1" if keepalive else "0",
+            "AI_GUARD_CACHE_TTL": str(cache_ttl),
+        },
+    )
+    wait_until_up(LOGIN_URL)
+    return proc
+
+
+def timed(fn, n):
+    latencies = []
+    for i in range(n):
+        start_t = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start_t)
+    return summarize(latencies)
+
+
+def summarize(latencies):
+    return statistics.fmean(latencies) * 1000, statistics.median(latencies) * 1000
+
+
+def bench_guard_calls(n):
+    """
+    Latencies of the two calls a POST /login makes, on a new connection
+    each time and on app.py's pooled session: the read-only pre-check
+    (GET /api/decide) and the logging call (POST /api/log_and_decide).
+    """
+    import app
+
+    pooled = app.make_guard_session(keepalive=True)
+
+    # interleaved so both variants see the same guard state; distinct IPs
+    # so the guard never blocks the benchmark
+    results = {key: [] for key in ("check_fresh", "check_kept", "log_fresh", "log_kept")}
+    for i in range(n):
+        for client, variant, ip in ((requests, "fresh", f"10.8.{i // 256}.{i % 256}"),
+                                    (pooled, "kept", f"10.9.{i // 256}.{i % 256}")):
+            start_t = time.perf_counter()
+            client.get(DECIDE_URL, params={"ip": ip}, timeout=2.0)
+            results[f"check_{variant}"].append(time.perf_counter() - start_t)
+
+            payload = {"ip": ip, "username": "bench", "success": True}
+            start_t = time.perf_counter()
+            client.post(GUARD_URL, json=payload, timeout=2.0)
+            results[f"log_{variant}"].append(time.perf_counter() - start_t)
+    return {key: summarize(latencies) for key, latencies in results.items()}
+
+
+def block_localhost():
+    # rapid failures from one IP until the model blocks it
+    for i in range(200):
+        resp = requests.post(GUARD_URL, json={"ip": "127.0.0.1", "username": f"u{i}", "success": False})
+        if resp.json()["decision"] == "block":
+            return
+    raise RuntimeError("could not get 127.0.0.1 blocked")
+
+
+def bench_blocked_get(n, keepalive, cache_ttl):
+    proc = start_app(keepalive, cache_ttl)
+    try:
+        client = requests.Session()
+        client.get(LOGIN_URL)  # prime the app's decision cache
+        return timed(lambda i: client.get(LOGIN_URL), n)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="ai_guard_bench_"), "bench.db")
+    guard = start_guard(db_path)
+    try:
+        calls = bench_guard_calls(args.requests)
+        block_localhost()
+        legacy_get = bench_blocked_get(args.requests, keepalive=False, cache_ttl=0)
+        cached_get = bench_blocked_get(args.requests, keepalive=True, cache_ttl=60)
+    finally:
+        guard.terminate()
+        guard.wait()
+
+    print(f"{'':<34} {'mean':>9} {'median':>9}")
+    for key, label in (("log_fresh", "guard log call, new connection"),
+                       ("log_kept", "guard log call, pooled keep-alive"),
+                       ("check_fresh", "guard pre-check, new connection"),
+                       ("check_kept", "guard pre-check, pooled keep-alive")):
+        mean, median = calls[key]
+        print(f"{label:<34} {mean:>7.3f}ms {median:>7.3f}ms")
+    print(f"{'GET /login blocked, round trip':<34} {legacy_get[0]:>7.3f}ms {legacy_get[1]:>7.3f}ms")
+    print(f"{'GET /login blocked, local cache':<34} {cached_get[0]:>7.3f}ms {cached_get[1]:>7.3f}ms")
+    print()
+    # a POST /login logs once; its pre-check only reaches the guard when the
+    # IP is not in the local decision cache (e.g. no page view just before)
+    log_saved = calls["log_fresh"][0] - calls["log_kept"][0]
+    check_saved = calls["check_fresh"][0] - calls["check_kept"][0]
+    print(f"Saved per POST /login, pre-check cached: {log_saved:.3f} ms")
+    print(f"Saved per POST /login, pre-check not cached: {log_saved + check_saved:.3f} ms")
+    print(f"Saved per GET /login from a blocked IP: {legacy_get[0] - cached_get[0]:.3f} ms")
+
+if __name__ == "__main__":
+    main()
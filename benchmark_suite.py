@@ -0,0 +1,204 @@
+"""
+Microbenchmarks of the guard's hot path as login_attempts grows.
+
+Seeds one temporary database with synthetic attempts, growing it through
+each size in --sizes, and at every size times the helpers in isolation
+(log_attempt, compute_features_for_ip, predict_decision, set_ip_decision,
+get_blocked_ips, the /metrics instrumentation, ...) and the endpoints
+end-to-end through the Flask test client. Results are written as JSON; with --baseline they are compared
+against an earlier run and the exit status is 1 if anything got slower
+than --threshold times its baseline median.
+
+    python benchmark_suite.py --sizes 10000,100000,1000000 --output bench.json
+    python benchmark_suite.py --sizes 10000,100000,1000000 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import ai_guard
+
+SEED_CHUNK = 200_000
+
+
+def seed_attempts(n, n_ips, n_apps, span_seconds, now, rng):
+    """Append `n` synthetic attempts spread over the last `span_seconds`."""
+    ips = np.array([f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(n_ips)], dtype=object)
+    apps = np.array([f"app{i}" for i in range(n_apps)], dtype=object)
+    for offset in range(0, n, SEED_CHUNK):
+        size = min(SEED_CHUNK, n - offset)
+        ts = now - rng.integers(0, span_seconds, size)
+        ip = ips[rng.integers(0, n_ips, size)]
+        username = np.char.add("user", rng.integers(0, 50, size).astype(str)).astype(object)
+        success = rng.random(size) < 0.7
+        app_name = apps[rng.integers(0, n_apps, size)]
+        ai_guard.log_attempts_batch(list(zip(
+            ts.tolist(), ip.tolist(), username.tolist(), success.tolist(),
+            ["bench"] * size, app_name.tolist(),
+        )))
+
+
+def seed_decisions(n_ips, blocked_fraction, now, rng):
+    decisions = {}
+    for i in range(n_ips):
+        ip = f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"
+        r = rng.random()
+        if r < blocked_fraction:
+            decisions[ip] = ("block", 0.95)
+        elif r < blocked_fraction * 2:
+            decisions[ip] = ("challenge", 0.7)
+    conn = ai_guard.get_db_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO ip_decisions (ip, decision, last_update, score) VALUES (?, ?, ?, ?)",
+            [(ip, d, now - int(rng.integers(0, 3600)), s) for ip, (d, s) in decisions.items()],
+        )
+
+
+def timed(fn, iterations, warmup=10):
+    for i in range(min(warmup, iterations)):
+        fn(i)
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p95_us": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6,
+        "ops_per_s": len(samples) / sum(samples),
+    }
+
+
+def run_benchmarks(n_ips, n_apps, iterations):
+    rand = random.Random(42)
+    ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(n_ips)]
+    pick = lambda i: ips[rand.randrange(n_ips)]
+    client = ai_guard.app.test_client()
+    key = ai_guard.ADMIN_KEY
+    slow = max(5, iterations // 20)
+
+    benches = {
+        # -------- helpers in isolation --------
+        "log_attempt": (lambda i: ai_guard.log_attempt(pick(i), "bench", False, "bench", "app0"), iterations),
+        "compute_features_for_ip": (lambda i: ai_guard.compute_features_for_ip(pick(i)), iterations),
+        "compute_features_for_ip_sql": (lambda i: ai_guard.compute_features_for_ip_sql(pick(i)), iterations),
+        "predict_decision": (lambda i: ai_guard.predict_decision(pick(i)), iterations),
+        "set_ip_decision": (lambda i: ai_guard.set_ip_decision(pick(i), "allow", 0.1), iterations),
+        "get_blocked_ips": (lambda i: ai_guard.get_blocked_ips(), slow),
+        "get_blocked_ips_app": (lambda i: ai_guard.get_blocked_ips("app1"), slow),
+        "metrics_instrumentation": (lambda i: ai_guard.record_stage_metrics(
+            0.0, 1e-5, 2e-5, 3e-5, 4e-5, "allow", "app0"), iterations),
+        "rebuild_feature_store": (
+            lambda i: ai_guard.feature_store.rebuild_from_db(ai_guard.get_db_connection()), max(3, slow // 5)),
+        # -------- end-to-end through the test client --------
+        "http_log_and_decide": (lambda i: client.post("/api/log_and_decide", json={
+            "ip": pick(i), "username": "bench", "success": False, "app": "app0"}), iterations),
+        "http_decide": (lambda i: client.get(f"/api/decide?ip={pick(i)}"), iterations),
+        "http_admin_scores": (lambda i: client.get(f"/api/admin/scores?key={key}"), slow),
+        "http_admin_blocked": (lambda i: client.get(f"/api/admin/blocked?key={key}"), slow),
+        "http_metrics": (lambda i: client.get("/metrics"), slow),
+    }
+
+    results = {}
+    for name, (fn, n) in benches.items():
+        results[name] = timed(fn, n)
+        r = results[name]
+        print(f"    {name:<28} p50 {r['p50_us']:>10.1f}us  p95 {r['p95_us']:>10.1f}us  "
+              f"{r['ops_per_s']:>10.0f} ops/s")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline medians; return the list of regressions."""
+    regressions = []
+    print(f"\n{'size':>10} {'benchmark':<28} {'baseline':>11} {'current':>11} {'ratio':>7}")
+    for size, benches in results.items():
+        for name, r in benches.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            ratio = r["p50_us"] / base["p50_us"] if base["p50_us"] else float("inf")
+            flag = "  REGRESSION" if ratio > threshold else ""
+            print(f"{size:>10} {name:<28} {base['p50_us']:>9.1f}us {r['p50_us']:>9.1f}us {ratio:>6.2f}x{flag}")
+            if flag:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="comma separated login_attempts row counts, e.g. 10000,1000000,10000000")
+    parser.add_argument("--ips", type=int, default=10000)
+    parser.add_argument("--apps", type=int, default=5)
+    parser.add_argument("--span-hours", type=float, default=24.0, help="attempts are spread over this period")
+    parser.add_argument("--blocked-fraction", type=float, default=0.1)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="flag a regression when p50 exceeds baseline p50 by this factor")
+    args = parser.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    rng = np.random.default_rng(7)
+    now = int(time.time())
+
+    ai_guard.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="ai_guard_suite_"), "suite.db")
+    ai_guard.feature_store.clear()
+    ai_guard.init_db()
+    seed_decisions(args.ips, args.blocked_fraction, now, rng)
+
+    results = {}
+    seeded = 0
+    for size in sizes:
+        start = time.perf_counter()
+        seed_attempts(size - seeded, args.ips, args.apps, int(args.span_hours * 3600), now, rng)
+        seeded = size
+        conn = ai_guard.get_db_connection()
+        conn.execute("ANALYZE")
+        ai_guard.feature_store.rebuild_from_db(conn)
+        ai_guard.decision_cache.clear()
+        print(f"[+] {size} attempts seeded ({time.perf_counter() - start:.1f}s), {len(ai_guard.feature_store)} IPs in window")
+        results[str(size)] = run_benchmarks(args.ips, args.apps, args.iterations)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[+] Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n[!] {len(regressions)} regression(s) over {args.threshold}x baseline")
+            sys.exit(1)
+        print("\n[+] No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Retention and roll-up compaction for login_attempts.
+
+Raw attempts older than the raw retention are folded into per-minute
+aggregates in login_attempt_rollups (attempts, failures, distinct usernames
+per IP and app) and then deleted. The usernames of each minute are kept in
+login_attempt_rollup_usernames, so a minute that is merged again (late
+rows, or legacy rows and a partition covering the same minute) still gets
+an exact distinct count. Work is done in small batches of whole
+minutes, each in its own short transaction, so API writers are never held
+up for long. Roll-ups older than the roll-up retention are deleted too.
+
+Freed pages are returned to the OS with PRAGMA incremental_vacuum when the
+database uses auto_vacuum=INCREMENTAL (the default for files created by
+migrations.migrate()). Older files can be converted once, offline:
+
+    python compaction.py --enable-incremental-vacuum
+
+ai_guard.py runs the job in a background thread when AI_GUARD_COMPACTION=1;
+it can also be run from cron:
+
+    python compaction.py --once
+
+With partitioned attempts (see partitions.py) a whole partition file is
+rolled up once it is past the raw retention, then unlinked.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import migrations
+import partitions
+
+# -------- Config --------
+
+RAW_RETENTION_SECONDS = int(os.environ.get("AI_GUARD_RAW_RETENTION_SECONDS", str(24 * 3600)))
+ROLLUP_RETENTION_SECONDS = int(os.environ.get("AI_GUARD_ROLLUP_RETENTION_SECONDS", str(30 * 24 * 3600)))
+COMPACTION_INTERVAL_SECONDS = float(os.environ.get("AI_GUARD_COMPACTION_INTERVAL_SECONDS", "300"))
+COMPACTION_BATCH_ROWS = int(os.environ.get("AI_GUARD_COMPACTION_BATCH_ROWS", "5000"))
+# pause between batches so request threads get the write lock in between
+COMPACTION_PAUSE_MS = int(os.environ.get("AI_GUARD_COMPACTION_PAUSE_MS", "20"))
+VACUUM_PAGES = int(os.environ.get("AI_GUARD_VACUUM_PAGES", "2000"))
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+# run before ROLLUP_SQL, in the same transaction and with the same `where`
+USERNAMES_SQL = """
+    INSERT OR IGNORE INTO main.login_attempt_rollup_usernames (ip, app, minute, username)
+    SELECT DISTINCT ip, COALESCE(app, 'default'), timestamp / 60 * 60, username
+    FROM {table}
+    WHERE ({where}) AND username IS NOT NULL
+"""
+
+# `where` must not be empty: INSERT ... SELECT ... ON CONFLICT needs a WHERE.
+# Roll-ups written before the usernames table existed have no usernames
+# there, hence the MAX: exact for new minutes, a lower bound for those.
+ROLLUP_SQL = """
+    INSERT INTO main.login_attempt_rollups
+        (ip, app, minute, attempts, failures, distinct_usernames)
+    SELECT ip, COALESCE(app, 'default'), timestamp / 60 * 60,
+           COUNT(*), SUM(success = 0), COUNT(DISTINCT username)
+    FROM {table}
+    WHERE {where}
+    GROUP BY 1, 2, 3
+    ON CONFLICT (ip, app, minute) DO UPDATE SET
+        attempts = attempts + excluded.attempts,
+        failures = failures + excluded.failures,
+        distinct_usernames = MAX(distinct_usernames, (
+            SELECT COUNT(*) FROM main.login_attempt_rollup_usernames AS u
+            WHERE u.ip = excluded.ip AND u.app = excluded.app AND u.minute = excluded.minute
+        ))
+"""
+
+
+def rollup(conn, table, where, params=()):
+    """Fold the rows of `table` matching `where` into the roll-ups; call inside a transaction."""
+    conn.execute(USERNAMES_SQL.format(table=table, where=where), params)
+    conn.execute(ROLLUP_SQL.format(table=table, where=where), params)
+
+
+def floor_minute(ts):
+    return int(ts) // 60 * 60
+
+
+class CompactionJob:
+    """
+    Compacts login_attempts into login_attempt_rollups.
+
+    `connect` is a zero-argument callable returning a sqlite3 connection; it
+    is called from the thread doing the work, so ai_guard.get_db_connection
+    can be passed as is. Batches cover whole minutes; a minute rolled up
+    again later is merged through its stored usernames.
+    """
+
+    def __init__(self, connect, raw_retention=RAW_RETENTION_SECONDS,
+                 rollup_retention=ROLLUP_RETENTION_SECONDS, batch_rows=COMPACTION_BATCH_ROWS,
+                 pause_ms=COMPACTION_PAUSE_MS, interval=COMPACTION_INTERVAL_SECONDS,
+                 vacuum_pages=VACUUM_PAGES, min_raw_retention=0, partitions=None):
+        if raw_retention < min_raw_retention:
+            raise ValueError(
+                f"raw retention {raw_retention}s is shorter than the feature window "
+                f"({min_raw_retention}s)"
+            )
+        self.connect = connect
+        self.partitions = partitions
+        self.raw_retention = raw_retention
+        self.rollup_retention = rollup_retention
+        self.batch_rows = batch_rows
+        self.pause = pause_ms / 1000.0
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self.compacted = 0
+        self.partitions_dropped = 0
+        self.rollups_expired = 0
+        self.batches = 0
+        self.runs = 0
+        self.failed = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # -------- one pass --------
+
+    def run_once(self, now=None):
+        """
+        Compact everything past the retention, then return the number of raw
+        rows folded into roll-ups during this pass.
+        """
+        now = int(time.time()) if now is None else int(now)
+        conn = self.connect()
+
+        compacted = 0
+        cutoff = floor_minute(now - self.raw_retention)
+        while not self._stopping.is_set():
+            rows = self._compact_batch(conn, cutoff)
+            if not rows:
+                break
+            compacted += rows
+            time.sleep(self.pause)
+
+        if self.partitions is not None and not self._stopping.is_set():
+            dropped = self.partitions.drop_expired(conn, cutoff, on_drop=self._rollup_partition)
+            self.partitions_dropped += len(dropped)
+
+        rollup_cutoff = now - self.rollup_retention
+        while not self._stopping.is_set():
+            with conn:
+                deleted = conn.execute(
+                    """
+                    DELETE FROM login_attempt_rollups
+                    WHERE (ip, app, minute) IN (
+                        SELECT ip, app, minute FROM login_attempt_rollups
+                        WHERE minute < ? LIMIT ?
+                    )
+                    """,
+                    (rollup_cutoff, self.batch_rows),
+                ).rowcount
+            self.rollups_expired += deleted
+            if deleted < self.batch_rows:
+                break
+            time.sleep(self.pause)
+        while not self._stopping.is_set():
+            with conn:
+                deleted = conn.execute(
+                    """
+                    DELETE FROM login_attempt_rollup_usernames
+                    WHERE (ip, app, minute, username) IN (
+                        SELECT ip, app, minute, username FROM login_attempt_rollup_usernames
+                        WHERE minute < ? LIMIT ?
+                    )
+                    """,
+                    (rollup_cutoff, self.batch_rows),
+                ).rowcount
+            if deleted < self.batch_rows:
+                break
+            time.sleep(self.pause)
+
+        self.vacuum(conn)
+        self.runs += 1
+        return compacted
+
+    def _compact_batch(self, conn, cutoff):
+        row = conn.execute("SELECT MIN(timestamp) FROM login_attempts").fetchone()
+        if row[0] is None or row[0] >= cutoff:
+            return 0
+        start = floor_minute(row[0])
+
+        # end the batch on the minute of the `batch_rows`-th row; a single
+        # minute larger than a batch is still taken whole
+        row = conn.execute(
+            "SELECT timestamp FROM login_attempts WHERE timestamp >= ? "
+            "ORDER BY timestamp LIMIT 1 OFFSET ?",
+            (start, self.batch_rows),
+        ).fetchone()
+        end = cutoff if row is None else min(cutoff, max(floor_minute(row[0]), start + 60))
+
+        with conn:
+            rollup(conn, "main.login_attempts", "timestamp >= ? AND timestamp < ?", (start, end))
+            rows = conn.execute(
+                "DELETE FROM login_attempts WHERE timestamp >= ? AND timestamp < ?",
+                (start, end),
+            ).rowcount
+
+        self.compacted += rows
+        self.batches += 1
+        return rows
+
+    def _rollup_partition(self, conn, table):
+        # the file is unlinked afterwards, so no DELETE is needed
+        with conn:
+            rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            rollup(conn, table, "1")
+        self.compacted += rows
+
+    def vacuum(self, conn):
+        """Return free pages to the OS if the file allows incremental vacuum."""
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != AUTO_VACUUM_INCREMENTAL:
+            return 0
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free:
+            # execute() steps the pragma only once (one page); executescript()
+            # runs it to completion
+            conn.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages});")
+        return free
+
+    # -------- background thread --------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                rows = self.run_once()
+                if rows:
+                    print(f"[+] Compacted {rows} login attempts into roll-ups")
+            except sqlite3.Error as e:
+                self.failed += 1
+                print(f"[!] Compaction failed: {e}")
+            self._stopping.wait(self.interval)
+
+    def stats(self):
+        return {
+            "compacted": self.compacted,
+            "partitions_dropped": self.partitions_dropped,
+            "rollups_expired": self.rollups_expired,
+            "batches": self.batches,
+            "runs": self.runs,
+            "failed": self.failed,
+        }
+
+
+def enable_incremental_vacuum(conn):
+    """
+    Switch an existing database to auto_vacuum=INCREMENTAL. This needs a full
+    VACUUM, which rewrites the file and locks it, so run it while the
+    services are stopped.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+# -------- CLI --------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=os.environ.get("AI_GUARD_DB_PATH", "login.db"))
+    parser.add_argument("--once", action="store_true", help="run one compaction pass and exit")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="convert the file to auto_vacuum=INCREMENTAL (runs VACUUM)")
+    args = parser.parse_args()
+
+    # the background thread of CompactionJob reuses this connection
+    conn = sqlite3.connect(args.db, check_same_thread=False)
+    conn.execute("PRAGMA busy_timeout = 5000")
+    migrations.migrate(conn)
+
+    if args.enable_incremental_vacuum:
+        conn.isolation_level = None
+        if enable_incremental_vacuum(conn):
+            print(f"[+] {args.db} now uses incremental vacuum")
+        else:
+            print(f"[+] {args.db} already uses incremental vacuum")
+        return
+
+    parts = None
+    if partitions.PARTITION_MODE != "none":
+        parts = partitions.PartitionSet(args.db)
+    job = CompactionJob(lambda: conn, partitions=parts)
+    if args.once:
+        rows = job.run_once()
+        print(f"[+] Compacted {rows} login attempts, expired {job.rollups_expired} roll-ups")
+        return
+
+    job.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        job.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Bulk extraction of training features from the login_attempts table.
+
+For every login attempt, computes the FEATURE_NAMES the guard would have
+seen for that IP right after the attempt was logged: the attempts of the
+IP in the 10 minutes up to and including it, exactly as FeatureStore.record
+followed by FeatureStore.features(ip, now=timestamp) produces them.
+
+The table is read in chunks of about --chunk-rows rows in timestamp order
+(partitions included); each chunk carries the previous 10 minutes of rows
+as context, so memory stays bounded by the chunk size plus one window.
+Within a chunk everything is vectorised over (ip, timestamp)-sorted arrays:
+
+  - window start of each row: one searchsorted on an (ip, timestamp) key
+  - total / failed attempts: positions and prefix sums
+  - unique usernames: each repeated (ip, username) pair is "live" for a
+    contiguous range of windows, accumulated with a difference array
+  - min delta: range minimum over inter-arrival deltas (sparse table)
+
+Output is a CSV with ip, timestamp, the features and optionally a label,
+readable by train_model.py. With --verify every row is checked against
+the online FeatureStore.
+
+    python extract_features.py --db login.db --out features.csv --labels-from-decisions
+    python extract_features.py --db login.db --out ip_features.csv --per-ip --verify
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import ai_guard
+
+CHUNK_ROWS = 500_000
+WINDOW_SECONDS = ai_guard.FEATURE_WINDOW_MINUTES * 60
+
+# -------- Reading --------
+
+def source_tables(conn, since=None, until=None):
+    """(table, bucket start or None) pairs that can hold attempts in [since, until]."""
+    parts = ai_guard.get_partitions()
+    if parts is None:
+        return [("login_attempts", None)]
+    return ((table, None if table == "main.login_attempts" else parts.start(table.split(".")[0][1:]))
+            for table in parts.tables(conn, since=since, until=until))
+
+
+def first_timestamp(conn):
+    first = None
+    for table, _ in source_tables(conn):
+        ts = conn.execute(f"SELECT MIN(timestamp) FROM {table}").fetchone()[0]
+        if ts is not None:
+            first = ts if first is None else min(first, ts)
+    return first
+
+
+def chunk_end(conn, start, chunk_rows):
+    """
+    Exclusive end timestamp of the chunk starting at `start`: the timestamp
+    `chunk_rows` rows later in the first table that has that many, or None
+    if the rest of the data fits in one chunk.
+    """
+    end = None
+    for table, bucket_start in source_tables(conn, since=start):
+        if end is not None and bucket_start is not None and bucket_start >= end:
+            break
+        row = conn.execute(
+            f"SELECT timestamp FROM {table} WHERE timestamp >= ? ORDER BY timestamp LIMIT 1 OFFSET ?",
+            (start, chunk_rows),
+        ).fetchone()
+        if row is not None:
+            end = row[0] if end is None else min(end, row[0])
+    # a chunk always advances, even if one timestamp holds chunk_rows rows
+    return None if end is None else max(end, start + 1)
+
+
+def read_chunks(conn, chunk_rows=CHUNK_ROWS):
+    """Yield DataFrames (timestamp, ip, username, success) in log order."""
+    start = first_timestamp(conn)
+    if start is None:
+        return
+    while True:
+        end = chunk_end(conn, start, chunk_rows)
+        frames = []
+        for table, _ in source_tables(conn, since=start, until=None if end is None else end - 1):
+            df = pd.read_sql_query(
+                f"SELECT timestamp, ip, username, success FROM {table} "
+                "WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp, id",
+                conn, params=(start, end if end is not None else 2 ** 62),
+            )
+            if len(df):
+                frames.append(df)
+        if len(frames) == 1:
+            yield frames[0]
+        elif frames:
+            # main first, then partitions, for rows sharing a timestamp
+            yield pd.concat(frames, ignore_index=True).sort_values("timestamp", kind="stable", ignore_index=True)
+        if end is None:
+            return
+        start = end
+
+# -------- Vectorised features --------
+
+def range_min(values, lo, hi):
+    """min(values[lo[i]:hi[i]]) for every i (all ranges non-empty), via a sparse table."""
+    result = np.empty(len(lo), dtype=values.dtype)
+    lengths = hi - lo
+    levels = np.floor(np.log2(lengths)).astype(np.int64)
+    table = values
+    for level in range(int(levels.max()) + 1):
+        if level:
+            # table[i] = min(values[i:i + 2**level])
+            half = 1 << (level - 1)
+            table = np.minimum(table[:-half], table[half:])
+        pick = levels == level
+        if pick.any():
+            width = 1 << level
+            result[pick] = np.minimum(table[lo[pick]], table[hi[pick] - width])
+    return result
+
+
+def window_features(ts, ip_codes, user_codes, failed, window_seconds=WINDOW_SECONDS):
+    """
+    Features of every row, each over the rows of its IP with timestamp in
+    [ts - window, ts] that come at or before it. Rows must be in log order.
+    Returns an (n, 5) float array in the input order.
+    """
+    n = len(ts)
+    pos = np.arange(n)
+    order = np.lexsort((pos, ip_codes))
+    ts_s = ts[order]
+    ip_s = ip_codes[order]
+
+    # (ip, ts) as one sortable int64 key; spans of different IPs never overlap
+    rel = ts_s - ts_s.min()
+    span = int(rel.max()) + window_seconds + 1
+    key = ip_s.astype(np.int64) * span + rel
+    lo = np.searchsorted(key, key - window_seconds, side="left")
+
+    total = pos - lo + 1
+    failed_cum = np.concatenate(([0], np.cumsum(failed[order])))
+    failed_attempts = failed_cum[pos + 1] - failed_cum[lo]
+
+    # an (ip, username) seen again at j after p stays a repeat for every
+    # window that contains p, i.e. for rows j .. last row with ts <= ts[p] + window
+    user_s = user_codes[order]
+    by_user = np.lexsort((pos, user_s, ip_s))
+    same = (ip_s[by_user][1:] == ip_s[by_user][:-1]) & (user_s[by_user][1:] == user_s[by_user][:-1])
+    j = by_user[1:][same]
+    p = by_user[:-1][same]
+    last = np.searchsorted(key, key[p] + window_seconds, side="right") - 1
+    live = j <= last
+    diff = np.bincount(j[live], minlength=n + 1) - np.bincount(last[live] + 1, minlength=n + 1)
+    unique_usernames = total - np.cumsum(diff[:-1])
+
+    # delta[k] = ts[k] - ts[k-1] within an IP; min over the pairs inside [lo, k]
+    delta = np.empty(n, dtype=np.int64)
+    delta[0] = 0
+    delta[1:] = ts_s[1:] - ts_s[:-1]
+    min_delta = np.full(n, window_seconds, dtype=np.int64)
+    has_pair = lo < pos
+    if has_pair.any():
+        min_delta[has_pair] = range_min(delta, lo[has_pair] + 1, pos[has_pair] + 1)
+
+    features = np.empty((n, 5))
+    features[order, 0] = total
+    features[order, 1] = failed_attempts
+    features[order, 2] = (total - failed_attempts) / total
+    features[order, 3] = unique_usernames
+    features[order, 4] = min_delta
+    return features
+
+
+def extract(conn, chunk_rows=CHUNK_ROWS, window_seconds=WINDOW_SECONDS):
+    """
+    Yield (attempts, features) DataFrame pairs, one per chunk: the rows read
+    and their (ip, timestamp, *FEATURE_NAMES), one row per attempt in log order.
+    """
+    context = None
+    for chunk in read_chunks(conn, chunk_rows):
+        rows = chunk if context is None else pd.concat([context, chunk], ignore_index=True)
+        skip = 0 if context is None else len(context)
+
+        ts = rows["timestamp"].to_numpy(dtype=np.int64)
+        ip_codes, _ = pd.factorize(rows["ip"], use_na_sentinel=False)
+        user_codes, _ = pd.factorize(rows["username"], use_na_sentinel=False)
+        # the online store counts anything falsy (0, NULL) as a failure
+        failed = (rows["success"].fillna(0).to_numpy() == 0).astype(np.int64)
+
+        features = window_features(ts, ip_codes, user_codes, failed, window_seconds)
+        out = pd.DataFrame(features[skip:], columns=ai_guard.FEATURE_NAMES)
+        out.insert(0, "timestamp", ts[skip:])
+        out.insert(0, "ip", rows["ip"].to_numpy()[skip:])
+        yield chunk, out
+
+        # the next chunk starts at or after this one's last timestamp
+        context = rows[rows["timestamp"] >= ts[-1] - window_seconds].reset_index(drop=True)
+
+
+def verify(frame, store, chunk):
+    """Replay a chunk through the online FeatureStore; return the number of mismatching rows."""
+    expected = np.empty((len(chunk), 5))
+    for i, (ts, ip, username, success) in enumerate(chunk.itertuples(index=False, name=None)):
+        # NULL success reads back as NaN, which is truthy
+        store.record(ip, ts, username, success if success == success else None)
+        expected[i] = store.features(ip, now=ts)
+    got = frame[ai_guard.FEATURE_NAMES].to_numpy()
+    bad = ~(got == expected).all(axis=1)
+    for i in np.flatnonzero(bad)[:5]:
+        print(f"[!] {frame['ip'].iat[i]} @ {frame['timestamp'].iat[i]}: "
+              f"extracted {got[i].tolist()}, online {expected[i].tolist()}")
+    return int(bad.sum())
+
+# -------- Labels --------
+
+def load_labels(conn, labels_path, from_decisions):
+    """ip -> label (1 attacker, 0 benign) from a CSV (ip,label) and/or ip_decisions."""
+    labels = {}
+    if from_decisions:
+        for ip, decision in conn.execute("SELECT ip, decision FROM ip_decisions"):
+            labels[ip] = 1 if decision == "block" else 0
+    if labels_path:
+        df = pd.read_csv(labels_path)
+        labels.update(zip(df["ip"], df["label"].astype(int)))
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=ai_guard.DB_PATH)
+    parser.add_argument("--out", default="features.csv")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--per-ip", action="store_true",
+                        help="one row per IP (its features at its last attempt) instead of one per attempt")
+    parser.add_argument("--labels", help="CSV with ip,label columns")
+    parser.add_argument("--labels-from-decisions", action="store_true",
+                        help="label IPs blocked in ip_decisions as attackers, every other IP as benign")
+    parser.add_argument("--verify", action="store_true",
+                        help="check every row against the online FeatureStore (slow)")
+    args = parser.parse_args()
+
+    ai_guard.DB_PATH = args.db
+    conn = sqlite3.connect(args.db)
+    labels = load_labels(conn, args.labels, args.labels_from_decisions)
+    labelled = args.labels or args.labels_from_decisions
+
+    store = ai_guard.FeatureStore() if args.verify else None
+    mismatches = rows = 0
+    per_ip = None
+    if os.path.exists(args.out):
+        os.remove(args.out)
+
+    start = time.perf_counter()
+    for chunk, frame in extract(conn, args.chunk_rows):
+        if store is not None:
+            mismatches += verify(frame, store, chunk)
+        rows += len(frame)
+        if labelled:
+            frame["label"] = frame["ip"].map(labels).fillna(0).astype(int)
+        if args.per_ip:
+            last = frame.drop_duplicates("ip", keep="last")
+            per_ip = last if per_ip is None else pd.concat([per_ip, last]).drop_duplicates("ip", keep="last")
+        else:
+            frame.to_csv(args.out, mode="a", header=not os.path.exists(args.out), index=False)
+        print(f"[+] {rows} attempts processed ({rows / (time.perf_counter() - start):.0f} rows/s)")
+
+    if args.per_ip and per_ip is not None:
+        per_ip.to_csv(args.out, index=False)
+    elapsed = time.perf_counter() - start
+    print(f"[+] {rows} attempts in {elapsed:.1f}s, features written to {args.out}")
+    if args.verify:
+        if mismatches:
+            print(f"[!] {mismatches} rows differ from the online FeatureStore")
+            raise SystemExit(1)
+        print("[+] Every row matches the online FeatureStore")
+
+
+if __name__ == "__main__":
+    main()
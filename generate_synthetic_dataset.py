@@ -1,90 +1,290 @@
+"""
+Synthetic login traffic and training features, generated in vectorised chunks.
+
+Every IP belongs to one archetype and runs one session of attempts
+starting at a random time within --span-hours:
+
+  benign               a few attempts on its own accounts, mostly
+                       successful, seconds to half a minute apart
+  brute_force          hammers a handful of common usernames, sub-second
+  credential_stuffing  a different leaked username on almost every
+                       attempt, a few successes
+  low_and_slow         a few failures every few minutes, to stay under
+                       per-window thresholds
+
+The raw attempt stream (--raw-out) is written in global timestamp order,
+with the same columns as login_attempts plus archetype and label; .ndjson
+files can be fed to replay.py. The training set (--out) has one row per IP
+with the five features the guard computes at that IP's last attempt (see
+extract_features.py), plus archetype and label. Outputs are written chunk
+by chunk as CSV, NDJSON or Parquet (pyarrow needed) based on the file
+extension, so 100M attempts never have to fit in memory.
+
+    python generate_synthetic_dataset.py
+    python generate_synthetic_dataset.py --benign 1000000 --brute-force 20000 \\
+        --credential-stuffing 20000 --low-and-slow 50000 --raw-out events.parquet --out dataset.csv
+"""
+import argparse
+import os
+import time
+
 import numpy as np
 import pandas as pd
 
+from extract_features import window_features
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only needed for .parquet outputs
+    pyarrow = None
+
 OUTPUT_CSV = "dataset.csv"
+CHUNK_ROWS = 1_000_000
+START_TS = 1_760_000_000
+
+# per-IP draws: attempts per session [low, high), mean seconds between
+# attempts [low, high), success probability [low, high), usernames [low, high)
+ARCHETYPES = {
+    "benign":              dict(label=0, attempts=(3, 20), delta=(2.0, 30.0), success=(0.6, 1.0), usernames=(1, 4)),
+    "brute_force":         dict(label=1, attempts=(30, 200), delta=(0.05, 0.5), success=(0.0, 0.02), usernames=(1, 4)),
+    "credential_stuffing": dict(label=1, attempts=(20, 150), delta=(0.2, 2.0), success=(0.01, 0.05), usernames=None),
+    "low_and_slow":        dict(label=1, attempts=(5, 30), delta=(60.0, 300.0), success=(0.0, 0.0), usernames=(1, 3)),
+}
+ARCHETYPE_NAMES = list(ARCHETYPES)
+# first octet of each archetype's addresses, so IPs never collide across archetypes
+IP_PREFIX = {"benign": 10, "brute_force": 185, "credential_stuffing": 45, "low_and_slow": 91}
+
+COMMON_USERNAMES = np.array(["admin", "root", "test", "user", "guest", "administrator", "oracle", "support"],
+                            dtype=object)
+USER_AGENTS = {
+    "benign": ["Mozilla/5.0 (Windows NT 10.0; Win64; x64)", "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5)",
+               "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X)"],
+    "brute_force": ["python-requests/2.32", "hydra"],
+    "credential_stuffing": ["Mozilla/5.0 (Windows NT 10.0; Win64; x64)", "okhttp/4.12"],
+    "low_and_slow": ["Mozilla/5.0 (X11; Linux x86_64)", "curl/8.5"],
+}
+
+# -------- Population --------
+
+def draw_population(rng, counts, span_seconds):
+    """
+    One entry per IP, as a dict of arrays sorted by session start:
+    archetype code, index within the archetype, start time, attempts,
+    mean delta, success probability, number of usernames, username base.
+    """
+    columns = {k: [] for k in ("archetype", "index", "start", "attempts", "delta", "success", "n_users")}
+    for code, name in enumerate(ARCHETYPE_NAMES):
+        n = counts.get(name, 0)
+        if n == 0:
+            continue
+        spec = ARCHETYPES[name]
+        columns["archetype"].append(np.full(n, code, dtype=np.int8))
+        columns["index"].append(np.arange(n))
+        columns["start"].append(START_TS + rng.uniform(0, span_seconds, n))
+        columns["attempts"].append(rng.integers(*spec["attempts"], n))
+        columns["delta"].append(rng.uniform(*spec["delta"], n))
+        columns["success"].append(rng.uniform(*spec["success"], n))
+        columns["n_users"].append(rng.integers(*spec["usernames"], n) if spec["usernames"] else np.zeros(n, dtype=np.int64))
+
+    population = {k: np.concatenate(v) for k, v in columns.items()}
+    population["user_base"] = rng.integers(0, 10_000_000, len(population["start"]))
+    order = np.argsort(population["start"], kind="stable")
+    return {k: v[order] for k, v in population.items()}
+
+
+def ip_strings(archetype, index):
+    prefix = np.array([IP_PREFIX[name] for name in ARCHETYPE_NAMES])[archetype]
+    octets = [prefix, index >> 16 & 255, index >> 8 & 255, index & 255]
+    out = octets[0].astype(str).astype(object)
+    for octet in octets[1:]:
+        out = out + "." + octet.astype(str).astype(object)
+    return out
+
+# -------- Attempts --------
+
+def generate_attempts(rng, population, lo, hi, n_apps=1):
+    """Attempts of IPs lo..hi of the population, as a DataFrame sorted by timestamp."""
+    attempts = population["attempts"][lo:hi]
+    ip_pos = np.repeat(np.arange(lo, hi), attempts)
+    n = len(ip_pos)
+    archetype = population["archetype"][ip_pos]
+
+    # times: session start + cumulative jittered deltas, first attempt at the start
+    deltas = population["delta"][ip_pos] * rng.uniform(0.5, 1.5, n)
+    first = np.concatenate(([0], np.cumsum(attempts)[:-1]))
+    deltas[first] = 0.0
+    elapsed = np.cumsum(deltas)
+    elapsed -= np.repeat(elapsed[first], attempts)
+    timestamp = (population["start"][ip_pos] + elapsed).astype(np.int64)
+
+    success = rng.random(n) < population["success"][ip_pos]
+
+    # usernames: own accounts (benign, low and slow), common names (brute
+    # force) or a fresh leaked one per attempt (credential stuffing)
+    n_users = np.maximum(population["n_users"][ip_pos], 1)
+    pick = rng.integers(0, 1 << 30, n) % n_users
+    user_ids = np.where(population["n_users"][ip_pos] > 0,
+                        population["user_base"][ip_pos] + pick,
+                        rng.integers(0, 10_000_000, n))
+    username = ("user" + user_ids.astype(str).astype(object))
+    brute = archetype == ARCHETYPE_NAMES.index("brute_force")
+    username[brute] = COMMON_USERNAMES[(population["user_base"][ip_pos[brute]] + pick[brute]) % len(COMMON_USERNAMES)]
+
+    user_agent = np.empty(n, dtype=object)
+    for code, name in enumerate(ARCHETYPE_NAMES):
+        mine = archetype == code
+        if mine.any():
+            agents = np.array(USER_AGENTS[name], dtype=object)
+            user_agent[mine] = agents[population["user_base"][ip_pos[mine]] % len(agents)]
+
+    if n_apps > 1:
+        app = "app" + (population["user_base"][ip_pos] % n_apps).astype(str).astype(object)
+    else:
+        app = "default"
+
+    df = pd.DataFrame({
+        "timestamp": timestamp,
+        "ip": ip_strings(population["archetype"][ip_pos], population["index"][ip_pos]),
+        "username": username,
+        "success": success.astype(np.int8),
+        "user_agent": user_agent,
+        "app": app,
+        "archetype": np.array(ARCHETYPE_NAMES, dtype=object)[archetype],
+        "label": np.array([ARCHETYPES[a]["label"] for a in ARCHETYPE_NAMES], dtype=np.int8)[archetype],
+        "_ip": ip_pos,
+    })
+    return df.sort_values("timestamp", kind="stable", ignore_index=True)
+
+
+def ip_features(attempts):
+    """
+    One row per IP of `attempts` (whole sessions, in timestamp order): its
+    features at its last attempt, as the guard would compute them.
+    """
+    user_codes, _ = pd.factorize(attempts["username"])
+    features = window_features(
+        attempts["timestamp"].to_numpy(), attempts["_ip"].to_numpy(), user_codes,
+        (attempts["success"].to_numpy() == 0).astype(np.int64),
+    )
+    last = ~attempts["_ip"].duplicated(keep="last").to_numpy()
+    out = pd.DataFrame(features[last], columns=["total_attempts", "failed_attempts", "success_rate",
+                                                "unique_usernames", "min_delta"])
+    out.insert(0, "ip", attempts["ip"].to_numpy()[last])
+    out["archetype"] = attempts["archetype"].to_numpy()[last]
+    out["label"] = attempts["label"].to_numpy()[last]
+    return out
+
+# -------- Output --------
+
+class ChunkWriter:
+    """Append DataFrames to a .csv, .ndjson or .parquet file (optionally .gz for the text formats)."""
+
+    def __init__(self, path):
+        self.path = path
+        base = path[:-3] if path.endswith(".gz") else path
+        self.format = os.path.splitext(base)[1].lstrip(".")
+        if self.format not in ("csv", "ndjson", "parquet"):
+            raise ValueError(f"{path}: expected a .csv, .ndjson or .parquet file")
+        if self.format == "parquet" and pyarrow is None:
+            raise ValueError("writing Parquet needs pyarrow (pip install pyarrow)")
+        self.rows = 0
+        self._header = False   # an empty first chunk still writes the CSV header
+        self._parquet = None
+        self._text = None
+        if self.format == "parquet":
+            return
+        if path.endswith(".gz"):
+            import gzip
+            self._text = gzip.open(path, "wt", encoding="utf-8")
+        else:
+            self._text = open(path, "w", encoding="utf-8")
+
+    def write(self, df):
+        if self.format == "parquet":
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        elif self.format == "csv":
+            df.to_csv(self._text, header=not self._header, index=False)
+            self._header = True
+        else:
+            df.to_json(self._text, orient="records", lines=True)
+        self.rows += len(df)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._text is not None:
+            self._text.close()
+
+
+def generate(counts, span_seconds, out, raw_out, n_apps=1, chunk_rows=CHUNK_ROWS, seed=42):
+    rng = np.random.default_rng(seed)
+    population = draw_population(rng, counts, span_seconds)
+    n_ips = len(population["start"])
+    features_writer = ChunkWriter(out) if out else None
+    raw_writer = ChunkWriter(raw_out) if raw_out else None
+
+    # chunk boundaries: whole IPs, about chunk_rows attempts each
+    ends = np.cumsum(population["attempts"])
+    carry = None
+    lo = 0
+    start = time.perf_counter()
+    try:
+        while lo < n_ips:
+            hi = max(lo + 1, int(np.searchsorted(ends, (ends[lo - 1] if lo else 0) + chunk_rows, side="right")))
+            attempts = generate_attempts(rng, population, lo, hi, n_apps)
+            if features_writer is not None:
+                features_writer.write(ip_features(attempts))
+
+            if raw_writer is not None:
+                # later chunks only start after population["start"][hi], so
+                # everything before it is final; the rest waits for them
+                if carry is not None:
+                    attempts = pd.concat([carry, attempts], ignore_index=True).sort_values(
+                        "timestamp", kind="stable", ignore_index=True)
+                cut = int(population["start"][hi]) if hi < n_ips else None
+                split = len(attempts) if cut is None else int(np.searchsorted(attempts["timestamp"].to_numpy(), cut))
+                raw_writer.write(attempts.iloc[:split].drop(columns="_ip"))
+                carry = attempts.iloc[split:]
+            lo = hi
+            print(f"[+] {hi}/{n_ips} IPs, {ends[hi - 1]} attempts generated "
+                  f"({ends[hi - 1] / (time.perf_counter() - start):.0f} attempts/s)")
+    finally:
+        for writer in (features_writer, raw_writer):
+            if writer is not None:
+                writer.close()
+
+    if features_writer is not None:
+        print(f"[+] Synthetic dataset generated: {out} ({features_writer.rows} IPs)")
+    if raw_writer is not None:
+        print(f"[+] Raw attempts written to {raw_out} ({raw_writer.rows} attempts)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--benign", type=int, default=50, help="benign IPs")
+    parser.add_argument("--brute-force", type=int, default=15, help="brute-force IPs")
+    parser.add_argument("--credential-stuffing", type=int, default=10, help="credential-stuffing IPs")
+    parser.add_argument("--low-and-slow", type=int, default=5, help="low-and-slow IPs")
+    parser.add_argument("--span-hours", type=float, default=24.0, help="sessions start within this period")
+    parser.add_argument("--apps", type=int, default=1, help="protected apps; each IP targets one")
+    parser.add_argument("--out", default=OUTPUT_CSV, help="per-IP training features ('' to skip)")
+    parser.add_argument("--raw-out", help="raw timestamped attempts (.csv, .ndjson or .parquet)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    counts = {
+        "benign": args.benign,
+        "brute_force": args.brute_force,
+        "credential_stuffing": args.credential_stuffing,
+        "low_and_slow": args.low_and_slow,
+    }
+    generate(counts, int(args.span_hours * 3600), args.out, args.raw_out, args.apps, args.chunk_rows, args.seed)
 
-def generate_synthetic_data():
-    np.random.seed(42)
-
-    rows = []
-
-    # ---------- Normal / benign IPs ----------
-    # Behave like real users:
-    # - few attempts
-    # - mostly successful
-    # - larger time between attempts
-    num_benign_ips = 50
-
-    for i in range(num_benign_ips):
-        ip = f"10.0.0.{i+1}"
-
-        # total attempts between 3 and 20
-        total_attempts = int(np.random.randint(3, 20))
-
-        # failed attempts small
-        failed_attempts = int(np.random.randint(0, min(5, total_attempts)))
-        success_attempts = total_attempts - failed_attempts
-
-        success_rate = success_attempts / total_attempts if total_attempts > 0 else 0.0
-
-        # typical user: 1–3 usernames (typos, or 1 per device)
-        unique_usernames = int(np.random.randint(1, 4))
-
-        # time between attempts: human speed → 2 to 30 seconds
-        min_delta = float(np.random.uniform(2.0, 30.0))
-
-        rows.append({
-            "ip": ip,
-            "total_attempts": total_attempts,
-            "failed_attempts": failed_attempts,
-            "success_rate": success_rate,
-            "unique_usernames": unique_usernames,
-            "min_delta": min_delta,
-            "label": 0,   # benign
-        })
-
-    # ---------- Attacker IPs ----------
-    # Behave like brute-force / credential stuffing:
-    # - many attempts
-    # - mostly failures
-    # - very small time between attempts
-    num_attack_ips = 30
-
-    for i in range(num_attack_ips):
-        ip = f"192.168.1.{i+1}"
-
-        # attackers hammer: 30–200 attempts
-        total_attempts = int(np.random.randint(30, 200))
-
-        # almost all fail, maybe a couple successes
-        successes = int(np.random.randint(0, 3))
-        failed_attempts = total_attempts - successes
-        success_rate = successes / total_attempts if total_attempts > 0 else 0.0
-
-        # credential stuffing: 1–10 usernames from same IP
-        unique_usernames = int(np.random.randint(1, 10))
-
-        # very fast attempts: 0.05–0.5 seconds between attempts
-        min_delta = float(np.random.uniform(0.05, 0.5))
-
-        rows.append({
-            "ip": ip,
-            "total_attempts": total_attempts,
-            "failed_attempts": failed_attempts,
-            "success_rate": success_rate,
-            "unique_usernames": unique_usernames,
-            "min_delta": min_delta,
-            "label": 1,   # attacker
-        })
-
-    df = pd.DataFrame(rows)
-    df.to_csv(OUTPUT_CSV, index=False)
-
-    print(f"[+] Synthetic dataset generated: {OUTPUT_CSV}")
-    print(df.head())
-    print()
-    print("Class distribution:")
-    print(df['label'].value_counts())
 
 if __name__ == "__main__":
-    generate_synthetic_data()
+    main()
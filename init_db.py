@@ -1,36 +1,30 @@
 import sqlite3
-from datetime import datetime
+import sys
+
+import migrations
 
 DB_PATH = "login.db"
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Table of login attempts
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS login_attempts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp INTEGER,
-            ip TEXT,
-            username TEXT,
-            success INTEGER,
-            user_agent TEXT
-        )
-    """)
-
-    # Table for IP decisions (block / challenge)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS ip_decisions (
-            ip TEXT PRIMARY KEY,
-            decision TEXT,            -- 'allow', 'challenge', 'block'
-            last_update INTEGER
-        )
-    """)
+    migrations.migrate(conn)
+    conn.close()
+    print(f"DB initialized (schema version {migrations.SCHEMA_VERSION}).")
 
-    conn.commit()
+def check_query_plans():
+    conn = sqlite3.connect(DB_PATH)
+    failures = migrations.check_query_plans(conn)
     conn.close()
-    print("DB initialized.")
+
+    if not failures:
+        print("All hot queries use an index.")
+        return True
+    for name, problems in failures.items():
+        print(f"[!] {name}: {'; '.join(problems)}")
+    return False
 
 if __name__ == "__main__":
     init_db()
+    # `python init_db.py --check` also fails if a hot query regressed to a full scan
+    if "--check" in sys.argv[1:] and not check_query_plans():
+        sys.exit(1)
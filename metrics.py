@@ -0,0 +1,209 @@
+"""
+Minimal Prometheus instrumentation for ai_guard.
+
+Counters and histograms are plain in-process objects updated on the
+request path (a lock and a few integer increments, so a request pays a
+couple of microseconds); everything that already has its own counters
+(connection pool, decision cache, write-behind queue, ...) is read through
+callbacks only when /metrics is scraped. render() produces the Prometheus
+text exposition format, version 0.0.4, without needing prometheus_client.
+"""
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 5us .. 1s, for in-process stages that are usually tens of microseconds
+LATENCY_BUCKETS = (
+    0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _sort_key(item):
+    # label values are strings once rendered; sort them that way so that
+    # mixed types (None next to "default") can't break a scrape
+    return tuple(str(v) for v in item[0])
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by labels: inc(("block", "shop"))."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items(), key=_sort_key):
+            yield self.name + "_total", _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """
+    Cumulative buckets, sum and count per label set. Buckets are kept as
+    plain per-bucket counts and only accumulated when rendered.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            try:
+                row = self._series[labels]
+            except KeyError:
+                row = self._series[labels] = self._new_row()
+            row[i] += 1
+            row[-1] += value
+
+    def observe_many(self, observations):
+        """Record several (labels, value) pairs under one lock acquisition."""
+        buckets = self.buckets
+        with self._lock:
+            for labels, value in observations:
+                try:
+                    row = self._series[labels]
+                except KeyError:
+                    row = self._series[labels] = self._new_row()
+                row[bisect.bisect_left(buckets, value)] += 1
+                row[-1] += value
+
+    def _new_row(self):
+        # one count per bucket, one for +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(row) for labels, row in self._series.items()}
+        for labels, row in sorted(series.items(), key=_sort_key):
+            cumulative = 0
+            for upper, n in zip(self.buckets + (math.inf,), row):
+                cumulative += n
+                yield (self.name + "_bucket",
+                       _labels(self.labelnames, labels, f'le="{_number(float(upper))}"'),
+                       cumulative)
+            yield self.name + "_sum", _labels(self.labelnames, labels), row[-1]
+            yield self.name + "_count", _labels(self.labelnames, labels), cumulative
+
+
+class Callback:
+    """
+    A gauge or counter whose value is read from `fn` at scrape time. `fn`
+    returns a number, or a {label values tuple: number} dict, or None to
+    leave the metric out.
+    """
+
+    def __init__(self, name, documentation, fn, type="gauge", labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.type = type
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.fn()
+        if value is None:
+            return
+        name = self.name + "_total" if self.type == "counter" else self.name
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items(), key=_sort_key):
+                yield name, _labels(self.labelnames, labels), v
+        else:
+            yield name, "", value
+
+
+class LabelValues:
+    """
+    Bounds the values one label can take when they come from clients: the
+    first `limit` distinct values are kept, any later one is reported as
+    `overflow`, so a client can't create unlimited series.
+    """
+
+    def __init__(self, limit, default="default", overflow="other"):
+        self.limit = limit
+        self.default = default
+        self.overflow = overflow
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        value = str(value) if value else self.default
+        if value in self._seen:
+            return value
+        with self._lock:
+            if value in self._seen or len(self._seen) < self.limit:
+                self._seen.add(value)
+                return value
+        return self.overflow
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, fn, type="gauge", labelnames=()):
+        return self.register(Callback(name, documentation, fn, type, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            samples = list(metric.samples())
+            if not samples and isinstance(metric, Callback):
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
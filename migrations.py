@@ -0,0 +1,256 @@
+"""
+Versioned schema migrations for login.db, shared by init_db.py and ai_guard.py.
+
+The version of a database is kept in PRAGMA user_version; migrate() applies
+every missing step in order, each one in its own transaction, so existing
+login.db files are upgraded in place.
+"""
+
+
+def _base_tables(c):
+    # login attempts table
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS login_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER,
+            ip TEXT,
+            username TEXT,
+            success INTEGER,
+            user_agent TEXT,
+            app TEXT
+        )
+    """)
+
+    # decisions per IP (global per IP, not per app)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS ip_decisions (
+            ip TEXT PRIMARY KEY,
+            decision TEXT,            -- 'allow', 'challenge', 'block'
+            last_update INTEGER
+        )
+    """)
+
+
+def _app_column(c):
+    # databases created by the old init_db.py have no `app` column
+    columns = {row[1] for row in c.execute("PRAGMA table_info(login_attempts)")}
+    if "app" not in columns:
+        c.execute("ALTER TABLE login_attempts ADD COLUMN app TEXT")
+
+
+def _indexes(c):
+    # features of one IP over a time window
+    c.execute("CREATE INDEX IF NOT EXISTS idx_login_attempts_ip_ts ON login_attempts (ip, timestamp)")
+    # apps / last attempt per (ip, app) for the blocked list and unblock
+    c.execute("CREATE INDEX IF NOT EXISTS idx_login_attempts_ip_app_ts ON login_attempts (ip, app, timestamp)")
+    # most recent attempts for the dashboard, window rebuilds
+    c.execute("CREATE INDEX IF NOT EXISTS idx_login_attempts_ts ON login_attempts (timestamp)")
+    # blocked IPs ordered by last update
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ip_decisions_decision_update ON ip_decisions (decision, last_update)")
+
+
+def _blocked_listing_indexes(c):
+    # keyset pagination of blocked IPs needs `ip` as the tie-breaker in the index
+    c.execute("DROP INDEX IF EXISTS idx_ip_decisions_decision_update")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ip_decisions_decision_update_ip ON ip_decisions (decision, last_update, ip)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ip_decisions_decision_ip ON ip_decisions (decision, ip)")
+
+
+def _decision_score(c):
+    # last model score next to the decision, read by the admin dashboard
+    columns = {row[1] for row in c.execute("PRAGMA table_info(ip_decisions)")}
+    if "score" not in columns:
+        c.execute("ALTER TABLE ip_decisions ADD COLUMN score REAL")
+
+
+def _rollups(c):
+    # per-IP, per-app, per-minute aggregates of compacted login attempts
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS login_attempt_rollups (
+            ip TEXT NOT NULL,
+            app TEXT NOT NULL,                -- NULL app is stored as 'default'
+            minute INTEGER NOT NULL,          -- unix time, floored to the minute
+            attempts INTEGER NOT NULL,
+            failures INTEGER NOT NULL,
+            distinct_usernames INTEGER NOT NULL,
+            PRIMARY KEY (ip, app, minute)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rollups_minute ON login_attempt_rollups (minute)")
+
+
+def _rollup_usernames(c):
+    # the usernames behind each roll-up, so that merging late rows into an
+    # existing minute keeps distinct_usernames exact
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS login_attempt_rollup_usernames (
+            ip TEXT NOT NULL,
+            app TEXT NOT NULL,
+            minute INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (ip, app, minute, username)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rollup_usernames_minute ON login_attempt_rollup_usernames (minute)")
+
+
+# (version, description, step) – append only, never edit a released step
+MIGRATIONS = [
+    (1, "login_attempts and ip_decisions tables", _base_tables),
+    (2, "login_attempts.app column", _app_column),
+    (3, "indexes for the hot queries", _indexes),
+    (4, "keyset indexes for the blocked IP listing", _blocked_listing_indexes),
+    (5, "ip_decisions.score column", _decision_score),
+    (6, "login_attempt_rollups table", _rollups),
+    (7, "login_attempt_rollup_usernames table", _rollup_usernames),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Bring the database behind `conn` up to SCHEMA_VERSION.
+    Returns the list of versions that were applied.
+    """
+    if get_version(conn) == 0 and not conn.execute("SELECT 1 FROM sqlite_master").fetchone():
+        # brand new file: enable incremental vacuum while the VACUUM that
+        # applies it is free (existing files: see compaction.py)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if get_version(conn) >= version:
+            continue
+
+        # BEGIN IMMEDIATE serializes concurrent migrators; re-check after it
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"[+] DB migrated to version {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+# -------- Query plan checks --------
+
+# the hot queries and sample parameters; none of them may fall back to a
+# full table scan or a temporary sort
+QUERY_PLAN_CHECKS = [
+    (
+        "features for one IP",
+        "SELECT timestamp, username, success FROM login_attempts "
+        "WHERE ip = ? AND timestamp >= ? ORDER BY timestamp ASC",
+        ("1.2.3.4", 0),
+    ),
+    (
+        "last attempt per app of one IP",
+        "SELECT COALESCE(app, 'default') AS app, MAX(timestamp) FROM login_attempts "
+        "WHERE ip = ? GROUP BY app",
+        ("1.2.3.4",),
+    ),
+    (
+        "recent attempts",
+        "SELECT id, timestamp, ip, username, success, app FROM login_attempts "
+        "ORDER BY timestamp DESC LIMIT 50",
+        (),
+    ),
+    (
+        "admin score snapshot",
+        "SELECT a.id, a.timestamp, a.ip, a.username, a.success, a.app, d.decision, d.score "
+        "FROM (SELECT id, timestamp, ip, username, success, app FROM login_attempts "
+        "ORDER BY timestamp DESC LIMIT 50) a "
+        "LEFT JOIN ip_decisions d ON d.ip = a.ip",
+        (),
+    ),
+    (
+        "window rebuild",
+        "SELECT timestamp, ip, username, success, app FROM login_attempts "
+        "WHERE timestamp >= ? ORDER BY timestamp ASC, id ASC",
+        (0,),
+    ),
+    (
+        "blocked IPs page by last update",
+        "SELECT ip, last_update FROM ip_decisions WHERE decision = 'block' "
+        "AND (last_update, ip) < (?, ?) ORDER BY last_update DESC, ip DESC LIMIT 100",
+        (2**62, ""),
+    ),
+    (
+        "blocked IPs page by ip",
+        "SELECT ip, last_update FROM ip_decisions WHERE decision = 'block' "
+        "AND ip > ? ORDER BY ip ASC LIMIT 100",
+        ("",),
+    ),
+    (
+        "oldest raw attempt",
+        "SELECT MIN(timestamp) FROM login_attempts",
+        (),
+    ),
+    (
+        "compaction batch boundary",
+        "SELECT timestamp FROM login_attempts WHERE timestamp >= ? "
+        "ORDER BY timestamp LIMIT 1 OFFSET 5000",
+        (0,),
+    ),
+    (
+        "expired rollups",
+        "SELECT ip, app, minute FROM login_attempt_rollups WHERE minute < ? LIMIT 5000",
+        (0,),
+    ),
+    (
+        "expired roll-up usernames",
+        "SELECT ip, app, minute, username FROM login_attempt_rollup_usernames WHERE minute < ? LIMIT 5000",
+        (0,),
+    ),
+    (
+        "unblock history",
+        "DELETE FROM login_attempts WHERE ip = ? AND app = ?",
+        ("1.2.3.4", "default"),
+    ),
+]
+
+
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def plan_problems(plan):
+    # scanning a bounded subquery (e.g. a LIMIT 50 co-routine) is fine
+    subqueries = {
+        detail.split()[-1] for detail in plan
+        if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))
+    }
+    problems = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and " USING " not in detail:
+            if detail.split()[1] not in subqueries:
+                problems.append(detail)
+        elif "USE TEMP B-TREE" in detail:
+            problems.append(detail)
+    return problems
+
+
+def check_query_plans(conn, checks=QUERY_PLAN_CHECKS):
+    """
+    Return {check name: offending plan lines} for every hot query that
+    regressed to a full scan or a temporary sort; empty when all are indexed.
+    """
+    failures = {}
+    for name, sql, params in checks:
+        problems = plan_problems(explain(conn, sql, params))
+        if problems:
+            failures[name] = problems
+    return failures
@@ -0,0 +1,213 @@
+"""
+Online model updates from admin feedback.
+
+Admin actions are labels: unblocking an IP says the behaviour it was last
+scored on is benign, confirming a block says it is an attack. The guard
+hands those (feature row, label) pairs to an OnlineLearner, which queues
+them; a background thread folds them into a StandardScaler and an
+SGDClassifier(loss="log_loss") with partial_fit, in batches of up to
+`batch_size` or every `interval` seconds.
+
+After each update the learner publishes a new Pipeline built from deep
+copies of both steps. Nothing it publishes is touched again, so the guard
+can compile it and swap it in with one reference assignment: requests keep
+scoring with the version they picked up and never wait for training.
+
+When the served model is a StandardScaler + logistic regression pipeline
+(what train_model.py produces) the learner starts from it, with the same
+scaler statistics and coefficients, so the first update is a small step
+away from the deployed model instead of a cold start.
+"""
+import copy
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+BATCH_SIZE = int(os.environ.get("AI_GUARD_ONLINE_BATCH_SIZE", "32"))
+INTERVAL_SECONDS = float(os.environ.get("AI_GUARD_ONLINE_INTERVAL_SECONDS", "10"))
+LEARNING_RATE = float(os.environ.get("AI_GUARD_ONLINE_LEARNING_RATE", "0.01"))
+# without a model to start from, publish only after this many labels
+MIN_FEEDBACK = int(os.environ.get("AI_GUARD_ONLINE_MIN_FEEDBACK", "10"))
+QUEUE_SIZE = int(os.environ.get("AI_GUARD_ONLINE_QUEUE_SIZE", "10000"))
+
+CLASSES = np.array([0, 1])
+
+
+class OnlineLearner:
+    """
+    Incremental StandardScaler + SGDClassifier fed through add_feedback().
+    `publish(pipeline, samples)` is called from the learner thread with
+    every new model.
+    """
+
+    def __init__(self, feature_names, publish, base_model=None, batch_size=BATCH_SIZE,
+                 interval=INTERVAL_SECONDS, learning_rate=LEARNING_RATE,
+                 min_feedback=MIN_FEEDBACK, queue_size=QUEUE_SIZE):
+        self.feature_names = list(feature_names)
+        self.publish = publish
+        self.batch_size = batch_size
+        self.interval = interval
+        self.learning_rate = learning_rate
+        self.min_feedback = min_feedback
+
+        self.scaler, self.clf, self.warm = self._start_from(base_model)
+        self.received = 0
+        self.dropped = 0
+        self.trained = 0
+        self.updates = 0
+        self.errors = 0
+        self.last_update = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._rebase = None
+        self._rebase_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _new_classifier(self):
+        return SGDClassifier(loss="log_loss", learning_rate="constant", eta0=self.learning_rate,
+                             alpha=1e-4)
+
+    def _start_from(self, model):
+        """(scaler, classifier, warm) continuing `model` when it is a scaler + linear pipeline."""
+        steps = getattr(model, "steps", None)
+        if steps and len(steps) == 2:
+            scaler, clf = steps[0][1], steps[1][1]
+            if (isinstance(scaler, StandardScaler) and hasattr(scaler, "n_samples_seen_")
+                    and type(clf).__name__ in ("LogisticRegression", "SGDClassifier")
+                    and getattr(clf, "coef_", None) is not None
+                    and clf.coef_.shape == (1, len(self.feature_names))
+                    and list(clf.classes_) == [0, 1]):
+                sgd = self._new_classifier()
+                # partial_fit carries on from existing coef_/intercept_
+                sgd.coef_ = clf.coef_.astype(np.float64).copy()
+                sgd.intercept_ = clf.intercept_.astype(np.float64).copy()
+                sgd.classes_ = CLASSES
+                return copy.deepcopy(scaler), sgd, True
+        return StandardScaler(), self._new_classifier(), False
+
+    def rebase(self, model):
+        """
+        Continue from `model` (a newly deployed or rolled back version) at the
+        next update, dropping what was learnt on top of the previous one.
+        """
+        with self._rebase_lock:
+            self._rebase = (model,)
+
+    def _take_rebase(self):
+        with self._rebase_lock:
+            rebase, self._rebase = self._rebase, None
+        return rebase
+
+    # -------- feedback --------
+
+    def add_feedback(self, features, label):
+        """Queue one labelled feature row (1 = attack); False if the queue is full."""
+        try:
+            self._queue.put_nowait((np.asarray(features, dtype=np.float64), int(label)))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.received += 1
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    # -------- training --------
+
+    def update(self, batch):
+        """Train on a list of (features, label); publish and return the new model, if any."""
+        rebase = self._take_rebase()
+        if rebase is not None:
+            self.scaler, self.clf, self.warm = self._start_from(rebase[0])
+            self.trained = 0
+
+        X = pd.DataFrame(np.vstack([x for x, _ in batch]), columns=self.feature_names)
+        y = np.array([label for _, label in batch])
+        if hasattr(self.scaler, "mean_") and getattr(self.clf, "coef_", None) is not None:
+            # re-express the classifier in the updated scaling first, so that
+            # moving the scaler statistics alone does not change any score
+            old_mean, old_scale = self.scaler.mean_.copy(), self.scaler.scale_.copy()
+            self.scaler.partial_fit(X)
+            weights = self.clf.coef_ / old_scale
+            self.clf.coef_ = weights * self.scaler.scale_
+            self.clf.intercept_ = self.clf.intercept_ + weights @ (self.scaler.mean_ - old_mean)
+        else:
+            self.scaler.partial_fit(X)
+        self.clf.partial_fit(self.scaler.transform(X), y, classes=CLASSES)
+        self.trained += len(batch)
+        if not self.warm and self.trained < self.min_feedback:
+            return None
+
+        model = Pipeline([
+            ("scaler", copy.deepcopy(self.scaler)),
+            ("clf", copy.deepcopy(self.clf)),
+        ])
+        with self._rebase_lock:
+            if self._rebase is not None:
+                # a new base model was deployed while training: don't replace it
+                return None
+            self.publish(model, self.trained)
+        self.updates += 1
+        self.last_update = time.time()
+        return model
+
+    def _next_batch(self):
+        """Up to batch_size queued rows, waiting at most `interval` for them."""
+        batch = []
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size and not self._stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.update(batch)
+            except Exception as e:
+                # keep serving the previous version; the batch is lost
+                self.errors += 1
+                print(f"[!] Online model update failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="online-learner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join()
+        self._thread = None
+
+    def stats(self):
+        return {
+            "warm_start": self.warm,
+            "received": self.received,
+            "pending": self.pending(),
+            "dropped": self.dropped,
+            "trained": self.trained,
+            "updates": self.updates,
+            "errors": self.errors,
+            "last_update": self.last_update,
+        }
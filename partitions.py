@@ -0,0 +1,268 @@
+"""
+Time-partitioned storage for login attempts.
+
+With AI_GUARD_PARTITION=hourly or daily, new login attempts are written to
+one SQLite file per UTC time bucket, next to the main database:
+
+    login.db.partitions/attempts-2026101712.db   (hourly)
+    login.db.partitions/attempts-20261017.db     (daily)
+
+Each file holds its own login_attempts table and is ATTACHed to a
+connection only when a query needs it. Range queries (feature windows)
+touch only the buckets overlapping the range; the admin views, the blocked
+listing and unblock iterate over every bucket. Expired buckets are dropped
+by unlinking the file instead of running DELETE: first marked with an
+attempts-<bucket>.db.dropped tombstone, so that every connection detaches
+them, then unlinked with their -wal and -shm files on a later pass.
+
+The main database keeps ip_decisions, the roll-ups and any login_attempts
+rows written before partitioning was enabled; those are read as one more
+source, ahead of the buckets.
+"""
+import calendar
+import os
+import time
+
+PARTITION_MODE = os.environ.get("AI_GUARD_PARTITION", "none")
+PARTITION_SECONDS = {"hourly": 3600, "daily": 86400}
+NAME_FORMATS = {"hourly": "%Y%m%d%H", "daily": "%Y%m%d"}
+# SQLite allows 10 attached databases per connection unless rebuilt
+MAX_ATTACHED = int(os.environ.get("AI_GUARD_PARTITION_MAX_ATTACHED", "8"))
+# how long a tombstoned bucket stays on disk before its files are unlinked
+DROP_DELAY_SECONDS = float(os.environ.get("AI_GUARD_PARTITION_DROP_DELAY_SECONDS", "60"))
+
+# pragmas that are per attached database and worth copying from main
+SCHEMA_PRAGMAS = ("journal_mode", "synchronous", "cache_size")
+
+PARTITION_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS {schema}.login_attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER,
+        ip TEXT,
+        username TEXT,
+        success INTEGER,
+        user_agent TEXT,
+        app TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_login_attempts_ip_ts ON login_attempts (ip, timestamp)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_login_attempts_ip_app_ts ON login_attempts (ip, app, timestamp)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_login_attempts_ts ON login_attempts (timestamp)",
+]
+
+MAIN_TABLE = "main.login_attempts"
+
+
+class PartitionSet:
+    """
+    The bucket files of one main database.
+
+    Stateless apart from configuration: what is on disk is listed on each
+    call, and what is attached is read back from PRAGMA database_list, so
+    one instance can serve every pooled connection and several processes
+    can share the same files.
+    """
+
+    def __init__(self, db_path, mode=None, pragmas=None, max_attached=MAX_ATTACHED):
+        mode = PARTITION_MODE if mode is None else mode
+        if mode not in PARTITION_SECONDS:
+            raise ValueError(f"partition mode must be one of {', '.join(PARTITION_SECONDS)}")
+        self.db_path = db_path
+        self.mode = mode
+        self.seconds = PARTITION_SECONDS[mode]
+        self.name_format = NAME_FORMATS[mode]
+        self.directory = db_path + ".partitions"
+        self.pragmas = {k: v for k, v in (pragmas or {}).items() if k in SCHEMA_PRAGMAS}
+        self.max_attached = max_attached
+
+    # -------- naming --------
+
+    def bucket(self, ts):
+        return int(ts) // self.seconds * self.seconds
+
+    def name(self, start):
+        return time.strftime(self.name_format, time.gmtime(start))
+
+    def start(self, name):
+        return calendar.timegm(time.strptime(name, self.name_format))
+
+    def path(self, start):
+        return os.path.join(self.directory, f"attempts-{self.name(start)}.db")
+
+    def schema(self, start):
+        return "p" + self.name(start)
+
+    def tombstone(self, start):
+        return self.path(start) + ".dropped"
+
+    def existing(self, since=None, until=None):
+        """Sorted bucket starts of the files on disk overlapping [since, until]."""
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # bucket names sort chronologically, so ranges are string compares
+        low = self.name(self.bucket(since)) if since is not None else None
+        high = self.name(self.bucket(until)) if until is not None else None
+        names = []
+        for f in files:
+            if not (f.startswith("attempts-") and f.endswith(".db")):
+                continue
+            if f + ".dropped" in files:
+                continue
+            name = f[len("attempts-"):-len(".db")]
+            if len(name) != len(self.name(0)) or not name.isdigit():
+                continue
+            if (low is None or name >= low) and (high is None or name <= high):
+                names.append(name)
+        return [self.start(name) for name in sorted(names)]
+
+    # -------- attaching --------
+
+    def attach(self, conn, start, create=False):
+        """
+        Attach the bucket starting at `start` to `conn` and return its schema
+        name, or None if it does not exist and `create` is false. Must not be
+        called inside a transaction or while a cursor on a partition is open.
+        """
+        schema = self.schema(start)
+        path = self.path(start)
+        exists = os.path.exists(path) and not os.path.exists(self.tombstone(start))
+        attached = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+
+        if schema in attached and exists:
+            return schema
+        # stay below SQLite's attach limit: forget dropped buckets first, then
+        # the oldest ones
+        ours = self.detach_dropped(conn, attached)
+        if not exists and not create:
+            return None
+        while len(ours) >= self.max_attached:
+            conn.execute(f"DETACH DATABASE {ours.pop(0)}")
+
+        if create:
+            os.makedirs(self.directory, exist_ok=True)
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {schema}.{name}={value}")
+
+        if create:
+            for statement in PARTITION_SCHEMA:
+                conn.execute(statement.format(schema=schema))
+            conn.commit()
+        elif not conn.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'login_attempts'"
+        ).fetchone():
+            # another process created the file but not the table yet
+            conn.execute(f"DETACH DATABASE {schema}")
+            return None
+        return schema
+
+    def detach_dropped(self, conn, attached=None):
+        """
+        Detach the buckets drop_expired() tombstoned or unlinked while `conn`
+        held them. Returns the schema names of the buckets still attached,
+        oldest first.
+        """
+        if attached is None:
+            attached = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+        ours = []
+        for name in sorted(name for name in attached if name.startswith("p") and name[1:].isdigit()):
+            path = attached[name]
+            if os.path.exists(path) and not os.path.exists(path + ".dropped"):
+                ours.append(name)
+            else:
+                conn.execute(f"DETACH DATABASE {name}")
+        return ours
+
+    def detach(self, conn, start):
+        schema = self.schema(start)
+        if any(row[1] == schema for row in conn.execute("PRAGMA database_list")):
+            conn.execute(f"DETACH DATABASE {schema}")
+
+    def writable_table(self, conn, ts):
+        """Qualified login_attempts table of the bucket `ts` falls in, created if needed."""
+        start = self.bucket(ts)
+        if os.path.exists(self.tombstone(start)):
+            # late rows for a dropped bucket: the main table is compacted too
+            return MAIN_TABLE
+        schema = self.attach(conn, start, create=True)
+        return f"{schema}.login_attempts"
+
+    def tables(self, conn, since=None, until=None, newest_first=False):
+        """
+        Yield the qualified login_attempts tables that can hold attempts in
+        [since, until]: the main database's, then each bucket oldest first
+        (or the reverse with newest_first). Buckets are attached one at a
+        time, so finish reading each table before asking for the next.
+        """
+        starts = self.existing(since, until)
+        if not conn.in_transaction:
+            self.detach_dropped(conn)
+        if newest_first:
+            starts.reverse()
+        else:
+            yield MAIN_TABLE
+        for start in starts:
+            schema = self.attach(conn, start)
+            if schema is not None:
+                yield f"{schema}.login_attempts"
+        if newest_first:
+            yield MAIN_TABLE
+
+    # -------- retention --------
+
+    def drop_expired(self, conn, before, on_drop=None, delay=DROP_DELAY_SECONDS):
+        """
+        Drop every bucket that ends at or before `before`. `on_drop(conn,
+        table)` is called for each one first, e.g. to roll it up. Returns the
+        starts of the buckets dropped by this call.
+
+        Other pooled connections, or other processes, may still have a bucket
+        attached and be reading it through its -wal and -shm files, and
+        SQLite does not clean those up once the database file is gone. So a
+        dropped bucket only gets a tombstone here: existing() no longer lists
+        it and every connection detaches it on its next tables() or attach().
+        Its files are unlinked by a call at least `delay` seconds later.
+        """
+        dropped = []
+        for start in self.existing():
+            if start + self.seconds > before:
+                break
+            if on_drop is not None:
+                schema = self.attach(conn, start)
+                if schema is not None:
+                    on_drop(conn, f"{schema}.login_attempts")
+            self.detach(conn, start)
+            with open(self.tombstone(start), "w"):
+                pass
+            dropped.append(start)
+        self.remove_dropped(delay)
+        return dropped
+
+    def remove_dropped(self, delay=DROP_DELAY_SECONDS):
+        """Unlink the buckets tombstoned at least `delay` seconds ago; returns their paths."""
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        removed = []
+        now = time.time()
+        for f in sorted(files):
+            if not f.endswith(".db.dropped"):
+                continue
+            path = os.path.join(self.directory, f[:-len(".dropped")])
+            try:
+                if now - os.path.getmtime(path + ".dropped") < delay:
+                    continue
+                # the tombstone goes last, so a failure is retried next time
+                for suffix in ("", "-wal", "-shm", ".dropped"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            except OSError as e:
+                # e.g. still open elsewhere on Windows
+                print(f"[!] Could not remove dropped partition {path}: {e}")
+                continue
+            removed.append(path)
+        return removed
@@ -0,0 +1,146 @@
+"""
+On-demand sampling profiler and per-request span timing for ai_guard.
+
+Nothing runs until an admin turns it on for a limited time (see the
+/admin/profile endpoints in ai_guard.py). While it is on:
+
+  - a background thread samples the stacks of the threads that are
+    currently serving a request (sys._current_frames) every `interval`
+    seconds and counts them as collapsed stacks, the input format of
+    flamegraph.pl / speedscope;
+  - every request records its spans (e.g. db_insert, features) and gets
+    them back in a Server-Timing header; they are also logged.
+
+When it is off, a request only pays an attribute check or two per hook.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_DURATION_SECONDS = 300
+DEFAULT_INTERVAL_SECONDS = 0.005
+
+
+class Profiler:
+    def __init__(self):
+        # read without the lock on every request
+        self.active = False
+        self.deadline = 0.0
+        self.interval = DEFAULT_INTERVAL_SECONDS
+        self.samples = 0
+        self.requests = 0
+        self.started_at = None
+        self._stacks = Counter()
+        self.traced = set()   # idents of threads serving a traced request
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    # -------- control --------
+
+    def start(self, duration, interval=DEFAULT_INTERVAL_SECONDS):
+        """Start a new profile for `duration` seconds, discarding the previous one."""
+        duration = max(0.1, min(float(duration), MAX_DURATION_SECONDS))
+        self.stop()
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.requests = 0
+        self.interval = max(0.001, float(interval))
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + duration
+        self._stopping.clear()
+        self.active = True
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join()
+        self._thread = None
+
+    def status(self):
+        return {
+            "active": self.active,
+            "remaining_s": max(0.0, self.deadline - time.monotonic()) if self.active else 0.0,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "requests": self.requests,
+            "stacks": len(self._stacks),
+            "started_at": self.started_at,
+        }
+
+    # -------- per request --------
+
+    def begin_request(self):
+        self._local.spans = []
+        self._local.start = time.perf_counter()
+        with self._lock:
+            self.traced.add(threading.get_ident())
+            self.requests += 1
+
+    def add_span(self, name, seconds):
+        spans = getattr(self._local, "spans", None)
+        if spans is not None:
+            spans.append((name, seconds))
+
+    def end_request(self):
+        """
+        Finish the calling thread's request; returns (spans, total seconds),
+        or None if it was not traced.
+        """
+        start = getattr(self._local, "start", None)
+        if start is None:
+            return None
+        total = time.perf_counter() - start
+        spans = self._local.spans
+        self._local.start = self._local.spans = None
+        with self._lock:
+            self.traced.discard(threading.get_ident())
+        return spans, total
+
+    # -------- sampling --------
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopping.is_set() and time.monotonic() < self.deadline:
+            with self._lock:
+                idents = [i for i in self.traced if i != own]
+            if idents:
+                frames = sys._current_frames()
+                stacks = [collapse(frames[i]) for i in idents if i in frames]
+                with self._lock:
+                    for stack in stacks:
+                        self._stacks[stack] += 1
+                    self.samples += len(stacks)
+            self._stopping.wait(self.interval)
+        self.active = False
+
+    def collapsed(self):
+        """The profile in collapsed-stack format: "root;...;leaf count" lines."""
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+def server_timing(spans, total):
+    """Server-Timing header value, durations in milliseconds."""
+    entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in spans]
+    entries.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(entries)
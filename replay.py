@@ -0,0 +1,326 @@
+"""
+Offline replay of login-attempt event logs through the guard's decision logic.
+
+Events are streamed from an NDJSON log straight into a FeatureStore and the
+compiled scorer, in-process and without HTTP or SQLite writes. Each event
+is scored at its recorded timestamp, exactly as /api/log_and_decide would
+have scored it when it happened. Feature rows are scored in vectorised
+chunks. With --workers the log is sharded by IP (crc32) across processes;
+an IP's whole history stays in one shard, so the decisions are the same.
+
+Event log format, one attempt per line ("timestamp" is accepted for "ts";
+"app" and "user_agent" are optional):
+
+    {"ts": 1760000000, "ip": "1.2.3.4", "username": "alice", "success": false, "app": "shop"}
+
+    python replay.py export --db login.db --out events.ndjson
+    python replay.py run events.ndjson --decisions base.ndjson
+    python replay.py run events.ndjson --model candidate.joblib --workers 4 \\
+        --compare base.ndjson --report diff.json
+"""
+import argparse
+import gzip
+import heapq
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import joblib
+import numpy as np
+
+import ai_guard
+
+CHUNK_SIZE = 4096
+
+# lets a shard skip other shards' lines without decoding them
+IP_FIELD = re.compile(r'"ip"\s*:\s*"([^"]*)"')
+
+
+def open_log(path, mode="rt"):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def iter_events(path, shard=0, n_shards=1, stats=None):
+    """
+    Yield (n, ts, ip, username, success, app) for the events of one shard,
+    `n` being the line number. Malformed lines are counted (by the shard
+    that owns them, or shard 0) and skipped.
+    """
+    with open_log(path) as f:
+        for n, line in enumerate(f):
+            owner = shard
+            if n_shards > 1:
+                m = IP_FIELD.search(line)
+                owner = ai_guard.shard_for(m.group(1), n_shards) if m else 0
+                if owner != shard:
+                    continue
+            try:
+                event = json.loads(line)
+                ip = event["ip"]
+                ts = int(event["ts"] if "ts" in event else event["timestamp"])
+            except (ValueError, KeyError, TypeError):
+                if stats is not None and line.strip():
+                    stats["malformed"] += 1
+                continue
+            if n_shards > 1 and ai_guard.shard_for(ip, n_shards) != shard:
+                continue
+            yield (n, ts, ip, event.get("username", ""), bool(event.get("success", False)),
+                   event.get("app", "default"))
+
+# -------- Replay --------
+
+def load_scorer(model_path):
+    if model_path is None:
+        return ai_guard.active_model.scorer
+    return ai_guard.compile_model(joblib.load(model_path))
+
+
+def replay_shard(path, shard, n_shards, model_path, out_path, chunk_size=CHUNK_SIZE):
+    """Replay one shard; writes its decisions to `out_path` (if any) and returns its stats."""
+    scorer = load_scorer(model_path)
+    store = ai_guard.FeatureStore()
+    stats = {"events": 0, "malformed": 0, "first_ts": None, "last_ts": None}
+    decisions = Counter()
+    final = {}
+
+    out = open(out_path, "w") if out_path else None
+    events = iter_events(path, shard, n_shards, stats)
+    try:
+        while True:
+            chunk = []
+            X_raw = []
+            for event in events:
+                n, ts, ip, username, success, app_name = event
+                store.record(ip, ts, username, success, app_name)
+                X_raw.append(store.features(ip, now=ts))
+                chunk.append(event)
+                if len(chunk) == chunk_size:
+                    break
+            if not chunk:
+                break
+
+            if scorer is None:
+                probs = np.zeros(len(chunk))
+            else:
+                probs = scorer.predict_proba(np.vstack(X_raw))
+            lines = []
+            for (n, ts, ip, _, _, _), p in zip(chunk, probs.tolist()):
+                decision = ai_guard.classify_score(p) if scorer is not None else "allow"
+                decisions[decision] += 1
+                final[ip] = decision
+                if out is not None:
+                    lines.append(json.dumps({"n": n, "ts": ts, "ip": ip, "decision": decision,
+                                             "score": round(p, 6)}) + "\n")
+            if out is not None:
+                out.writelines(lines)
+
+            stats["events"] += len(chunk)
+            first, last = chunk[0][1], chunk[-1][1]
+            stats["first_ts"] = first if stats["first_ts"] is None else min(stats["first_ts"], first)
+            stats["last_ts"] = last if stats["last_ts"] is None else max(stats["last_ts"], last)
+    finally:
+        if out is not None:
+            out.close()
+
+    stats["decisions"] = dict(decisions)
+    stats["final_decisions"] = dict(Counter(final.values()))
+    stats["ips"] = len(final)
+    return stats
+
+
+def _replay_shard_args(args):
+    return replay_shard(*args)
+
+
+def merge_stats(parts):
+    total = {"events": 0, "malformed": 0, "first_ts": None, "last_ts": None,
+             "decisions": Counter(), "final_decisions": Counter(), "ips": 0}
+    for part in parts:
+        total["events"] += part["events"]
+        total["malformed"] += part["malformed"]
+        for key, pick in (("first_ts", min), ("last_ts", max)):
+            if part[key] is not None:
+                total[key] = part[key] if total[key] is None else pick(total[key], part[key])
+        total["decisions"].update(part["decisions"])
+        total["final_decisions"].update(part["final_decisions"])
+        total["ips"] += part["ips"]
+    total["decisions"] = dict(total["decisions"])
+    total["final_decisions"] = dict(total["final_decisions"])
+    return total
+
+
+def read_decisions(path):
+    with open(path) as f:
+        for line in f:
+            d = json.loads(line)
+            yield d["n"], d
+
+
+def merge_decision_files(paths, out_path):
+    """Merge per-shard decision files (each sorted by n) into one, in log order."""
+    streams = [open(p) for p in paths]
+    try:
+        keyed = [((json.loads(line)["n"], line) for line in s) for s in streams]
+        with open(out_path, "w") as out:
+            for _, line in heapq.merge(*keyed):
+                out.write(line)
+    finally:
+        for s in streams:
+            s.close()
+
+
+def compare_decisions(current_path, previous_path, examples=10):
+    """Join two decision files on the event number and summarise what changed."""
+    transitions = Counter()
+    compared = changed = 0
+    abs_diff = 0.0
+    samples = []
+    only_current = only_previous = 0
+
+    cur, prev = read_decisions(current_path), read_decisions(previous_path)
+    a, b = next(cur, None), next(prev, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            only_current += 1
+            a = next(cur, None)
+            continue
+        if a is None or b[0] < a[0]:
+            only_previous += 1
+            b = next(prev, None)
+            continue
+
+        compared += 1
+        abs_diff += abs(a[1]["score"] - b[1]["score"])
+        if a[1]["decision"] != b[1]["decision"]:
+            changed += 1
+            transitions[f"{b[1]['decision']}->{a[1]['decision']}"] += 1
+            if len(samples) < examples:
+                samples.append({"n": a[0], "ip": a[1]["ip"], "ts": a[1]["ts"],
+                                "previous": b[1]["decision"], "current": a[1]["decision"],
+                                "previous_score": b[1]["score"], "current_score": a[1]["score"]})
+        a, b = next(cur, None), next(prev, None)
+
+    return {
+        "compared": compared,
+        "changed": changed,
+        "changed_fraction": changed / compared if compared else 0.0,
+        "transitions": dict(transitions),
+        "score_mean_abs_diff": abs_diff / compared if compared else 0.0,
+        "only_in_current": only_current,
+        "only_in_previous": only_previous,
+        "examples": samples,
+    }
+
+
+def run(args):
+    need_decisions = args.decisions or args.compare
+    decisions_path = args.decisions
+    if need_decisions and not decisions_path:
+        decisions_path = os.path.join(tempfile.mkdtemp(prefix="ai_guard_replay_"), "decisions.ndjson")
+
+    start = time.perf_counter()
+    if args.workers <= 1:
+        stats = merge_stats([replay_shard(args.log, 0, 1, args.model, decisions_path)])
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix="ai_guard_replay_")
+        shard_paths = [os.path.join(tmp_dir, f"shard-{i}.ndjson") if need_decisions else None
+                       for i in range(args.workers)]
+        jobs = [(args.log, i, args.workers, args.model, shard_paths[i]) for i in range(args.workers)]
+        with multiprocessing.Pool(args.workers) as pool:
+            stats = merge_stats(pool.map(_replay_shard_args, jobs))
+        if need_decisions:
+            merge_decision_files(shard_paths, decisions_path)
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "log": args.log,
+        "model": args.model or ai_guard.MODEL_PATH,
+        "workers": args.workers,
+        "elapsed_s": elapsed,
+        "events_per_s": stats["events"] / elapsed if elapsed > 0 else 0.0,
+        **stats,
+    }
+    if stats["first_ts"] is not None:
+        span = stats["last_ts"] - stats["first_ts"]
+        report["log_span_s"] = span
+        report["speedup_vs_realtime"] = span / elapsed if elapsed > 0 else 0.0
+    if args.compare:
+        report["diff"] = compare_decisions(decisions_path, args.compare)
+
+    print(f"[+] Replayed {report['events']} events ({report['malformed']} malformed) "
+          f"in {elapsed:.2f}s: {report['events_per_s']:.0f} events/s with {args.workers} worker(s)")
+    if "log_span_s" in report:
+        print(f"    {report['log_span_s'] / 3600:.1f}h of traffic, {report['speedup_vs_realtime']:.0f}x real time")
+    print(f"    decisions: {report['decisions']}")
+    print(f"    final decision per IP ({report['ips']} IPs): {report['final_decisions']}")
+    if decisions_path and args.decisions:
+        print(f"    per-event decisions written to {decisions_path}")
+    if args.compare:
+        diff = report["diff"]
+        print(f"    vs {args.compare}: {diff['changed']} of {diff['compared']} decisions changed "
+              f"({diff['changed_fraction']:.2%}), mean |score diff| {diff['score_mean_abs_diff']:.4f}")
+        for transition, count in sorted(diff["transitions"].items()):
+            print(f"      {transition:<20} {count}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[+] Report written to {args.report}")
+
+# -------- Export --------
+
+def export(args):
+    """Write the login attempts of a database as an event log, oldest first."""
+    ai_guard.DB_PATH = args.db
+    conn = ai_guard.get_db_connection()
+    out = open_log(args.out, "wt") if args.out != "-" else sys.stdout
+    count = 0
+    try:
+        for table in ai_guard.attempt_tables(conn):
+            rows = conn.execute(
+                f"SELECT timestamp, ip, username, success, app, user_agent FROM {table} "
+                "ORDER BY timestamp, id"
+            )
+            for r in rows:
+                out.write(json.dumps({
+                    "ts": r["timestamp"], "ip": r["ip"], "username": r["username"],
+                    "success": bool(r["success"]), "app": r["app"] or "default",
+                    "user_agent": r["user_agent"],
+                }) + "\n")
+                count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"[+] Exported {count} attempts", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rp = commands.add_parser("run", help="replay an event log")
+    rp.add_argument("log", help="NDJSON event log (optionally .gz)")
+    rp.add_argument("--model", help="joblib model to score with (default: model.joblib)")
+    rp.add_argument("--workers", type=int, default=1, help="processes, sharded by IP")
+    rp.add_argument("--decisions", help="write per-event decisions (NDJSON) here")
+    rp.add_argument("--compare", help="decisions file of a previous run to diff against")
+    rp.add_argument("--report", help="write the JSON report here")
+    rp.set_defaults(func=run)
+
+    ep = commands.add_parser("export", help="write a database's login attempts as an event log")
+    ep.add_argument("--db", default="login.db")
+    ep.add_argument("--out", default="-")
+    ep.set_defaults(func=export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""
+Multi-process serving for AI Guard: IP-sharded workers, optionally behind a router.
+
+`python ai_guard.py` is one process, so scoring is bound to one GIL. This
+runs --workers guard processes instead, each owning the IPs whose crc32
+falls in its shard. Workers listen on --worker-host, ports --base-port +
+shard (default: the port after --port). Behind a router the workers trust
+its X-Forwarded-For for the client address, so they must stay on loopback;
+with --routers 0 they use the socket peer and may listen on any interface.
+
+Clients should route by themselves: hash the IP with ai_guard.shard_for()
+and post to the worker that owns it (attack_simulator.py load --shards N
+does this). That is the recommended way to call a sharded guard.
+
+Scaling: the goal of near-linear throughput in the number of workers is
+NOT met, or at least not shown. Everything here was measured on a single
+core, where more workers cannot help: with 2 shards, 600 closed-loop
+requests ran at about 400 req/s straight to the workers, about 130 req/s
+through the router, and 383 req/s for a single process. Nobody has run
+`attack_simulator.py load --start-servers --shards N` on several cores.
+
+The router is NOT fit for production as it stands. It re-parses every
+request body in Python and adds a hop, which makes it slower than a single
+process. Use it only to try things out, or for clients that know a single
+URL (app.py, browsers on the admin pages). One or more stateless router
+processes listen on --port and forward every request to the worker that
+owns its IP:
+
+    /api/log_and_decide, /api/decide       "ip" field / ?ip=, else the client address
+    /api/log_and_decide_batch              split by IP, forwarded in parallel, merged in order
+    /admin/unblock, /admin/confirm_block   "ip" form field
+    /admin/model/reload, /admin/model/rollback   every worker
+    anything else                          worker 0
+
+All events of an IP reach the same worker, so its sliding window lives in
+one feature store and its decisions have a single writer. Decisions are
+shared through the ip_decisions table of the common SQLite database (WAL),
+which is what the admin views and /api/decide read. Each worker's decision
+cache only holds its own IPs, so it can never be stale.
+
+The routers share --port with SO_REUSEPORT, so --routers > 1 spreads
+connections across router processes too. Metrics, the live feed and the
+profiler are per worker: scrape and open each worker port.
+
+Only worker 0 runs compaction. Online learning is turned off with more than
+one worker, since each learner would only see its own shard's feedback.
+
+    python serve.py --workers 4 --routers 0     # clients route by themselves
+    python serve.py --workers 4 --routers 2     # plus routers on --port (not for production)
+"""
+import argparse
+import http.client
+import http.server
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+# same limit as the workers' AI_GUARD_MAX_BATCH_SIZE
+MAX_BATCH_SIZE = int(os.environ.get("AI_GUARD_MAX_BATCH_SIZE", "1000"))
+UPSTREAM_TIMEOUT = float(os.environ.get("AI_GUARD_UPSTREAM_TIMEOUT", "30"))
+
+IP_ROUTED = ("/api/log_and_decide", "/api/decide")
+FORM_ROUTED = ("/admin/unblock", "/admin/confirm_block")
+BROADCAST = ("/admin/model/reload", "/admin/model/rollback")
+LOOPBACK = ("127.0.0.1", "::1", "localhost")
+# methods a worker can safely see twice
+IDEMPOTENT = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-connection", "transfer-encoding",
+              "te", "trailer", "upgrade", "content-length"}
+
+
+# -------- Workers --------
+
+def run_worker(shard, shards, host, port, access_log, behind_router):
+    # the shard settings are read when ai_guard is imported
+    os.environ["AI_GUARD_SHARD"] = str(shard)
+    os.environ["AI_GUARD_SHARDS"] = str(shards)
+    if shard != 0:
+        os.environ["AI_GUARD_COMPACTION"] = "0"
+    if shards > 1:
+        os.environ["AI_GUARD_ONLINE_LEARNING"] = "0"
+    if behind_router:
+        # the router's X-Forwarded-For carries the client address; serve()
+        # keeps the workers on loopback, so only the router can set it
+        os.environ.setdefault("AI_GUARD_TRUSTED_PROXIES", "1")
+    if not access_log:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    import ai_guard
+    ai_guard.start_services()
+    print(f"[+] Worker {shard}/{shards} serving on http://{host}:{port}")
+    ai_guard.app.run(host=host, port=port, threaded=True, debug=False)
+
+# -------- Router --------
+
+class Router(http.server.ThreadingHTTPServer):
+    """Forwards each request to the worker owning its IP, over keep-alive connections."""
+
+    daemon_threads = True
+
+    def __init__(self, address, workers, reuse_port=False, access_log=False):
+        self.workers = workers
+        self.shards = len(workers)
+        self.reuse_port = reuse_port
+        self.access_log = access_log
+        # imported here, not at the top: ai_guard reads AI_GUARD_SHARD when
+        # it is imported, which run_worker sets first
+        from ai_guard import shard_for
+        self.shard_for = shard_for
+        self.fan_out = ThreadPoolExecutor(max_workers=max(4, 2 * self.shards), thread_name_prefix="fan-out")
+        self._local = threading.local()
+        super().__init__(address, RouterHandler)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def connection(self, shard):
+        """The calling thread's connection to a worker; http.client reopens it when closed."""
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(shard)
+        if conn is None:
+            host, port = self.workers[shard]
+            conn = conns[shard] = http.client.HTTPConnection(host, port, timeout=UPSTREAM_TIMEOUT)
+        return conn
+
+    def send(self, shard, method, path, headers, body):
+        """Send a request to a worker and return the (unread) response."""
+        conn = self.connection(shard)
+        if conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+            # nothing is pending on an idle connection: readable means the
+            # worker closed it, so reconnect instead of writing into it
+            conn.close()
+        reused = conn.sock is not None
+        try:
+            conn.request(method, path, body=body, headers=headers)
+        except (BrokenPipeError, ConnectionResetError):
+            # the request never reached a worker that still reads this connection
+            conn.close()
+            if not reused:
+                raise
+            conn.request(method, path, body=body, headers=headers)
+            return conn.getresponse()
+        try:
+            return conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError):
+            # the worker may have handled the request: only repeat it if it can be
+            conn.close()
+            if not reused or method not in IDEMPOTENT:
+                raise
+            conn.request(method, path, body=body, headers=headers)
+            return conn.getresponse()
+
+    def fetch(self, shard, method, path, headers, body):
+        """(status, reason, headers, body) of a fully read worker response."""
+        resp = self.send(shard, method, path, headers, body)
+        return resp.status, resp.reason, resp.getheaders(), resp.read()
+
+
+class RouterHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else None
+        url = urlsplit(self.path)
+        client = self.client_address[0]
+
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP}
+        forwarded = self.headers.get("X-Forwarded-For")
+        headers["X-Forwarded-For"] = f"{forwarded}, {client}" if forwarded else client
+
+        try:
+            if url.path == "/api/log_and_decide_batch" and self.command == "POST" and self.server.shards > 1:
+                self.route_batch(headers, body, client)
+            elif url.path in BROADCAST and self.command == "POST":
+                self.broadcast(headers, body)
+            else:
+                shard = self.shard_of(url, body, client)
+                self.relay(self.server.send(shard, self.command, self.path, headers, body), shard)
+        except OSError as e:
+            # worker down or timed out; the client connection may be gone too
+            print(f"[!] Router: {self.command} {url.path} failed: {e}")
+            self.close_connection = True
+            try:
+                self.respond(502, [("Content-Type", "text/plain")], b"Bad gateway\n")
+            except OSError:
+                pass
+
+    do_POST = do_PUT = do_DELETE = do_HEAD = do_GET
+
+    def shard_of(self, url, body, client):
+        if self.server.shards == 1:
+            return 0
+        ip = None
+        if url.path in IP_ROUTED:
+            ip = parse_qs(url.query).get("ip", [None])[0] if url.path == "/api/decide" else None
+            if not ip and body:
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    data = None
+                if isinstance(data, dict):
+                    ip = data.get("ip")
+            ip = ip or client
+        elif url.path in FORM_ROUTED and body:
+            ip = parse_qs(body.decode("utf-8", "replace")).get("ip", [None])[0]
+        if not isinstance(ip, str) or not ip:
+            return 0
+        return self.server.shard_for(ip, self.server.shards)
+
+    def route_batch(self, headers, body, client):
+        """Split a batch by shard, forward the parts concurrently and merge the results in order."""
+        try:
+            data = json.loads(body or b"")
+        except ValueError:
+            data = None
+        items = data.get("attempts") if isinstance(data, dict) else data
+        if (not isinstance(items, list) or len(items) > MAX_BATCH_SIZE
+                or not all(isinstance(it, dict) for it in items)):
+            # let a worker answer with the usual 400
+            self.relay(self.server.send(0, "POST", self.path, headers, body), 0)
+            return
+
+        parts = {}
+        for i, it in enumerate(items):
+            ip = it.get("ip")
+            shard = self.server.shard_for(ip if isinstance(ip, str) and ip else client, self.server.shards)
+            positions, attempts = parts.setdefault(shard, ([], []))
+            positions.append(i)
+            attempts.append(it)
+        if len(parts) <= 1:
+            shard = next(iter(parts), 0)
+            self.relay(self.server.send(shard, "POST", self.path, headers, body), shard)
+            return
+
+        futures = {
+            shard: self.server.fan_out.submit(self.server.fetch, shard, "POST", self.path, headers,
+                                              json.dumps({"attempts": attempts}).encode())
+            for shard, (_, attempts) in parts.items()
+        }
+        responses = {shard: future.result() for shard, future in futures.items()}
+        for shard, (status, reason, resp_headers, resp_body) in responses.items():
+            if status != 200:
+                self.respond(status, resp_headers, resp_body, reason)
+                return
+
+        results = [None] * len(items)
+        versions = set()
+        for shard, (positions, _) in parts.items():
+            answer = json.loads(responses[shard][3])
+            for i, result in zip(positions, answer["results"]):
+                results[i] = result
+            versions.add(answer.get("model_version"))
+        merged = json.dumps({
+            # workers can disagree for a moment while a new model rolls out
+            "results": results, "model_version": ",".join(sorted(map(str, versions))),
+        }).encode()
+        self.respond(200, [("Content-Type", "application/json")], merged)
+
+    def broadcast(self, headers, body):
+        """Send the request to every worker; answer with the worst status (worker 0's on success)."""
+        futures = [self.server.fan_out.submit(self.server.fetch, shard, self.command, self.path, headers, body)
+                   for shard in range(self.server.shards)]
+        responses = [future.result() for future in futures]
+        worst = max(range(len(responses)), key=lambda shard: (responses[shard][0], -shard))
+        status, reason, resp_headers, resp_body = responses[worst]
+        if status >= 400:
+            print(f"[!] Router: {self.path} failed on worker {worst} ({status})")
+        self.respond(status, resp_headers, resp_body, reason)
+
+    def respond(self, status, headers, body, reason=None):
+        self.send_response_only(status, reason)
+        for name, value in headers:
+            if name.lower() not in HOP_BY_HOP:
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def relay(self, resp, shard):
+        """Copy a worker response to the client, streaming it if it has no length (the live feed)."""
+        if resp.getheader("Content-Length") is not None or self.command == "HEAD":
+            self.respond(resp.status, resp.getheaders(), resp.read(), resp.reason)
+            return
+
+        self.send_response_only(resp.status, resp.reason)
+        for name, value in resp.getheaders():
+            if name.lower() not in HOP_BY_HOP:
+                self.send_header(name, value)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                chunk = resp.read1(65536)
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except OSError:
+                    break  # the client went away
+        finally:
+            if not resp.isclosed():
+                self.server.connection(shard).close()
+
+    def log_message(self, format, *args):
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+
+def run_router(host, port, workers, reuse_port, access_log):
+    router = Router((host, port), workers, reuse_port=reuse_port, access_log=access_log)
+    print(f"[+] Router on http://{host}:{port} -> {len(workers)} worker(s)")
+    try:
+        router.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+# -------- Supervisor --------
+
+def wait_for_port(host, port, proc, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not proc.is_alive():
+            raise RuntimeError(f"{proc.name} exited with code {proc.exitcode} while starting")
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{proc.name} did not listen on {host}:{port} within {timeout:.0f}s")
+
+
+def stop(procs):
+    for proc in procs:
+        if proc.is_alive():
+            # SIGTERM: workers flush their write-behind queue on the way out
+            proc.terminate()
+    for proc in procs:
+        proc.join(10)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+
+
+def serve(args):
+    ctx = multiprocessing.get_context("spawn")
+    base_port = args.base_port or args.port + 1
+    connect_host = "127.0.0.1" if args.worker_host in ("0.0.0.0", "") else args.worker_host
+    workers = [(connect_host, base_port + shard) for shard in range(args.workers)]
+    if args.routers:
+        print("[!] The router is slower than a single process and not meant for production: "
+              "prefer --routers 0 with clients routing by ai_guard.shard_for")
+    if args.workers > 1 and os.environ.get("AI_GUARD_ONLINE_LEARNING", "0") == "1":
+        print("[!] Online learning is disabled with more than one worker")
+
+    procs = []
+    # SIGTERM -> SystemExit, so the children are stopped below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        # worker 0 first, so that only one process creates or migrates the schema
+        for shard in range(args.workers):
+            proc = ctx.Process(target=run_worker, name=f"worker-{shard}",
+                               args=(shard, args.workers, args.worker_host, workers[shard][1], args.access_log,
+                                     args.routers > 0))
+            proc.start()
+            procs.append(proc)
+            if shard == 0:
+                wait_for_port(*workers[0], proc, args.startup_timeout)
+        for proc, (host, port) in zip(procs[1:], workers[1:]):
+            wait_for_port(host, port, proc, args.startup_timeout)
+
+        reuse_port = args.routers > 1
+        if reuse_port and not hasattr(socket, "SO_REUSEPORT"):
+            print("[!] SO_REUSEPORT is not available: running a single router")
+            args.routers = 1
+            reuse_port = False
+        for n in range(args.routers):
+            proc = ctx.Process(target=run_router, name=f"router-{n}",
+                               args=(args.host, args.port, workers, reuse_port, args.access_log))
+            proc.start()
+            procs.append(proc)
+        if args.routers:
+            wait_for_port("127.0.0.1" if args.host in ("0.0.0.0", "") else args.host, args.port,
+                          procs[-1], args.startup_timeout)
+
+        print(f"[+] AI Guard serving with {args.workers} worker(s) on ports {base_port}-"
+              f"{base_port + args.workers - 1} and {args.routers} router(s) on port {args.port}")
+        sentinels = {proc.sentinel: proc for proc in procs}
+        ready = multiprocessing.connection.wait(list(sentinels))
+        proc = sentinels[ready[0]]
+        proc.join()
+        print(f"[!] {proc.name} exited with code {proc.exitcode}, shutting down")
+        raise SystemExit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(procs[::-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="guard processes (IP shards)")
+    parser.add_argument("--routers", type=int, default=1,
+                        help="router processes sharing --port (0: no router, clients route by themselves)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--worker-host", default="127.0.0.1",
+                        help="interface of the workers (loopback only when there is a router)")
+    parser.add_argument("--base-port", type=int, default=0, help="port of worker 0 (default: --port + 1)")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--access-log", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    trusts_proxy = args.routers > 0 or int(os.environ.get("AI_GUARD_TRUSTED_PROXIES", "0")) > 0
+    if trusts_proxy and args.worker_host not in LOOPBACK:
+        # anyone reaching a worker could pick the scored IP with X-Forwarded-For
+        parser.error("workers that trust X-Forwarded-For (--routers, AI_GUARD_TRUSTED_PROXIES) "
+                     "must keep --worker-host on loopback")
+    serve(args)
+
+
+if __name__ == "__main__":
+    main()
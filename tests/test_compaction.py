@@ -0,0 +1,70 @@
+"""
+Roll-up compaction: minutes merged more than once keep exact counts.
+
+    python -m unittest discover tests
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import compaction
+import migrations
+
+MINUTE = 1_000_000 // 60 * 60
+
+
+class RollupMergeTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.conn = sqlite3.connect(os.path.join(tmp.name, "compaction.db"))
+        self.addCleanup(self.conn.close)
+        migrations.migrate(self.conn)
+
+    def add(self, rows):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO login_attempts (timestamp, ip, username, success, app) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def compact(self):
+        job = compaction.CompactionJob(lambda: self.conn, raw_retention=0, pause_ms=0)
+        job.run_once(now=MINUTE + 120)
+
+    def rollup(self):
+        return self.conn.execute(
+            "SELECT attempts, failures, distinct_usernames FROM login_attempt_rollups "
+            "WHERE ip = '1.1.1.1' AND app = 'shop' AND minute = ?",
+            (MINUTE,),
+        ).fetchone()
+
+    def test_late_rows_merge_exactly(self):
+        self.add([
+            (MINUTE + 1, "1.1.1.1", "alice", 0, "shop"),
+            (MINUTE + 2, "1.1.1.1", "bob", 0, "shop"),
+            (MINUTE + 3, "1.1.1.1", None, 1, "shop"),
+        ])
+        self.compact()
+        self.assertEqual(self.rollup(), (3, 2, 2))
+
+        # late rows for the same minute: one new username, one already counted
+        self.add([
+            (MINUTE + 30, "1.1.1.1", "carol", 0, "shop"),
+            (MINUTE + 31, "1.1.1.1", "alice", 1, "shop"),
+        ])
+        self.compact()
+        self.assertEqual(self.rollup(), (5, 3, 3))
+
+    def test_expired_rollups_drop_their_usernames(self):
+        self.add([(MINUTE + 1, "1.1.1.1", "alice", 0, "shop")])
+        self.compact()
+        job = compaction.CompactionJob(lambda: self.conn, raw_retention=0, rollup_retention=0, pause_ms=0)
+        job.run_once(now=MINUTE + 3600)
+        for table in ("login_attempt_rollups", "login_attempt_rollup_usernames"):
+            self.assertEqual(self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
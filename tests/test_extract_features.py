@@ -0,0 +1,91 @@
+"""
+The vectorised training-feature extractor agrees exactly with the online
+FeatureStore, whatever the chunk size.
+
+    python -m unittest discover tests
+"""
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import ai_guard
+import extract_features
+import partitions
+
+HOUR = 3600
+
+
+class RangeMinTest(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(3)
+        values = rng.integers(0, 1000, 300)
+        lo = rng.integers(0, 300, 2000)
+        hi = lo + 1 + (rng.integers(0, 300, 2000) % (300 - lo))
+        expected = [values[a:b].min() for a, b in zip(lo, hi)]
+        np.testing.assert_array_equal(extract_features.range_min(values, lo, hi), expected)
+
+
+class ExtractParityTest(unittest.TestCase):
+    IPS = ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"]
+    USERNAMES = ["alice", "bob", "carol", None]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(setattr, ai_guard, "DB_PATH", ai_guard.DB_PATH)
+        self.addCleanup(setattr, partitions, "PARTITION_MODE", partitions.PARTITION_MODE)
+        ai_guard.DB_PATH = os.path.join(tmp.name, "extract.db")
+        partitions.PARTITION_MODE = "hourly"
+        ai_guard.init_db()
+        self.conn = ai_guard.get_db_connection()
+        self.seed()
+
+    def seed(self):
+        rng = random.Random(5)
+        ts = 1_700_000_000 // HOUR * HOUR - HOUR // 2
+        rows = []
+        for _ in range(1500):
+            # ties, bursts and gaps longer than the window
+            ts += rng.choice([0, 0, 1, 2, 3, 30, 200, 700])
+            rows.append((ts, rng.choice(self.IPS), rng.choice(self.USERNAMES),
+                         rng.choice([0, 1, 1, None]), "test", "default"))
+        # the first half hour was logged before partitioning was turned on
+        legacy = [row for row in rows if row[0] < rows[0][0] + HOUR // 2]
+        ai_guard.insert_attempts(self.conn, "main.login_attempts", legacy)
+        # a few rows that tie with partitioned ones are in the main table too
+        ties = rows[len(legacy)::97]
+        ai_guard.insert_attempts(self.conn, "main.login_attempts", ties)
+        self.n_rows = len(rows) + len(ties)
+        parts = ai_guard.get_partitions()
+        for row in rows[len(legacy):]:
+            ai_guard.insert_attempts(self.conn, parts.writable_table(self.conn, row[0]), [row])
+        self.assertGreater(len(list(parts.existing())), 2)
+
+    def online(self):
+        """Features of every attempt replayed through FeatureStore in log order."""
+        store = ai_guard.FeatureStore()
+        attempts = pd.concat(chunk for chunk in extract_features.read_chunks(self.conn, 10 ** 9))
+        expected = []
+        for ts, ip, username, success in attempts.itertuples(index=False, name=None):
+            # NULL success reads back as NaN
+            store.record(ip, ts, username, None if pd.isna(success) else success)
+            expected.append(store.features(ip, now=ts))
+        return attempts, np.array(expected)
+
+    def test_chunk_sizes(self):
+        attempts, expected = self.online()
+        self.assertEqual(len(attempts), self.n_rows)
+        for chunk_rows in (5, 37, 1000, 10 ** 6):
+            with self.subTest(chunk_rows=chunk_rows):
+                frames = [frame for _, frame in extract_features.extract(self.conn, chunk_rows)]
+                got = pd.concat(frames, ignore_index=True)
+                np.testing.assert_array_equal(got["ip"].to_numpy(), attempts["ip"].to_numpy())
+                np.testing.assert_array_equal(got[ai_guard.FEATURE_NAMES].to_numpy(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Parity of the in-memory FeatureStore with the SQL reference features.
+
+Run from the repository root:
+
+    python -m unittest discover tests
+"""
+import contextlib
+import os
+import random
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import ai_guard
+import partitions
+
+
+class FeatureStoreParityTest(unittest.TestCase):
+    IPS = ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    APPS = ["shop", "blog", "default"]
+    USERNAMES = ["alice", "bob", "carol", "dave"]
+
+    def setUp(self):
+        self.addCleanup(setattr, ai_guard, "DB_PATH", ai_guard.DB_PATH)
+        self.addCleanup(setattr, partitions, "PARTITION_MODE", partitions.PARTITION_MODE)
+        self.addCleanup(ai_guard.feature_store.clear)
+
+    @contextlib.contextmanager
+    def fresh_db(self):
+        """A new temp DB and an empty store; its connections are closed on exit."""
+        with tempfile.TemporaryDirectory() as tmp:
+            ai_guard.DB_PATH = os.path.join(tmp, "features.db")
+            ai_guard.init_db()
+            ai_guard.feature_store.clear()
+            try:
+                yield
+            finally:
+                ai_guard.close_db_connections()
+
+    def assert_parity(self, now):
+        # both paths read the clock: pin it for the comparison
+        with mock.patch.object(ai_guard.time, "time", return_value=now):
+            for ip in self.IPS + ["10.9.9.9"]:
+                store = ai_guard.feature_store.features(ip, now=now)
+                sql = ai_guard.compute_features_for_ip_sql(ip)
+                np.testing.assert_allclose(store, sql, err_msg=f"{ip} at {now}")
+
+    def replay(self, seed, now):
+        rng = random.Random(seed)
+        ts = now - 2 * ai_guard.FEATURE_WINDOW_MINUTES * 60
+        for _ in range(400):
+            # mostly increasing, sometimes late (out of order) or tied
+            ts += rng.choice([0, 1, 2, 5, 30])
+            late = rng.random() < 0.15
+            ai_guard.log_attempt(
+                rng.choice(self.IPS),
+                rng.choice(self.USERNAMES),
+                rng.random() < 0.4,
+                "test",
+                app_name=rng.choice(self.APPS),
+                ts=ts - rng.randint(1, 120) if late else ts,
+            )
+            if rng.random() < 0.05:
+                # reads expire the window in place, so time only moves forward
+                self.assert_parity(ts)
+        return ts
+
+    def forget(self, ip, app_name):
+        """What /admin/unblock does to the log and the store."""
+        conn = ai_guard.get_db_connection()
+        for table in ai_guard.attempt_tables(conn):
+            with conn:
+                conn.execute(f"DELETE FROM {table} WHERE ip = ? AND app = ?", (ip, app_name))
+        ai_guard.feature_store.forget(ip, app_name)
+
+    def run_scenario(self, seed):
+        now = int(time.time())
+        last = self.replay(seed, now)
+        self.forget(self.IPS[0], "shop")
+        self.assert_parity(last)
+
+        # rebuilding from the DB gives the same windows as the live updates
+        ai_guard.feature_store.rebuild_from_db(ai_guard.get_db_connection(), now=last)
+        self.assert_parity(last)
+
+        # then the window slides past the attempts
+        for offset in (1, 59, 300, 599, 600, 601, 1200):
+            self.assert_parity(last + offset)
+
+    def test_parity_unpartitioned(self):
+        partitions.PARTITION_MODE = "none"
+        for seed in range(3):
+            with self.subTest(seed=seed), self.fresh_db():
+                self.run_scenario(seed)
+
+    def test_parity_hourly_partitions(self):
+        partitions.PARTITION_MODE = "hourly"
+        with self.fresh_db():
+            self.run_scenario(42)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+/metrics keeps working whatever clients send as the `app` label.
+
+    python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+
+import ai_guard
+import metrics
+
+
+class AppLabelTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(setattr, ai_guard, "DB_PATH", ai_guard.DB_PATH)
+        ai_guard.DB_PATH = os.path.join(tmp.name, "metrics.db")
+        ai_guard.init_db()
+        self.client = ai_guard.app.test_client()
+
+    def scrape(self):
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_data(as_text=True)
+
+    def test_null_and_non_string_app(self):
+        for app_name in ("default", None, 123, ""):
+            resp = self.client.post("/api/log_and_decide", json={
+                "ip": "1.2.3.4", "username": "alice", "success": False, "app": app_name,
+            })
+            self.assertEqual(resp.status_code, 200)
+        resp = self.client.post("/api/log_and_decide_batch", json={"attempts": [
+            {"ip": "1.2.3.5", "username": "bob", "app": None},
+            {"ip": "1.2.3.6", "username": "bob", "app": 7},
+        ]})
+        self.assertEqual(resp.status_code, 200)
+
+        text = self.scrape()
+        self.assertIn('app="default"', text)
+        self.assertIn('app="123"', text)
+        self.assertIn('app="7"', text)
+        self.assertNotIn('app="None"', text)
+
+    def test_mixed_label_types_sort(self):
+        counter = metrics.Counter("mixed", "Mixed label types.", ("decision", "app"))
+        counter.inc(("allow", None))
+        counter.inc(("allow", "default"))
+        counter.inc(("allow", 3))
+        self.assertEqual(len(list(counter.samples())), 3)
+
+    def test_label_values_are_bounded(self):
+        label = metrics.LabelValues(2)
+        self.assertEqual([label(v) for v in ("a", "b", "c", "a", None, "d")],
+                         ["a", "b", "other", "a", "other", "other"])
+        self.assertEqual(metrics.LabelValues(5)(None), "default")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Schema migrations: fresh and legacy databases end up with the same schema,
+and none of the hot queries falls back to a full scan.
+
+    python -m unittest discover tests
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import migrations
+
+# the schema the original init_db.py created, before versioned migrations
+BASELINE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS login_attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER,
+        ip TEXT,
+        username TEXT,
+        success INTEGER,
+        user_agent TEXT
+    );
+    CREATE TABLE IF NOT EXISTS ip_decisions (
+        ip TEXT PRIMARY KEY,
+        decision TEXT,
+        last_update INTEGER
+    );
+"""
+
+INDEXES = {
+    "idx_login_attempts_ip_ts",
+    "idx_login_attempts_ip_app_ts",
+    "idx_login_attempts_ts",
+    "idx_ip_decisions_decision_update_ip",
+    "idx_ip_decisions_decision_ip",
+    "idx_rollups_minute",
+    "idx_rollup_usernames_minute",
+}
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.conn = sqlite3.connect(os.path.join(tmp.name, "migrations.db"))
+        self.addCleanup(self.conn.close)
+
+    def assert_current(self):
+        conn = self.conn
+        self.assertEqual(migrations.get_version(conn), migrations.SCHEMA_VERSION)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(login_attempts)")}
+        self.assertIn("app", columns)
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertLessEqual(INDEXES, indexes)
+        self.assertEqual(migrations.check_query_plans(conn), {})
+        # a second run has nothing left to do
+        self.assertEqual(migrations.migrate(conn), [])
+
+    def test_fresh_database(self):
+        applied = migrations.migrate(self.conn)
+        self.assertEqual(applied, [version for version, _, _ in migrations.MIGRATIONS])
+        self.assert_current()
+
+    def test_baseline_database(self):
+        with self.conn:
+            self.conn.executescript(BASELINE_SCHEMA)
+            self.conn.execute(
+                "INSERT INTO login_attempts (timestamp, ip, username, success, user_agent) "
+                "VALUES (1000, '1.2.3.4', 'alice', 0, 'curl')"
+            )
+        migrations.migrate(self.conn)
+        self.assert_current()
+        row = self.conn.execute("SELECT ip, username, app FROM login_attempts").fetchone()
+        self.assertEqual(row, ("1.2.3.4", "alice", None))
+
+    def test_plan_check_reports_a_full_scan(self):
+        migrations.migrate(self.conn)
+        self.conn.execute("DROP INDEX idx_login_attempts_ip_ts")
+        self.conn.execute("DROP INDEX idx_login_attempts_ip_app_ts")
+        self.assertIn("unblock history", migrations.check_query_plans(self.conn))
+
+
+if __name__ == "__main__":
+    unittest.main()
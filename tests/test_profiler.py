@@ -0,0 +1,41 @@
+"""
+Request tracing ends even when a view raises.
+
+    python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import ai_guard
+
+
+class TraceCleanupTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(setattr, ai_guard, "DB_PATH", ai_guard.DB_PATH)
+        ai_guard.DB_PATH = os.path.join(tmp.name, "profiler.db")
+        ai_guard.init_db()
+        self.client = ai_guard.app.test_client()
+        self.addCleanup(ai_guard.request_profiler.stop)
+
+    def test_raising_view_is_untraced(self):
+        body = {"ip": "1.2.3.4", "username": "alice", "success": False}
+        ai_guard.request_profiler.start(30)
+        # propagated exceptions skip after_request entirely
+        with mock.patch.dict(ai_guard.app.config, {"PROPAGATE_EXCEPTIONS": True}), \
+                mock.patch.object(ai_guard, "log_attempt", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self.client.post("/api/log_and_decide", json=body)
+        self.assertEqual(ai_guard.request_profiler.traced, set())
+
+        ai_guard.request_profiler.stop()
+        resp = self.client.post("/api/log_and_decide", json=body)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("Server-Timing", resp.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+The compiled LinearScorer scores exactly like the sklearn pipeline it was
+built from, and unsupported estimators keep the generic path.
+
+    python -m unittest discover tests
+"""
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+import ai_guard
+
+
+def training_set(rng, n=500):
+    total = rng.integers(1, 200, n)
+    failed = rng.integers(0, total + 1)
+    X = np.column_stack([
+        total, failed, 1 - failed / total, rng.integers(1, 50, n), rng.exponential(60, n),
+    ]).astype(np.float64)
+    y = (failed > total / 2).astype(int)
+    return X, y
+
+
+def test_rows(rng):
+    X, _ = training_set(rng, 200)
+    extreme = np.array([
+        [0, 0, 0, 0, 0],
+        [0, 0, 1.0, 1, 600],
+        [1e6, 1e6, 0, 1e5, 0],
+        [1e12, 0, 1.0, 1e9, 1e12],
+        [-1e9, 1e9, -5, 0, -1e9],
+    ], dtype=np.float64)
+    return np.vstack([X, extreme])
+
+
+class LinearScorerParityTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(7)
+        X, self.y = training_set(self.rng)
+        # fitted on named columns, like train_model.py
+        self.X = pd.DataFrame(X, columns=ai_guard.FEATURE_NAMES)
+
+    def assert_parity(self, pipeline, fit=True):
+        if fit:
+            pipeline.fit(self.X, self.y)
+        scorer = ai_guard.compile_model(pipeline)
+        self.assertIsInstance(scorer, ai_guard.LinearScorer)
+
+        rows = test_rows(self.rng)
+        expected = pipeline.predict_proba(pd.DataFrame(rows, columns=ai_guard.FEATURE_NAMES))[:, 1]
+        np.testing.assert_allclose(scorer.predict_proba(rows), expected, rtol=1e-9, atol=1e-12)
+        for row, p in zip(rows, expected):
+            self.assertAlmostEqual(scorer.predict_proba_one(row), p, delta=1e-9 * max(p, 1e-3))
+
+    def test_logistic_regression(self):
+        self.assert_parity(Pipeline([("scaler", StandardScaler()), ("clf", LogisticRegression())]))
+
+    @unittest.skipIf(ai_guard.active_model.model is None, "no model.joblib")
+    def test_shipped_model(self):
+        self.assert_parity(ai_guard.active_model.model, fit=False)
+
+    def test_scaler_without_mean_or_std(self):
+        for kwargs in ({"with_mean": False}, {"with_std": False}):
+            with self.subTest(**kwargs):
+                self.assert_parity(Pipeline([
+                    ("scaler", StandardScaler(**kwargs)), ("clf", LogisticRegression(max_iter=1000)),
+                ]))
+
+    def test_sgd_log_loss(self):
+        self.assert_parity(Pipeline([
+            ("scaler", StandardScaler()), ("clf", SGDClassifier(loss="log_loss", random_state=0)),
+        ]))
+
+    def test_unsupported_estimators_use_the_generic_path(self):
+        unsupported = [
+            Pipeline([("scaler", StandardScaler()), ("clf", RandomForestClassifier(n_estimators=5))]),
+            Pipeline([("scaler", StandardScaler()), ("clf", SGDClassifier(loss="hinge"))]),
+            LogisticRegression(),
+        ]
+        for model in unsupported:
+            with self.subTest(model=model):
+                model.fit(self.X, self.y)
+                self.assertIsNone(ai_guard.LinearScorer.from_pipeline(model))
+                scorer = ai_guard.compile_model(model)
+                self.assertIsInstance(scorer, ai_guard.GenericScorer)
+                self.assertIs(scorer.model, model)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,12 +4,14 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 import joblib
+import sys
 
 DATASET = "dataset.csv"
 MODEL_PATH = "model.joblib"
 
-def train():
-    df = pd.read_csv(DATASET)
+def train(dataset=DATASET):
+    # also accepts the output of extract_features.py (with a label column)
+    df = pd.read_csv(dataset)
 
     # Features must match the ones you compute in app.py (compute_features_for_ip)
     X = df[["total_attempts", "failed_attempts", "success_rate", "unique_usernames", "min_delta"]]
@@ -37,4 +39,4 @@ def train():
     print(f"Model saved to {MODEL_PATH}")
 
 if __name__ == "__main__":
-    train()
+    train(sys.argv[1] if len(sys.argv) > 1 else DATASET)